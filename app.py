@@ -3,19 +3,30 @@ import os
 import json
 import gspread
 import base64
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, send_file
+import bisect
+import fcntl
+import hashlib
+import hmac
+import math
+import tempfile
+import time
+import threading
+import numpy as np
+from collections import Counter, deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, render_template, request, redirect, url_for, session, send_file, make_response, g, has_request_context
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request as GoogleAuthRequest
+import requests
+from requests.adapters import HTTPAdapter
+from gspread.utils import absolute_range_name, fill_gaps, numericise_all, rowcol_to_a1
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from google import genai
 from google.genai import types
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from io import BytesIO
+from reports import REPORT_PERIOD_NAMES, iter_orders_csv, iter_orders_xlsx, render_orders_report
 
 # --- CONFIGURATION ---
 app = Flask(__name__)
@@ -25,9 +36,11 @@ app.secret_key = os.environ.get("FLASK_SECRET_KEY", "a_default_secret_key_for_de
 # Sheet Configuration (Get the ID from your Google Sheet URL)
 SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID", "1JBhFtZmw7bNMbJdBnINvAXacokwRwvNFKrm_wz9bYRI") 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+DAILY_SUMMARY_HEADERS = ['Date', 'Orders', 'Revenue', 'Pending', 'Delivered', 'Undeliverable', 'Items', 'RolledUpAt']
 
 # Global variables for Google Sheets client and worksheets
 sheets_client = None
+spreadsheet = None
 student_sheet = None
 staff_sheet = None
 menu_sheet = None
@@ -35,11 +48,153 @@ orders_sheet = None
 teacher_sheet = None
 feedback_sheet = None
 user_health_sheet = None
+daily_summary_sheet = None
+
+# --- SHEETS HTTP SESSION ---
+# One keep-alive connection pool per worker for every Sheets call (sized for the
+# concurrent fetch threads), explicit connect/read timeouts, and a background
+# thread that renews the OAuth token before it expires so no user request has
+# to wait for a token refresh.
+SHEETS_POOL_SIZE = int(os.environ.get("SHEETS_POOL_SIZE", "10"))
+SHEETS_CONNECT_TIMEOUT = float(os.environ.get("SHEETS_CONNECT_TIMEOUT", "5"))
+SHEETS_READ_TIMEOUT = float(os.environ.get("SHEETS_READ_TIMEOUT", "30"))
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", "600"))
+TOKEN_REFRESH_RETRY = 30
+
+sheets_credentials = None
+_token_refresher_pid = None
+_token_refresher_lock = threading.Lock()
+
+def build_sheets_session(creds):
+    """Authorized requests session with a connection pool sized for concurrent Sheets calls."""
+    session = AuthorizedSession(creds, refresh_timeout=SHEETS_READ_TIMEOUT)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=SHEETS_POOL_SIZE)
+    session.mount('https://', adapter)
+    return session
+
+def _seconds_until_token_refresh(creds):
+    if not creds.token or not creds.expiry:
+        return 0
+    expires_in = (creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+    return max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+
+def _refresh_token_loop():
+    token_request = GoogleAuthRequest(session=requests.Session())
+    while True:
+        creds = sheets_credentials
+        if creds is None:
+            time.sleep(TOKEN_REFRESH_RETRY)
+            continue
+        delay = _seconds_until_token_refresh(creds)
+        if delay > 0:
+            time.sleep(min(delay, 60))  # re-check regularly in case the credentials were replaced
+            continue
+        try:
+            creds.refresh(token_request)
+            print(f"✓ Refreshed Sheets access token (expires {creds.expiry} UTC)")
+        except Exception as e:
+            print(f"Warning: Background token refresh failed: {e}")
+            time.sleep(TOKEN_REFRESH_RETRY)
+
+def start_token_refresher():
+    """Starts the background token refresh thread once per process (threads don't survive fork)."""
+    global _token_refresher_pid
+    with _token_refresher_lock:
+        if _token_refresher_pid == os.getpid():
+            return
+        _token_refresher_pid = os.getpid()
+    threading.Thread(target=_refresh_token_loop, name='sheets-token-refresh', daemon=True).start()
+
+# --- SHEETS CIRCUIT BREAKER ---
+# Every Sheets API call goes through the breaker. After BREAKER_FAILURE_THRESHOLD
+# consecutive failures (errors, 429/5xx responses, or calls slower than
+# BREAKER_SLOW_CALL_SECONDS) it opens and calls fail immediately, so the snapshot
+# cache serves its last good copy instead of workers waiting out timeouts. After
+# BREAKER_OPEN_SECONDS one probe call is let through (half-open) to test recovery.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "10"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+
+_breaker_lock = threading.Lock()
+_breaker = {
+    'state': 'closed',
+    'consecutiveFailures': 0,
+    'openedAt': 0.0,
+    'probeInFlight': False,
+    'trips': 0,
+    'rejectedCalls': 0,
+    'lastError': '',
+}
+
+class SheetsUnavailable(Exception):
+    """Raised instead of calling Sheets while the circuit breaker is open."""
+
+def breaker_before_call():
+    """Lets a call through, or raises SheetsUnavailable while the breaker is open."""
+    with _breaker_lock:
+        if _breaker['state'] == 'closed':
+            return
+        if _breaker['state'] == 'open' and time.time() - _breaker['openedAt'] >= BREAKER_OPEN_SECONDS:
+            _breaker['state'] = 'half_open'
+        if _breaker['state'] == 'half_open' and not _breaker['probeInFlight']:
+            _breaker['probeInFlight'] = True
+            return
+        _breaker['rejectedCalls'] += 1
+        retry_in = max(BREAKER_OPEN_SECONDS - (time.time() - _breaker['openedAt']), 0)
+    raise SheetsUnavailable(f"Google Sheets circuit is open (retry in {retry_in:.0f}s)")
+
+def breaker_record(success, duration, error=None):
+    """Feeds a call's outcome into the breaker, opening or closing it as needed."""
+    if success and duration > BREAKER_SLOW_CALL_SECONDS:
+        success, error = False, f"slow call ({duration:.1f}s)"
+    with _breaker_lock:
+        was_probe = _breaker['probeInFlight']
+        _breaker['probeInFlight'] = False
+        if success:
+            if _breaker['state'] != 'closed':
+                print("✓ Google Sheets circuit closed again")
+            _breaker['state'] = 'closed'
+            _breaker['consecutiveFailures'] = 0
+            return
+        _breaker['consecutiveFailures'] += 1
+        _breaker['lastError'] = str(error)[:200]
+        if was_probe or (_breaker['state'] == 'closed' and _breaker['consecutiveFailures'] >= BREAKER_FAILURE_THRESHOLD):
+            if _breaker['state'] == 'closed':
+                _breaker['trips'] += 1
+            _breaker['state'] = 'open'
+            _breaker['openedAt'] = time.time()
+            print(f"⚠️ Google Sheets circuit opened after {_breaker['consecutiveFailures']} failures: {_breaker['lastError']}")
+
+def get_circuit_breaker_state():
+    """Current breaker state and counters for this worker."""
+    with _breaker_lock:
+        state = dict(_breaker)
+    state['openedAt'] = datetime.fromtimestamp(state['openedAt']).strftime('%Y-%m-%d %H:%M:%S') if state['openedAt'] else None
+    return state
+
+class CircuitBreakerHTTPClient(gspread.http_client.HTTPClient):
+    """gspread HTTP client that routes every request through the circuit breaker."""
+
+    def request(self, *args, **kwargs):
+        breaker_before_call()
+        started = time.monotonic()
+        try:
+            response = super().request(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status_code = e.response.status_code
+            # Client errors (bad range, missing sheet) say nothing about Sheets' health
+            breaker_record(status_code < 500 and status_code != 429, time.monotonic() - started, e)
+            raise
+        except Exception as e:
+            breaker_record(False, time.monotonic() - started, e)
+            raise
+        breaker_record(True, time.monotonic() - started)
+        return response
 
 # --- INITIALIZATION FUNCTION (CRITICAL CHANGE) ---
 def initialize_sheets_client():
     """Initializes and authenticates the gspread client using the JSON credentials file."""
-    global sheets_client, student_sheet, staff_sheet, menu_sheet, orders_sheet, teacher_sheet, feedback_sheet, user_health_sheet
+    global sheets_client, sheets_credentials, spreadsheet, student_sheet, staff_sheet, menu_sheet, orders_sheet, teacher_sheet, feedback_sheet, user_health_sheet, daily_summary_sheet
     try:
         import signal
         
@@ -65,7 +220,10 @@ def initialize_sheets_client():
                 scopes=SCOPES
             )
         
-        sheets_client = gspread.authorize(creds)
+        sheets_credentials = creds
+        sheets_client = gspread.authorize(None, http_client=CircuitBreakerHTTPClient, session=build_sheets_session(creds))
+        sheets_client.set_timeout((SHEETS_CONNECT_TIMEOUT, SHEETS_READ_TIMEOUT))
+        start_token_refresher()
         print("✓ Authentication successful")
 
         # Open the main spreadsheet using the ID from environment variables
@@ -168,6 +326,19 @@ def initialize_sheets_client():
                 print(f"  ⚠️ Could not create UserHealth sheet: {e}")
                 user_health_sheet = None
 
+        # Try to get daily summary sheet, create if doesn't exist
+        try:
+            daily_summary_sheet = spreadsheet.worksheet("DailySummary")
+            print("  ✓ DailySummary sheet loaded")
+        except:
+            try:
+                daily_summary_sheet = spreadsheet.add_worksheet(title="DailySummary", rows=400, cols=len(DAILY_SUMMARY_HEADERS))
+                daily_summary_sheet.append_row(DAILY_SUMMARY_HEADERS, value_input_option='USER_ENTERED')  # type: ignore
+                print("  ✓ DailySummary sheet created")
+            except Exception as e:
+                print(f"  ⚠️ Could not create DailySummary sheet: {e}")
+                daily_summary_sheet = None
+
         # Check if critical sheets are loaded
         if not all([student_sheet, staff_sheet, menu_sheet, orders_sheet]):
             print("⚠️ WARNING: Some critical sheets failed to load")
@@ -193,11 +364,310 @@ def initialize_sheets_client():
         traceback.print_exc()
         return False
 
-# Call initialization once at the start
-if not initialize_sheets_client():
+# Call initialization once at the start - except in report render processes: under
+# `python app.py` those re-import this file as __mp_main__ (see _get_report_pool),
+# and they only need reports.py, not Sheets connections or token refreshers
+if __name__ == '__mp_main__':
+    pass
+elif not initialize_sheets_client():
     print("Application startup FAILED: Could not connect to Google Sheets. Check logs.")
     # In a production app, you might raise an error or exit here
 
+# --- DATA VERSION STAMPS ---
+# Each write bumps a small stamp file so every gunicorn worker on this host agrees
+# on when a user's data last changed, without asking Google Sheets.
+DATA_VERSION_DIR = os.environ.get("DATA_VERSION_DIR", os.path.join(tempfile.gettempdir(), "canteen_data_versions"))
+
+def _data_version_path(key):
+    safe_key = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(key))
+    return os.path.join(DATA_VERSION_DIR, safe_key)
+
+def get_data_version(key):
+    """Returns the current version stamp for a data key ('0' if it was never written)."""
+    try:
+        with open(_data_version_path(key)) as f:
+            return f.read().strip() or '0'
+    except OSError:
+        return '0'
+
+def bump_data_version(*keys):
+    """Marks data keys as changed so cached responses and ETags built on them go stale.
+
+    Returns the new stamp, which callers can use to cache what they just wrote.
+    """
+    stamp = f"{time.time_ns():x}.{os.getpid():x}"
+    for key in keys:
+        try:
+            os.makedirs(DATA_VERSION_DIR, exist_ok=True)
+            path = _data_version_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(stamp)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not bump data version for '{key}': {e}")
+    return stamp
+
+def user_data_key(user_id):
+    """Version key for everything that belongs to one user (orders, points, BMI)."""
+    return f"user_{str(user_id).strip()}"
+
+def user_data_etag(endpoint, user_id, *extra):
+    """Builds a weak ETag from the user's data version plus any extra inputs of the endpoint."""
+    parts = [endpoint, str(user_id).strip(), get_data_version(user_data_key(user_id)), get_data_version('all_users'), *extra]
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:24]
+
+def conditional_response(etag, build_payload):
+    """Returns 304 if the client already holds `etag`, otherwise builds and tags the payload."""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        payload, status = build_payload()
+        response = make_response(payload, status)
+        if status != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# --- SHEET SNAPSHOT CACHE ---
+# Raw get_all_values() snapshots per worksheet, reused until that sheet's version
+# stamp changes (our own writes) or the TTL passes (edits made directly in Sheets).
+# Past the TTL an unchanged snapshot is still served while a background refresh
+# runs, and if Sheets is failing the last good copy keeps being served until it
+# is SHEET_CACHE_MAX_STALENESS old. Responses carry the age in X-Data-Age.
+SHEET_CACHE_TTL = int(os.environ.get("SHEET_CACHE_TTL", "120"))
+SHEET_CACHE_MAX_STALENESS = int(os.environ.get("SHEET_CACHE_MAX_STALENESS", "1800"))
+_sheet_cache_lock = threading.Lock()
+_sheet_cache = {}
+_sheet_refreshing = set()
+
+def get_worksheet(name):
+    """Maps a data version key to its worksheet handle."""
+    return {
+        'students': student_sheet,
+        'staff': staff_sheet,
+        'menu': menu_sheet,
+        'orders': orders_sheet,
+        'teachers': teacher_sheet,
+        'feedback': feedback_sheet,
+        'userhealth': user_health_sheet,
+        'dailysummary': daily_summary_sheet,
+    }.get(name)
+
+def _note_data_age(fetched_at):
+    """Records how old the data behind the current response is (the oldest snapshot used)."""
+    if has_request_context():
+        g.data_age = max(g.get('data_age', 0), time.time() - fetched_at)
+
+def refresh_sheet_in_background(name):
+    """Re-reads a sheet on the fetch pool unless a refresh for it is already running."""
+    with _sheet_cache_lock:
+        if name in _sheet_refreshing:
+            return
+        _sheet_refreshing.add(name)
+
+    def refresh():
+        try:
+            version = get_data_version(name)
+            store_sheet_rows(name, get_worksheet(name).get_all_values(), version)
+        except Exception as e:
+            print(f"Warning: Background refresh of '{name}' sheet failed: {e}")
+        finally:
+            with _sheet_cache_lock:
+                _sheet_refreshing.discard(name)
+
+    _get_sheet_fetch_pool().submit(refresh)
+
+def _cached_sheet_rows(name, version):
+    """Returns the cached rows for a sheet if they can be served, else None.
+
+    Rows past the TTL are still returned (with a background refresh started) as long
+    as no write has changed the sheet's version since they were read.
+    """
+    with _sheet_cache_lock:
+        entry = _sheet_cache.get(name)
+    if not entry or entry['version'] != version:
+        return None
+    age = time.time() - entry['fetched_at']
+    if age >= SHEET_CACHE_MAX_STALENESS:
+        return None
+    if age >= SHEET_CACHE_TTL:
+        refresh_sheet_in_background(name)
+    _note_data_age(entry['fetched_at'])
+    return entry['rows']
+
+def _last_good_sheet_rows(name, error):
+    """Falls back to the last snapshot of a sheet when reading it failed, within the hard age limit."""
+    with _sheet_cache_lock:
+        entry = _sheet_cache.get(name)
+    if entry and time.time() - entry['fetched_at'] < SHEET_CACHE_MAX_STALENESS:
+        print(f"Warning: Reading '{name}' sheet failed ({error}); serving snapshot from {int(time.time() - entry['fetched_at'])}s ago")
+        _note_data_age(entry['fetched_at'])
+        return entry['rows']
+    return None
+
+def get_sheet_rows(name):
+    """Returns all values (header row first) of a worksheet from the snapshot cache."""
+    version = get_data_version(name)
+    rows = _cached_sheet_rows(name, version)
+    if rows is not None:
+        return rows
+
+    sheet = get_worksheet(name)
+    if sheet is None:
+        return []
+    try:
+        rows = sheet.get_all_values()
+    except Exception as e:
+        rows = _last_good_sheet_rows(name, e)
+        if rows is None:
+            raise
+        return rows
+    store_sheet_rows(name, rows, version)
+    _note_data_age(time.time())
+    return rows
+
+def store_sheet_rows(name, rows, version=None):
+    """Puts rows into the snapshot cache under the given version stamp (default: the current one).
+
+    After our own writes, pass the stamp returned by bump_data_version() so a write
+    from another worker in the meantime still invalidates the entry.
+    """
+    with _sheet_cache_lock:
+        _sheet_cache[name] = {'version': version or get_data_version(name), 'fetched_at': time.time(), 'rows': rows}
+
+def cache_written_row(name, rows, row_num, values, version):
+    """Caches a copy of rows with one row we just wrote (or appended) at row_num."""
+    if values is None:
+        return
+    cache_written_rows(name, rows, row_num, [values], version)
+
+def cache_written_rows(name, rows, first_row, values_list, version):
+    """Caches a copy of rows with consecutive rows we just wrote, starting at first_row."""
+    if not first_row or not rows:
+        return
+    if first_row > len(rows) + 1:
+        # Someone else appended rows our copy hasn't seen; blank padding would hide
+        # them under our newer stamp, so drop the entry and let the next read fetch them
+        with _sheet_cache_lock:
+            _sheet_cache.pop(name, None)
+        return
+    updated = list(rows)
+    last_row = first_row + len(values_list) - 1
+    while len(updated) < last_row:
+        updated.append([''] * len(rows[0]))
+    for offset, values in enumerate(values_list):
+        updated[first_row - 1 + offset] = [str(v) for v in values]
+    store_sheet_rows(name, updated, version)
+
+def batch_get_sheet_rows(*names):
+    """Refreshes the stale snapshots among these sheets with one values:batchGet request.
+
+    Returns {name: rows}. Falls back to per-sheet reads when there is at most one
+    stale sheet or no spreadsheet handle.
+    """
+    versions = {name: get_data_version(name) for name in names}
+    results = {}
+    stale = []
+    for name in names:
+        rows = _cached_sheet_rows(name, versions[name])
+        if rows is not None:
+            results[name] = rows
+        elif get_worksheet(name) is None:
+            results[name] = []
+        else:
+            stale.append(name)
+
+    if len(stale) <= 1 or spreadsheet is None:
+        for name in stale:
+            results[name] = get_sheet_rows(name)
+        return results
+
+    ranges = [absolute_range_name(get_worksheet(name).title) for name in stale]
+    try:
+        response = spreadsheet.values_batch_get(ranges)
+    except Exception as e:
+        # Let each sheet fall back to its own read (and last good snapshot)
+        print(f"Warning: Batched read of {stale} failed: {e}")
+        for name in stale:
+            results[name] = get_sheet_rows(name)
+        return results
+    _note_data_age(time.time())
+    for name, value_range in zip(stale, response.get('valueRanges', [])):
+        # Same shape as worksheet.get_all_values(): rectangular, [[]] when empty
+        rows = fill_gaps(value_range.get('values', []))
+        store_sheet_rows(name, rows, versions[name])
+        results[name] = rows
+    return results
+
+# Independent worksheet reads in one request run on a shared thread pool, so a page
+# waits for the slowest sheet instead of the sum of all of them. Created lazily so
+# each gunicorn worker gets its own threads after forking.
+SHEET_FETCH_WORKERS = int(os.environ.get("SHEET_FETCH_WORKERS", "6"))
+_sheet_fetch_pool = None
+_sheet_fetch_pool_lock = threading.Lock()
+
+def _get_sheet_fetch_pool():
+    global _sheet_fetch_pool
+    with _sheet_fetch_pool_lock:
+        if _sheet_fetch_pool is None:
+            _sheet_fetch_pool = ThreadPoolExecutor(max_workers=SHEET_FETCH_WORKERS, thread_name_prefix='sheet-fetch')
+        return _sheet_fetch_pool
+
+def run_concurrently(calls):
+    """Runs {key: callable} side by side; returns {key: result}, with a raised exception as the result on failure."""
+    if len(calls) <= 1:
+        futures = None
+    else:
+        pool = _get_sheet_fetch_pool()
+        futures = {key: pool.submit(call) for key, call in calls.items()}
+    results = {}
+    for key, call in calls.items():
+        try:
+            results[key] = futures[key].result() if futures else call()
+        except Exception as e:
+            results[key] = e
+    return results
+
+def prefetch_sheet_rows(*names):
+    """Loads the stale snapshots among these sheets concurrently, leaving fresh ones alone."""
+    results = run_concurrently({name: (lambda name=name: get_sheet_rows(name)) for name in names})
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"Warning: Could not prefetch '{name}' sheet: {result}")
+    return results
+
+@app.after_request
+def add_data_age_header(response):
+    """Marks responses built from cached sheet data with that data's age in seconds."""
+    age = g.get('data_age')
+    if age is not None:
+        response.headers['X-Data-Age'] = str(int(age))
+        if age >= SHEET_CACHE_TTL:
+            response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+def records_from_rows(rows):
+    """Turns raw rows into get_all_records()-style dicts, numericising values the same way."""
+    if not rows:
+        return []
+    headers = rows[0]
+    return [dict(zip(headers, numericise_all(list(row) + [''] * (len(headers) - len(row)))))
+            for row in rows[1:]]
+
+def get_sheet_records(name):
+    """Cached equivalent of worksheet.get_all_records()."""
+    return records_from_rows(get_sheet_rows(name))
+
+def appended_row_number(response):
+    """Extracts the row number from an append_row() API response, if present."""
+    try:
+        updated_range = response['updates']['updatedRange']
+        return int(''.join(c for c in updated_range.split('!')[-1].split(':')[0] if c.isdigit()))
+    except (KeyError, TypeError, ValueError):
+        return None
+
 # --- HELPER FUNCTIONS ---
 
 def parse_email_to_admission_id(email):
@@ -213,26 +683,11 @@ def parse_email_to_admission_id(email):
         print(f"Error parsing email: {e}")
         return None
 
-def get_next_user_id(sheet):
-    """Generates the next sequential user ID based on existing records."""
-    try:
-        if sheet is None:
-            return "1"
-        data = sheet.get_all_records()
-        if data:
-            # Assuming 'userId' is the key in the records
-            last_id = max(int(row.get('userId', 0)) for row in data if row.get('userId'))
-            return str(last_id + 1)
-        return "1"
-    except Exception as e:
-        print(f"Error getting next user ID: {e}")
-        return "1" # Default if sheet is empty or inaccessible
-
 def get_student_by_id(user_id):
     """Fetches student details by userId - uses cached records to avoid slow API calls."""
     try:
-        # Use get_all_records() which already fetches everything at once (more efficient than find())
-        all_students = student_sheet.get_all_records()
+        # Served from the sheet snapshot cache, refreshed when Students changes
+        all_students = get_sheet_records('students')
         
         if not all_students:
             print("No student records found")
@@ -267,8 +722,8 @@ def get_student_by_id(user_id):
 def get_staff_by_id(staff_id):
     """Fetches staff details by staffId (or admissionId) - uses cached records to avoid API calls."""
     try:
-        # Use get_all_records() which already fetches everything at once
-        all_staff = staff_sheet.get_all_records()
+        # Served from the sheet snapshot cache, refreshed when Staff changes
+        all_staff = get_sheet_records('staff')
         print(f"Total staff records: {len(all_staff)}")
         
         if not all_staff:
@@ -301,13 +756,16 @@ def get_staff_by_id(staff_id):
         traceback.print_exc()
         return None
 
-def calculate_health_points(items_ordered, menu_data):
-    """Calculate health points based on nutritious food choices.
+HEALTH_TIER_POINTS = {'high': 10, 'medium': 5, 'low': 2, 'treat': 0}
+
+def estimate_health_tier(item_name, benefits):
+    """Classifies a menu item into a health tier from its name and benefits text.
     
-    Assigns points based on food health value:
-    - High nutrition foods (fruits, veggies, whole grains, lean protein): 10 points
-    - Medium nutrition foods: 5 points
-    - Low nutrition foods: 0-2 points
+    Tiers map to health points (see HEALTH_TIER_POINTS):
+    - high: fruits, veggies, whole grains, lean protein (10 points)
+    - medium: energy/refreshing items (5 points)
+    - low: everything else (2 points)
+    - treat: fried food, sweets, soda (0 points)
     """
     nutritious_keywords = ['fruit', 'salad', 'vegetable', 'grain', 'protein', 'yogurt', 
                           'nuts', 'beans', 'lentils', 'spinach', 'broccoli', 'carrot',
@@ -315,94 +773,119 @@ def calculate_health_points(items_ordered, menu_data):
     
     unhealthy_keywords = ['fried', 'candy', 'soda', 'donut', 'pastry', 'burger', 'fries']
     
+    item_name = str(item_name).lower()
+    benefits = str(benefits).lower()
+    
+    if any(keyword in item_name for keyword in unhealthy_keywords):
+        return 'treat'
+    if any(keyword in item_name for keyword in nutritious_keywords):
+        return 'high'
+    if any(keyword in benefits for keyword in ['healthy', 'nutrition', 'vitamin', 'fiber', 'protein']):
+        return 'high'
+    if 'energy' in benefits or 'refreshing' in benefits:
+        return 'medium'
+    return 'low'
+
+def estimate_item_calories(item_name, benefits):
+    """Estimates calories for one serving of a menu item from its name and benefits text."""
+    item_name = str(item_name).lower()
+    benefits = str(benefits).lower()
+    if 'fruit' in benefits or 'salad' in benefits:
+        return 150
+    elif 'pizza' in item_name:
+        return 300
+    elif 'burger' in item_name:
+        return 250
+    elif 'roll' in item_name:
+        return 200
+    elif 'juice' in benefits or 'drink' in benefits:
+        return 120
+    elif 'chai' in item_name or 'coffee' in item_name:
+        return 80
+    return 150  # Default estimate
+
+def estimate_item_nutrition(item_name, benefits):
+    """Heuristic starting values for a menu item's nutrition columns (staff can edit them later)."""
+    text = f"{item_name} {benefits}".lower()
+    protein_rich = any(k in text for k in ['protein', 'paneer', 'chicken', 'tofu', 'beans', 'lentil', 'dal', 'chole', 'egg'])
+    fiber_rich = any(k in text for k in ['fiber', 'fruit', 'salad', 'vegetable', 'veg', 'grain', 'sprout'])
+    return {
+        'calories': estimate_item_calories(item_name, benefits),
+        'protein': 10 if protein_rich else 4,
+        'fiber': 5 if fiber_rich else 2,
+        'healthTier': estimate_health_tier(item_name, benefits),
+    }
+
+def calculate_health_points(items_ordered):
+    """Calculate health points for ordered items from the menu's health tiers.
+    
+    Items that are not on the menu are classified from their name alone.
+    """
+    nutrition_by_name = get_menu_nutrition_lookup()
     total_points = 0
     
     for item_str in items_ordered:
-        item_name = item_str.split(' x ')[0].lower()
-        
-        # Check if item matches any nutritious keywords
-        is_nutritious = any(keyword in item_name for keyword in nutritious_keywords)
-        is_unhealthy = any(keyword in item_name for keyword in unhealthy_keywords)
-        
-        if is_unhealthy:
-            points = 0
-        elif is_nutritious:
-            points = 10
-        else:
-            # Find in menu data for description
-            matching_item = next((m for m in menu_data if m.get('ItemName', '').lower() == item_name), None)
-            if matching_item:
-                benefits = str(matching_item.get('Benefits', '')).lower()
-                if any(keyword in benefits for keyword in ['healthy', 'nutrition', 'vitamin', 'fiber', 'protein']):
-                    points = 10
-                elif 'energy' in benefits or 'refreshing' in benefits:
-                    points = 5
-                else:
-                    points = 2
-            else:
-                points = 2
-        
-        total_points += points
+        item_name = item_str.split(' x ')[0].strip().lower()
+        nutrition = nutrition_by_name.get(item_name) or estimate_item_nutrition(item_name, '')
+        total_points += HEALTH_TIER_POINTS.get(nutrition['healthTier'], 2)
     
     return total_points
 
 def get_user_nutrition_points(user_id):
-    """Fetch user's nutrition points from database."""
+    """Fetch user's nutrition points from the cached user profile."""
     try:
         if user_health_sheet is None:
             print(f"Warning: user_health_sheet is None, returning 0 points for user {user_id}")
             return 0
         
-        # Use a global cache or session cache if possible to avoid frequent API calls
-        # For now, let's at least handle the quota error gracefully
-        try:
-            all_records = user_health_sheet.get_all_records()
-            user_record = next((r for r in all_records if str(r.get('UserId', '')).strip() == str(user_id).strip()), None)
-            if user_record:
-                points = int(user_record.get('NutritionPoints', 0))
-                print(f"✓ Fetched {points} nutrition points for user {user_id}")
-                return points
-        except Exception as e:
-            if "Quota exceeded" in str(e):
-                print(f"Quota exceeded while fetching nutrition points for {user_id}. Returning 0.")
-                return 0
-            raise e
+        # Read failures propagate: reporting 0 here would let callers save over the real total
+        profile = get_user_profile(user_id)
+        if profile['healthRow']:
+            points = profile['nutritionPoints']
+            print(f"✓ Fetched {points} nutrition points for user {user_id}")
+            return points
             
         print(f"No nutrition record found for user {user_id}, returning 0")
         return 0
     except Exception as e:
         print(f"Error fetching nutrition points for user {user_id}: {e}")
-        return 0
+        raise
 
 def get_all_nutrition_points():
     """Fetch all nutrition points at once to save quota."""
     try:
         if user_health_sheet is None:
             return {}
-        all_records = user_health_sheet.get_all_records()
-        return {str(r.get('UserId', '')).strip(): int(r.get('NutritionPoints', 0)) for r in all_records if r.get('UserId')}
+        all_records = get_sheet_records('userhealth')
+        return {str(r.get('UserId', '')).strip(): int(r.get('NutritionPoints') or 0) for r in all_records if r.get('UserId')}
     except Exception as e:
         print(f"Error fetching all nutrition points: {e}")
-        return {}
+        raise
 
 def get_user_health_data(user_id):
-    """Fetch user's BMI, height, and weight from database."""
+    """Fetch user's BMI, height, and weight from the cached user profile."""
     try:
         if user_health_sheet is None:
             return None
         
-        all_records = user_health_sheet.get_all_records()
-        user_record = next((r for r in all_records if str(r.get('UserId', '')).strip() == str(user_id).strip()), None)
-        if user_record:
-            bmi = user_record.get('BMI', '')
-            height = user_record.get('Height', '')
-            weight = user_record.get('Weight', '')
-            return {'bmi': bmi, 'height': height, 'weight': weight}
+        profile = get_user_profile(user_id)
+        if profile['healthRow']:
+            return {'bmi': profile['bmi'], 'height': profile['height'], 'weight': profile['weight']}
         return None
     except Exception as e:
         print(f"Error fetching health data for user {user_id}: {e}")
         return None
 
+def _health_row_with(rows, row_num, changes):
+    """Copy of a UserHealth snapshot row with {column_number: value} applied, or None if not cached."""
+    if not rows or row_num > len(rows):
+        return None
+    row = list(rows[row_num - 1])
+    row.extend([''] * (max(changes) - len(row)))
+    for col, value in changes.items():
+        row[col - 1] = value
+    return row
+
 def save_user_health_data(user_id, height, bmi, weight=''):
     """Save user's height, BMI, and weight to database."""
     try:
@@ -410,32 +893,39 @@ def save_user_health_data(user_id, height, bmi, weight=''):
             print(f"Error: user_health_sheet is None, cannot save health data for user {user_id}")
             return False
         
-        all_records = user_health_sheet.get_all_records()
-        user_idx = next((i for i, r in enumerate(all_records) if str(r.get('UserId', '')).strip() == str(user_id).strip()), None)
+        profile = get_user_profile(user_id)
+        row_num = profile['healthRow']
+        health_rows = get_sheet_rows('userhealth')  # the snapshot the profile was just built from
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        if user_idx is not None:
+        if row_num:
             # Update existing record
-            row_num = user_idx + 2  # +2 because of header and 1-indexing
             user_health_sheet.update_cell(row_num, 5, bmi)  # Column 5 = BMI
             user_health_sheet.update_cell(row_num, 6, height)  # Column 6 = Height
             user_health_sheet.update_cell(row_num, 7, weight)  # Column 7 = Weight
-            user_health_sheet.update_cell(row_num, 4, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))  # LastUpdated
+            user_health_sheet.update_cell(row_num, 4, updated_at)  # LastUpdated
+            new_row = _health_row_with(health_rows, row_num, {5: bmi, 6: height, 7: weight, 4: updated_at})
             print(f"✓ Updated health data for user {user_id}: Height={height}, Weight={weight}, BMI={bmi}")
         else:
             # Create new record
-            student_record = get_student_by_id(user_id)
-            username = student_record.get('name', 'Student') if student_record else 'Student'
-            user_health_sheet.append_row([
+            username = profile['name'] or 'Student'
+            new_row = [
                 user_id, 
                 username, 
                 0, 
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                updated_at,
                 bmi,
                 height,
                 weight
-            ], value_input_option='USER_ENTERED')  # type: ignore
+            ]
+            response = user_health_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
+            row_num = appended_row_number(response)
             print(f"✓ Created new health record for user {user_id}: Height={height}, Weight={weight}, BMI={bmi}")
         
+        version = bump_data_version(user_data_key(user_id), 'userhealth')
+        cache_written_row('userhealth', health_rows, row_num, new_row, version)
+        cached_bmi, cached_height, cached_weight = numericise_all([bmi, height, weight])
+        update_cached_profile(user_id, healthRow=row_num, bmi=cached_bmi, height=cached_height, weight=cached_weight)
         return True
     except Exception as e:
         print(f"Error saving health data for user {user_id}: {e}")
@@ -450,29 +940,35 @@ def save_user_nutrition_points(user_id, points):
             print(f"Error: user_health_sheet is None, cannot save nutrition points for user {user_id}")
             return False
         
-        all_records = user_health_sheet.get_all_records()
-        user_idx = next((i for i, r in enumerate(all_records) if str(r.get('UserId', '')).strip() == str(user_id).strip()), None)
+        profile = get_user_profile(user_id)
+        row_num = profile['healthRow']
+        health_rows = get_sheet_rows('userhealth')  # the snapshot the profile was just built from
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        if user_idx is not None:
+        if row_num:
             # Update existing record
-            row_num = user_idx + 2  # +2 because of header and 1-indexing
             print(f"Updating row {row_num} with nutrition points: {points}")
             user_health_sheet.update_cell(row_num, 3, points)  # Column 3 = NutritionPoints
-            user_health_sheet.update_cell(row_num, 4, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))  # LastUpdated
+            user_health_sheet.update_cell(row_num, 4, updated_at)  # LastUpdated
+            new_row = _health_row_with(health_rows, row_num, {3: points, 4: updated_at})
         else:
             # Create new record
-            student_record = get_student_by_id(user_id)
-            username = student_record.get('name', 'Student') if student_record else 'Student'
+            username = profile['name'] or 'Student'
             print(f"Creating new nutrition record for user {user_id} ({username}) with {points} points")
-            user_health_sheet.append_row([
+            new_row = [
                 user_id, 
                 username, 
                 points, 
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                updated_at,
                 '',  # BMI
                 ''   # Height
-            ], value_input_option='USER_ENTERED')  # type: ignore
+            ]
+            response = user_health_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
+            row_num = appended_row_number(response)
         
+        version = bump_data_version(user_data_key(user_id), 'userhealth')
+        cache_written_row('userhealth', health_rows, row_num, new_row, version)
+        update_cached_profile(user_id, healthRow=row_num, nutritionPoints=int(points))
         print(f"✓ Saved {points} nutrition points for user {user_id}")
         return True
     except Exception as e:
@@ -484,8 +980,8 @@ def save_user_nutrition_points(user_id, points):
 def get_teacher_by_staff_id(staff_id):
     """Fetches teacher details by StaffID - uses cached records to avoid API calls."""
     try:
-        # Use get_all_records() instead of multiple find() calls
-        all_teachers = teacher_sheet.get_all_records()
+        # Served from the sheet snapshot cache, refreshed when Teachers changes
+        all_teachers = get_sheet_records('teachers')
         
         if not all_teachers:
             print(f"No teacher records found")
@@ -512,6 +1008,1640 @@ def get_teacher_by_staff_id(staff_id):
         traceback.print_exc()
         return None
 
+# --- USER PROFILE CACHE ---
+# One merged view of a user's Students row and UserHealth row, so the health
+# dashboard endpoints share a single lookup instead of each scanning UserHealth.
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", "300"))
+_profile_cache_lock = threading.Lock()
+_profile_cache = {}
+
+def _find_sheet_row(rows, id_headers, user_id, ignore_case=False):
+    """Returns (row_number, record) for the row whose id column matches user_id, or (None, None)."""
+    if not rows:
+        return None, None
+    headers = rows[0]
+    normalized = [str(h).strip().lower().replace(' ', '') for h in headers]
+    id_col = next((normalized.index(h) for h in id_headers if h in normalized), None)
+    if id_col is None:
+        return None, None
+    fold = (lambda value: value.lower()) if ignore_case else (lambda value: value)
+    user_id = fold(user_id)
+    for row_num, row in enumerate(rows[1:], start=2):
+        if id_col < len(row) and fold(str(row[id_col]).strip()) == user_id:
+            return row_num, records_from_rows([headers, row])[0]
+    return None, None
+
+def load_user_profile(user_id):
+    """Builds a user's profile from the Students and UserHealth snapshots."""
+    user_id = str(user_id).strip()
+    student_row, student = _find_sheet_row(get_sheet_rows('students'), ['userid'], user_id)
+    health_row, health = _find_sheet_row(get_sheet_rows('userhealth'), ['userid'], user_id)
+    student = student or {}
+    health = health or {}
+    try:
+        points = int(health.get('NutritionPoints') or 0)
+    except (TypeError, ValueError):
+        points = 0
+    return {
+        'userId': user_id,
+        'name': student.get('name') or student.get('Name') or health.get('Username') or '',
+        'className': student.get('className') or student.get('Class') or '',
+        'admissionId': student.get('admissionId') or student.get('Admission ID') or '',
+        'email': student.get('email') or student.get('Email') or '',
+        'student': student or None,
+        'studentRow': student_row,
+        'healthRow': health_row,
+        'nutritionPoints': points,
+        'bmi': health.get('BMI', ''),
+        'height': health.get('Height', ''),
+        'weight': health.get('Weight', ''),
+    }
+
+def _profile_version(user_id):
+    return (get_data_version(user_data_key(user_id)), get_data_version('all_users'))
+
+def get_user_profile(user_id):
+    """Returns the cached profile for a user, rebuilding it only after their data changes."""
+    user_id = str(user_id).strip()
+    version = _profile_version(user_id)
+    with _profile_cache_lock:
+        entry = _profile_cache.get(user_id)
+    if entry and entry['version'] == version and time.time() - entry['built_at'] < PROFILE_CACHE_TTL:
+        return entry['profile']
+
+    profile = load_user_profile(user_id)
+    with _profile_cache_lock:
+        _profile_cache[user_id] = {'version': version, 'built_at': time.time(), 'profile': profile}
+    return profile
+
+def update_cached_profile(user_id, **changes):
+    """Applies a write we just made to the cached profile so the next read needs no fetch.
+
+    Call after bump_data_version(); if a field can't be known (e.g. an unparsed
+    appended row number) the entry is dropped and rebuilt on next use instead.
+    """
+    user_id = str(user_id).strip()
+    with _profile_cache_lock:
+        entry = _profile_cache.get(user_id)
+        if not entry or any(value is None for value in changes.values()):
+            _profile_cache.pop(user_id, None)
+            return
+        _profile_cache[user_id] = {
+            'version': _profile_version(user_id),
+            'built_at': entry['built_at'],
+            'profile': dict(entry['profile'], **changes),
+        }
+
+# --- SESSION PROFILE ---
+# The signed-in user's directory fields (name, class, admission ID, sheet row),
+# kept in the session from login so student_info and order placement don't
+# download the Students/Teachers sheet on every request. Stamped with the
+# user's profile version so a change made from any session triggers a reload.
+
+def profile_data_key(user_id):
+    """Version key bumped whenever a user's directory row (name, class, ...) changes."""
+    return f"profile_{user_id}"
+
+def _session_profile_version(user_id):
+    return f"{get_data_version(profile_data_key(user_id))}/{get_data_version('all_users')}"
+
+def build_session_profile(user_id, name, class_name, admission_id='', email='', row=None):
+    """Returns the session profile dict for the given directory values."""
+    user_id = str(user_id).strip()
+    return {
+        'userId': user_id,
+        'name': name or '',
+        'className': class_name or '',
+        'admissionId': admission_id or '',
+        'email': email or '',
+        'row': row,
+        'version': _session_profile_version(user_id),
+    }
+
+def load_session_profile(user_id, user_type):
+    """Builds a session profile from the cached Students or Teachers snapshot, or None if not found."""
+    user_id = str(user_id).strip()
+    if user_type == 'teacher':
+        row, record = _find_sheet_row(get_sheet_rows('teachers'), ['staffid'], user_id, ignore_case=True)
+        if record is None:
+            return None
+        return build_session_profile(user_id, record.get('Name', ''), 'Teacher',
+                                     email=record.get('Email', ''), row=row)
+    if user_type == 'student':
+        row, record = _find_sheet_row(get_sheet_rows('students'), ['userid'], user_id)
+        if record is None:
+            return None
+        return build_session_profile(
+            user_id,
+            record.get('name') or record.get('Name'),
+            record.get('className') or record.get('Class'),
+            admission_id=record.get('admissionId') or record.get('Admission ID'),
+            email=record.get('email') or record.get('Email'),
+            row=row,
+        )
+    return None
+
+def get_session_profile():
+    """Returns the signed-in user's profile from the session, reloading it only after it changes."""
+    user_id = str(session.get('user_id', '')).strip()
+    profile = session.get('profile')
+    if profile and profile.get('userId') == user_id and profile.get('version') == _session_profile_version(user_id):
+        return profile
+
+    profile = load_session_profile(user_id, session.get('user_type'))
+    if profile is None:
+        session.pop('profile', None)
+    else:
+        session['profile'] = profile
+    return profile
+
+# --- CREDENTIAL SERVICE ---
+# Password hashes indexed by login ID per role, rebuilt only when the underlying
+# sheet snapshot changes. Verifications share a small pool of slots so a burst of
+# logins can't tie up every worker with scrypt/pbkdf2 work, and hashes made with
+# older methods (or legacy plaintext rows) are upgraded on the next good login.
+# Spell out every cost parameter (e.g. "scrypt:32768:8:1", "pbkdf2:sha256:600000")
+# so stored hashes can be matched against it by prefix.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+CREDENTIAL_VERIFY_SLOTS = int(os.environ.get("CREDENTIAL_VERIFY_SLOTS", "2"))
+CREDENTIAL_VERIFY_TIMEOUT = float(os.environ.get("CREDENTIAL_VERIFY_TIMEOUT", "5"))
+CREDENTIAL_SOURCES = {
+    # role: (sheet key, id headers, password header, case-insensitive ids)
+    'student': ('students', ['userid'], 'password', False),
+    'teacher': ('teachers', ['staffid'], 'password', True),
+    'staff': ('staff', ['staffid'], 'password', True),
+}
+# Fixed passwords that take precedence over the sheet (admin account sync)
+STAFF_PASSWORD_OVERRIDES = {'s.18.20@slps.one': 'Pass@0001'}
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:', 'bcrypt')
+# Only staff rows were ever stored (and accepted) as plain text
+PLAINTEXT_CREDENTIAL_ROLES = ('staff',)
+
+_credential_slots = threading.BoundedSemaphore(CREDENTIAL_VERIFY_SLOTS)
+_credential_lock = threading.Lock()
+_credential_tables = {}
+
+class CredentialServiceBusy(Exception):
+    """Raised when no verification slot frees up within CREDENTIAL_VERIFY_TIMEOUT."""
+
+class CredentialSourceUnavailable(CredentialServiceBusy):
+    """Raised when a role's sheet can't be read (Sheets down, breaker open, not initialized).
+
+    Logins answer it with the same 503 as a busy service, and it never counts as a failed login.
+    """
+
+def hash_password(password):
+    """Hashes a password with the standard method used for every stored credential."""
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def _normalize_login_id(role, login_id):
+    login_id = str(login_id).strip()
+    return login_id.lower() if CREDENTIAL_SOURCES[role][3] else login_id
+
+def get_credential_table(role):
+    """Returns {login_id: {'row', 'hash'}} plus the password column for a role's sheet."""
+    sheet_key, id_headers, password_header, _ = CREDENTIAL_SOURCES[role]
+    rows = get_sheet_rows(sheet_key)
+    with _credential_lock:
+        table = _credential_tables.get(role)
+        if table and table['rows'] is rows:
+            return table
+
+    index = {}
+    password_col = None
+    if rows:
+        normalized = [str(h).strip().lower().replace(' ', '') for h in rows[0]]
+        id_col = next((normalized.index(h) for h in id_headers if h in normalized), None)
+        password_col = normalized.index(password_header) if password_header in normalized else None
+        if id_col is not None and password_col is not None:
+            for row_num, row in enumerate(rows[1:], start=2):
+                if id_col < len(row) and str(row[id_col]).strip():
+                    login_id = _normalize_login_id(role, row[id_col])
+                    # First row wins, matching the record lookups
+                    index.setdefault(login_id, {
+                        'row': row_num,
+                        'hash': str(row[password_col]) if password_col < len(row) else '',
+                    })
+    table = {'rows': rows, 'index': index, 'password_col': password_col}
+    with _credential_lock:
+        _credential_tables[role] = table
+    return table
+
+def login_id_exists(role, login_id):
+    """True if the ID is in the role's sheet; raises CredentialSourceUnavailable if the sheet can't be read."""
+    sheet_key = CREDENTIAL_SOURCES[role][0]
+    if get_worksheet(sheet_key) is None:
+        raise CredentialSourceUnavailable(f"{sheet_key} sheet not initialized")
+    try:
+        table = get_credential_table(role)
+    except Exception as e:
+        raise CredentialSourceUnavailable(f"Could not read the {sheet_key} sheet: {e}") from e
+    if not table['rows']:
+        raise CredentialSourceUnavailable(f"The {sheet_key} sheet came back empty")
+    return _normalize_login_id(role, login_id) in table['index']
+
+def lookup_login_record(role, login_id, lookup):
+    """Returns lookup(login_id), or None only when the ID really isn't in the sheet.
+
+    The record lookups return None on any error, so a miss is confirmed against the
+    credential table before it may count as an unknown ID.
+    """
+    record = lookup(login_id)
+    if record is None and login_id_exists(role, login_id):
+        raise CredentialSourceUnavailable(f"{role} record lookup failed")
+    return record
+
+def needs_rehash(stored_password):
+    """True when a stored credential wasn't produced by PASSWORD_HASH_METHOD."""
+    return not stored_password.startswith(PASSWORD_HASH_METHOD + '$')
+
+def _upgrade_credential(role, table, entry, new_hash):
+    """Writes a legacy credential's new standard hash, keeping the snapshot cache current."""
+    sheet_key = CREDENTIAL_SOURCES[role][0]
+    sheet = get_worksheet(sheet_key)
+    if sheet is None or table['password_col'] is None:
+        return
+    try:
+        sheet.update_cell(entry['row'], table['password_col'] + 1, new_hash)
+        version = bump_data_version(sheet_key)
+        rows = [list(row) for row in table['rows']]
+        row = rows[entry['row'] - 1]
+        row.extend([''] * (table['password_col'] + 1 - len(row)))
+        row[table['password_col']] = new_hash
+        store_sheet_rows(sheet_key, rows, version)
+        print(f"✓ Upgraded {role} credential in row {entry['row']} to {PASSWORD_HASH_METHOD}")
+    except Exception as e:
+        print(f"Warning: Could not upgrade {role} credential in row {entry['row']}: {e}")
+
+def verify_credentials(role, login_id, password):
+    """Checks a login against the credential table. Raises CredentialServiceBusy when saturated."""
+    if not password:
+        return False
+    if role == 'staff':
+        override = STAFF_PASSWORD_OVERRIDES.get(_normalize_login_id(role, login_id))
+        if override is not None:
+            return hmac.compare_digest(override.encode(), str(password).encode())
+
+    table = get_credential_table(role)
+    entry = table['index'].get(_normalize_login_id(role, login_id))
+    if not entry or not entry['hash']:
+        return False
+    stored_password = entry['hash']
+
+    if not stored_password.startswith(HASH_PREFIXES):
+        # Plain text comparison (for legacy/development staff rows)
+        if role not in PLAINTEXT_CREDENTIAL_ROLES:
+            return False
+        if not hmac.compare_digest(stored_password.encode(), str(password).encode()):
+            return False
+    else:
+        if not _credential_slots.acquire(timeout=CREDENTIAL_VERIFY_TIMEOUT):
+            raise CredentialServiceBusy(f"No credential verification slot free after {CREDENTIAL_VERIFY_TIMEOUT}s")
+        try:
+            if not check_password_hash(stored_password, password):
+                return False
+        finally:
+            _credential_slots.release()
+
+    if needs_rehash(stored_password):
+        # Hash inside a slot (CPU), but write to Sheets (network) after giving it back
+        new_hash = None
+        if _credential_slots.acquire(blocking=False):
+            try:
+                new_hash = hash_password(password)
+            finally:
+                _credential_slots.release()
+        if new_hash:
+            _upgrade_credential(role, table, entry, new_hash)
+    return True
+
+# --- LOGIN THROTTLING ---
+# Sliding-window failure counts per login ID (password guessing) and per client IP
+# (ID probing - only failures against IDs that don't exist count there, so a school
+# behind one NAT address isn't locked out by students' typos), plus a short-lived
+# cache of IDs known not to exist, so repeated bad logins are turned away before
+# any sheet lookup or password hashing. State is per worker process.
+LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", "300"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", "30"))
+LOGIN_MAX_FAILURES_PER_ID = int(os.environ.get("LOGIN_MAX_FAILURES_PER_ID", "5"))
+UNKNOWN_ID_CACHE_TTL = int(os.environ.get("UNKNOWN_ID_CACHE_TTL", "60"))
+LOGIN_TRACKING_LIMIT = 10000  # prune expired entries once this many keys are tracked
+
+_login_lock = threading.Lock()
+_login_failures = {}
+_unknown_login_ids = {}
+_login_stats = {'attempts': 0, 'successes': 0, 'failures': 0, 'throttled': 0, 'unknownIdHits': 0}
+
+def login_client_ip():
+    """The client address as seen by the nearest proxy (last X-Forwarded-For hop)."""
+    route = request.access_route
+    return route[-1] if route else (request.remote_addr or 'unknown')
+
+def _login_keys(role, login_id):
+    return ('ip', login_client_ip()), ('id', role, _normalize_login_id(role, login_id))
+
+def _recent_failures(key, now):
+    """Drops failures older than the window and returns the remaining deque (caller holds the lock)."""
+    failures = _login_failures.get(key)
+    if failures is None:
+        return None
+    while failures and failures[0] <= now - LOGIN_WINDOW_SECONDS:
+        failures.popleft()
+    if not failures:
+        del _login_failures[key]
+        return None
+    return failures
+
+def _prune_login_tracking(now):
+    if len(_login_failures) > LOGIN_TRACKING_LIMIT:
+        for key in list(_login_failures):
+            _recent_failures(key, now)
+    if len(_unknown_login_ids) > LOGIN_TRACKING_LIMIT:
+        for key, entry in list(_unknown_login_ids.items()):
+            if entry['expires'] <= now:
+                del _unknown_login_ids[key]
+
+def login_retry_after(role, login_id):
+    """Counts a login attempt; returns seconds to wait if the client or ID is over its limit, else 0."""
+    now = time.time()
+    ip_key, id_key = _login_keys(role, login_id)
+    with _login_lock:
+        _login_stats['attempts'] += 1
+        retry_after = 0
+        for key, limit in ((ip_key, LOGIN_MAX_FAILURES_PER_IP), (id_key, LOGIN_MAX_FAILURES_PER_ID)):
+            failures = _recent_failures(key, now)
+            if failures and len(failures) >= limit:
+                retry_after = max(retry_after, int(failures[len(failures) - limit] + LOGIN_WINDOW_SECONDS - now) + 1)
+        if retry_after:
+            _login_stats['throttled'] += 1
+        return retry_after
+
+def is_unknown_login_id(role, login_id):
+    """True if this ID was recently looked up and not found, and its sheet hasn't changed since."""
+    key = (role, _normalize_login_id(role, login_id))
+    version = get_data_version(CREDENTIAL_SOURCES[role][0])
+    with _login_lock:
+        entry = _unknown_login_ids.get(key)
+        if entry and entry['version'] == version and entry['expires'] > time.time():
+            _login_stats['unknownIdHits'] += 1
+            return True
+        return False
+
+def record_login_result(role, login_id, success, found=True):
+    """Updates the failure windows and unknown-ID cache after a login attempt."""
+    now = time.time()
+    ip_key, id_key = _login_keys(role, login_id)
+    with _login_lock:
+        if success:
+            _login_stats['successes'] += 1
+            _login_failures.pop(id_key, None)
+            return
+        _login_stats['failures'] += 1
+        _login_failures.setdefault(id_key, deque()).append(now)
+        if not found:
+            _login_failures.setdefault(ip_key, deque()).append(now)
+            _unknown_login_ids[(role, id_key[2])] = {
+                'version': get_data_version(CREDENTIAL_SOURCES[role][0]),
+                'expires': now + UNKNOWN_ID_CACHE_TTL,
+            }
+        _prune_login_tracking(now)
+
+def throttled_login_response(retry_after, is_json):
+    """429 response with a Retry-After header for a throttled login."""
+    if is_json:
+        response = make_response({'success': False, 'message': 'Too many failed attempts - please try again later'}, 429)
+    else:
+        response = make_response("Login failed: Too many failed attempts. Please try again later.", 429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def get_login_throttle_stats():
+    """Counters for this worker's login throttling."""
+    with _login_lock:
+        return dict(_login_stats, trackedKeys=len(_login_failures), cachedUnknownIds=len(_unknown_login_ids))
+
+# --- REGISTRATION SERVICE ---
+# User IDs come from a sequence file shared by the workers (seeded once from the
+# Students sheet), and existing rows are found through an index built from the
+# cached snapshot, so registering costs a single Sheets write.
+USER_ID_SEQUENCE_PATH = os.environ.get("USER_ID_SEQUENCE_PATH", os.path.join(DATA_VERSION_DIR, "user_id_sequence"))
+_student_index_lock = threading.Lock()
+_student_index = {'rows': None, 'index': {}}
+
+def get_student_row_index():
+    """Returns {userId: row_number} for the Students sheet, rebuilt when its snapshot changes."""
+    rows = get_sheet_rows('students')
+    with _student_index_lock:
+        if _student_index['rows'] is rows:
+            return _student_index['index']
+
+    index = {}
+    if rows:
+        normalized = [str(h).strip().lower().replace(' ', '') for h in rows[0]]
+        if 'userid' in normalized:
+            id_col = normalized.index('userid')
+            for row_num, row in enumerate(rows[1:], start=2):
+                if id_col < len(row) and str(row[id_col]).strip():
+                    index.setdefault(str(row[id_col]).strip(), row_num)
+    with _student_index_lock:
+        _student_index['rows'] = rows
+        _student_index['index'] = index
+    return index
+
+def _highest_student_id():
+    ids = [int(user_id) for user_id in get_student_row_index() if user_id.isdigit()]
+    return max(ids, default=0)
+
+def next_sequence_value(path, seed, taken):
+    """Advances the integer sequence stored at path under an exclusive file lock.
+
+    seed() supplies the last used value when the file doesn't exist yet; values in
+    taken() are skipped. Returns the new value as a string.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            current = f.read().strip()
+            last_value = int(current) if current.isdigit() else seed()
+            existing = taken()
+            next_value = last_value + 1
+            while str(next_value) in existing:
+                next_value += 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(next_value))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return str(next_value)
+
+def allocate_user_id():
+    """Hands out the next user ID from the persistent sequence (safe across workers)."""
+    return next_sequence_value(USER_ID_SEQUENCE_PATH, _highest_student_id, get_student_row_index)
+
+def upsert_student(user_id, values):
+    """Writes a student's row [admissionId, userId, name, password, email, className] in place or appends it.
+
+    Returns the sheet row number, or None if an append didn't report it.
+    """
+    user_id = str(user_id).strip()
+    values = [str(v) for v in values]
+    rows = get_sheet_rows('students')
+    row_num = get_student_row_index().get(user_id)
+
+    if row_num:
+        student_sheet.update(f'A{row_num}:{rowcol_to_a1(row_num, len(values))}', [values],
+                             value_input_option='USER_ENTERED')
+    else:
+        response = student_sheet.append_row(values, value_input_option='USER_ENTERED')  # type: ignore
+        row_num = appended_row_number(response)
+    version = bump_data_version('students', user_data_key(user_id), profile_data_key(user_id))
+
+    # Keep the snapshot current so the next lookup doesn't re-download the sheet
+    cache_written_row('students', rows, row_num, values, version)
+    return row_num
+
+# --- ORDER JOURNAL ---
+# Lunch-rush intake (ORDER_INTAKE_MODE=journal): place_order appends each order to
+# a local append-only journal (fsync'd) and answers immediately; a background
+# flusher in each worker drains the journal to the Orders sheet in batches, then
+# awards the health points. A checkpoint file records how far the journal has been
+# flushed, so unflushed orders are replayed after a restart; rows whose orderId is
+# already in the sheet are skipped, so a replay never duplicates an order. After a
+# failed append (which may still have landed) the IDs are read live from the sheet,
+# not from the snapshot. Awarded health points are marked in the journal, so a
+# replay awards the points of orders that landed but were never credited.
+ORDER_INTAKE_MODE = os.environ.get("ORDER_INTAKE_MODE", "direct")
+ORDER_JOURNAL_DIR = os.environ.get("ORDER_JOURNAL_DIR", os.path.join(tempfile.gettempdir(), "canteen_order_journal"))
+ORDER_JOURNAL_FLUSH_INTERVAL = float(os.environ.get("ORDER_JOURNAL_FLUSH_INTERVAL", "1"))
+ORDER_JOURNAL_BATCH_SIZE = int(os.environ.get("ORDER_JOURNAL_BATCH_SIZE", "200"))
+ORDER_JOURNAL_RETRY_SECONDS = 5
+ORDER_JOURNAL_COMPACT_BYTES = 1024 * 1024
+ORDER_ID_SEQUENCE_PATH = os.path.join(ORDER_JOURNAL_DIR, "order_id_sequence")
+
+_order_flusher_pid = None
+_order_flusher_lock = threading.Lock()
+_order_flush_wakeup = threading.Event()
+
+def _journal_path(name):
+    return os.path.join(ORDER_JOURNAL_DIR, name)
+
+def _order_ids_in_sheet():
+    return {str(row[0]).strip() for row in get_sheet_rows('orders')[1:] if row and str(row[0]).strip()}
+
+def _live_order_ids():
+    """Order IDs straight from the sheet - for when the snapshot may miss rows we wrote."""
+    return {str(value).strip() for value in orders_sheet.col_values(1)[1:] if str(value).strip()}  # type: ignore
+
+def _highest_order_id():
+    ids = [int(order_id) for order_id in _order_ids_in_sheet() if order_id.isdigit()]
+    return max(ids, default=0)
+
+def allocate_order_id():
+    """Hands out the next order ID without waiting for the Orders sheet (safe across workers)."""
+    return next_sequence_value(ORDER_ID_SEQUENCE_PATH, _highest_order_id, _order_ids_in_sheet)
+
+def award_health_points(user_id, health_points):
+    """Adds an order's health points to the user's stored total."""
+    if health_points > 0 or user_health_sheet is not None:
+        current_points = get_user_nutrition_points(user_id)
+        print(f"Current nutrition points for user {user_id}: {current_points}")
+        
+        new_total = current_points + health_points
+        saved = save_user_nutrition_points(user_id, new_total)
+        print(f"✓ Saved nutrition points: {health_points} points. Current total: {new_total}. Save result: {saved}")
+
+def _append_journal_lines(lines):
+    os.makedirs(ORDER_JOURNAL_DIR, exist_ok=True)
+    with open(_journal_path('orders.jsonl'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(''.join(json.dumps(line) + '\n' for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def journal_order(order_id, user_id, order_row, health_points):
+    """Durably records an order for the flusher; returns once it is on disk."""
+    _append_journal_lines([{'orderId': order_id, 'userId': user_id, 'row': order_row, 'healthPoints': health_points}])
+    ensure_order_flusher()
+    _order_flush_wakeup.set()
+
+def _read_journal_offset():
+    try:
+        with open(_journal_path('orders.offset')) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def _write_journal_offset(offset):
+    path = _journal_path('orders.offset')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _compact_order_journal(offset):
+    """Empties the journal once everything in it has been flushed and it has grown large."""
+    with open(_journal_path('orders.jsonl'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_size == offset:
+                _write_journal_offset(0)
+                f.truncate(0)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _flush_journal_batch():
+    """Writes the next batch of unflushed journal entries; returns how many entries were consumed."""
+    offset = _read_journal_offset()
+    try:
+        with open(_journal_path('orders.jsonl'), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if offset > size:
+                offset = 0  # journal was compacted after the checkpoint; orderIds dedupe the replay
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return 0
+
+    entries = []
+    awarded = set()
+    consumed = 0
+    lines = data.split(b'\n')[:-1]  # only complete lines
+    for line in lines:
+        if len(entries) >= ORDER_JOURNAL_BATCH_SIZE:
+            break
+        consumed += len(line) + 1
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            print(f"Warning: Skipping unreadable order journal entry: {line[:100]!r}")
+            continue
+        if 'awarded' not in entry:
+            entries.append(entry)
+    if not consumed:
+        return 0
+    # Award markers are appended after their orders, possibly past this batch
+    for line in lines:
+        if line.startswith(b'{"awarded"'):
+            try:
+                awarded.add(str(json.loads(line)['awarded']))
+            except (ValueError, KeyError):
+                pass
+
+    append_failed_path = _journal_path('append.failed')
+    if os.path.exists(append_failed_path):
+        existing = _live_order_ids()
+    else:
+        existing = _order_ids_in_sheet()
+    fresh = [entry for entry in entries if str(entry['orderId']) not in existing]
+    if fresh:
+        orders_rows = get_sheet_rows('orders')
+        order_rows = [entry['row'] for entry in fresh]
+        try:
+            response = orders_sheet.append_rows(order_rows, value_input_option='USER_ENTERED')  # type: ignore
+        except Exception:
+            # The rows may have landed anyway: make the retry check the sheet itself
+            open(append_failed_path, 'a').close()
+            bump_data_version('orders')
+            raise
+        version = bump_data_version('orders', *{user_data_key(entry['userId']) for entry in fresh})
+        cache_written_rows('orders', orders_rows, appended_row_number(response), order_rows, version)
+        print(f"✓ Flushed {len(fresh)} journaled orders to the Orders sheet")
+    if os.path.exists(append_failed_path):
+        os.remove(append_failed_path)
+
+    # Orders written by an earlier, failed flush are skipped above but still owed their points
+    for entry in entries:
+        if str(entry['orderId']) in awarded:
+            continue
+        try:
+            award_health_points(entry['userId'], entry['healthPoints'])
+            _append_journal_lines([{'awarded': str(entry['orderId'])}])
+        except Exception as e:
+            print(f"Warning: Could not award health points for order {entry['orderId']}: {e}")
+
+    _write_journal_offset(offset + consumed)
+    if offset + consumed >= ORDER_JOURNAL_COMPACT_BYTES:
+        _compact_order_journal(offset + consumed)
+    return len(entries)
+
+def flush_order_journal():
+    """Drains the journal to the Orders sheet unless another worker is already doing so."""
+    if orders_sheet is None:
+        return 0
+    os.makedirs(ORDER_JOURNAL_DIR, exist_ok=True)
+    with open(_journal_path('flush.lock'), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        try:
+            flushed = 0
+            while True:
+                consumed = _flush_journal_batch()
+                flushed += consumed
+                if consumed < ORDER_JOURNAL_BATCH_SIZE:
+                    return flushed
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _order_flush_loop():
+    while True:
+        _order_flush_wakeup.wait(ORDER_JOURNAL_FLUSH_INTERVAL)
+        _order_flush_wakeup.clear()
+        try:
+            flush_order_journal()
+        except Exception as e:
+            # Entries stay in the journal and are retried
+            print(f"Warning: Order journal flush failed: {e}")
+            time.sleep(ORDER_JOURNAL_RETRY_SECONDS)
+
+def ensure_order_flusher():
+    """Starts this process's journal flusher thread (which also replays leftovers from before a restart)."""
+    global _order_flusher_pid
+    with _order_flusher_lock:
+        if _order_flusher_pid == os.getpid():
+            return
+        _order_flusher_pid = os.getpid()
+    threading.Thread(target=_order_flush_loop, name='order-journal-flush', daemon=True).start()
+
+@app.before_request
+def start_order_flusher():
+    ensure_order_flusher()
+
+def get_order_journal_state():
+    """Intake mode and how much of the journal is still waiting to be flushed."""
+    try:
+        size = os.path.getsize(_journal_path('orders.jsonl'))
+    except OSError:
+        size = 0
+    return {'mode': ORDER_INTAKE_MODE, 'pendingBytes': max(size - _read_journal_offset(), 0)}
+
+# --- MENU CACHE ---
+# Menu records plus their structured nutrition columns, parsed once per Menu version.
+# Missing nutrition cells are filled once from the heuristics and written back so
+# staff can correct them in the sheet or through /api/menu/update.
+MENU_NUTRITION_COLUMNS = {'calories': 'Calories', 'protein': 'Protein', 'fiber': 'Fiber', 'healthTier': 'HealthTier'}
+_menu_cache_lock = threading.Lock()
+_menu_cache = {'rows': None, 'items': [], 'nutrition': {}}
+
+def menu_item_name(item):
+    """Returns a menu record's item name whatever its header spelling."""
+    return str(item.get('ItemName') or item.get('name') or item.get('Item Name') or item.get('itemName') or '').strip()
+
+def menu_item_benefits(item):
+    """Returns a menu record's benefits text whatever its header spelling."""
+    return str(item.get('Benefits') or item.get('benefits') or item.get('description') or '').strip()
+
+def backfill_menu_nutrition(rows):
+    """Fills blank nutrition columns of the Menu rows from heuristics and writes them back once.
+
+    Returns the filled rows, or the same rows object if nothing was missing.
+    """
+    headers = list(rows[0])
+    normalized = [str(h).strip().lower() for h in headers]
+    nutrition_cols = {}
+    changed_cols = set()
+    for field, header in MENU_NUTRITION_COLUMNS.items():
+        if header.lower() in normalized:
+            nutrition_cols[field] = normalized.index(header.lower())
+        else:
+            headers.append(header)
+            nutrition_cols[field] = len(headers) - 1
+            changed_cols.add(nutrition_cols[field])
+
+    filled = [headers] + [list(row) + [''] * (len(headers) - len(row)) for row in rows[1:]]
+    for row in filled[1:]:
+        record = dict(zip(headers, row))
+        name = menu_item_name(record)
+        if not name:
+            continue
+        estimate = None
+        for field, col in nutrition_cols.items():
+            if str(row[col]).strip() == '':
+                estimate = estimate or estimate_item_nutrition(name, menu_item_benefits(record))
+                row[col] = str(estimate[field])
+                changed_cols.add(col)
+
+    if not changed_cols:
+        return rows
+
+    try:
+        if menu_sheet.col_count < len(headers):
+            menu_sheet.add_cols(len(headers) - menu_sheet.col_count)
+        menu_sheet.batch_update([
+            {
+                'range': f"{rowcol_to_a1(1, col + 1)}:{rowcol_to_a1(len(filled), col + 1)}",
+                'values': [[row[col]] for row in filled],
+            }
+            for col in sorted(changed_cols)
+        ], value_input_option='USER_ENTERED')
+        version = bump_data_version('menu')
+        store_sheet_rows('menu', filled, version)
+        print(f"✓ Filled nutrition columns for {len(filled) - 1} menu items")
+    except Exception as e:
+        # Keep serving the estimates from memory; the next rebuild will try again
+        print(f"⚠️ Could not write menu nutrition columns: {e}")
+    return filled
+
+def _nutrition_from_record(item):
+    """Reads the structured nutrition columns of a menu record, estimating any unreadable value."""
+    estimate = estimate_item_nutrition(menu_item_name(item), menu_item_benefits(item))
+    nutrition = {}
+    for field in ('calories', 'protein', 'fiber'):
+        try:
+            nutrition[field] = round(float(item.get(MENU_NUTRITION_COLUMNS[field])), 1)
+        except (TypeError, ValueError):
+            nutrition[field] = estimate[field]
+    nutrition['calories'] = int(nutrition['calories'])
+    tier = str(item.get(MENU_NUTRITION_COLUMNS['healthTier'], '')).strip().lower()
+    nutrition['healthTier'] = tier if tier in HEALTH_TIER_POINTS else estimate['healthTier']
+    return nutrition
+
+def get_menu_items():
+    """Returns menu records (get_all_records() style, nutrition columns included) from the menu cache."""
+    rows = get_sheet_rows('menu')
+    with _menu_cache_lock:
+        if rows is _menu_cache['rows']:
+            return _menu_cache['items']
+
+    filled = backfill_menu_nutrition(rows) if len(rows) > 1 else rows
+    items = records_from_rows(filled)
+    nutrition = {}
+    for item in items:
+        name = menu_item_name(item).lower()
+        if name:
+            nutrition[name] = _nutrition_from_record(item)
+
+    with _menu_cache_lock:
+        _menu_cache.update(rows=rows, items=items, nutrition=nutrition)
+    return items
+
+def get_menu_nutrition_lookup():
+    """Maps lower-cased item names to their {calories, protein, fiber, healthTier}."""
+    get_menu_items()
+    with _menu_cache_lock:
+        return _menu_cache['nutrition']
+
+# --- CLASS NUTRITION ANALYTICS ---
+# Loads Students, UserHealth and Orders once into NumPy columns and computes
+# per-class distributions with bincount-style group-bys instead of per-student reads.
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL", "300"))
+BMI_BAND_LABELS = ['Underweight', 'Normal', 'Overweight', 'Obese']
+BMI_BAND_EDGES = [18.5, 25, 30]
+
+_analytics_lock = threading.Lock()
+_analytics_cache = {'key': None, 'built_at': 0.0, 'report': None}
+
+def _header_index(headers, *names):
+    """Finds a column index by any accepted header spelling (ignores case and spaces)."""
+    normalized = [str(h).strip().lower().replace(' ', '') for h in headers]
+    for name in names:
+        key = name.lower().replace(' ', '')
+        if key in normalized:
+            return normalized.index(key)
+    return None
+
+def _column_values(rows, idx, default=''):
+    """Pulls one column out of raw sheet rows as stripped strings."""
+    if idx is None:
+        return [default] * len(rows)
+    return [str(row[idx]).strip() if idx < len(row) else default for row in rows]
+
+def _to_float_array(values):
+    """Converts sheet strings to a float array; blanks and junk become NaN."""
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(str(value).replace('₹', '').replace(',', ''))
+        except ValueError:
+            pass
+    return result
+
+def load_nutrition_columns():
+    """Reads Students, UserHealth and Orders once and returns them as NumPy column arrays."""
+    student_rows = get_sheet_rows('students')
+    health_rows = get_sheet_rows('userhealth')
+    order_rows = get_sheet_rows('orders')
+
+    # Students: one entry per student, class labels encoded as integer codes
+    headers, rows = (student_rows[0], student_rows[1:]) if student_rows else ([], [])
+    student_ids = _column_values(rows, _header_index(headers, 'userId', 'User ID'))
+    class_names = [c or 'Unassigned' for c in _column_values(rows, _header_index(headers, 'className', 'Class'))]
+    classes, student_class = np.unique(np.array(class_names, dtype=str), return_inverse=True)
+    student_pos = {uid: i for i, uid in enumerate(student_ids) if uid}
+
+    # UserHealth: scatter points and BMI onto the student axis
+    headers, rows = (health_rows[0], health_rows[1:]) if health_rows else ([], [])
+    health_student = np.array([student_pos.get(uid, -1) for uid in _column_values(rows, _header_index(headers, 'UserId'))], dtype=np.int64)
+    health_points = np.nan_to_num(_to_float_array(_column_values(rows, _header_index(headers, 'NutritionPoints'))))
+    health_bmi = _to_float_array(_column_values(rows, _header_index(headers, 'BMI')))
+    known = health_student >= 0
+    student_points = np.zeros(len(student_ids))
+    student_points[health_student[known]] = health_points[known]
+    student_bmi = np.full(len(student_ids), np.nan)
+    student_bmi[health_student[known]] = health_bmi[known]
+
+    # Menu: calorie and healthy flags per item name, from the menu's nutrition table
+    menu_lookup = {name: (n['calories'], n['healthTier'] == 'high') for name, n in get_menu_nutrition_lookup().items()}
+
+    # Orders: one entry per order plus an exploded per-item axis
+    headers, rows = (order_rows[0], order_rows[1:]) if order_rows else ([], [])
+    order_users = _column_values(rows, _header_index(headers, 'userId', 'User ID'))
+    order_days = [ts[:10] for ts in _column_values(rows, _header_index(headers, 'timestamp', 'Date'))]
+    order_items = _column_values(rows, _header_index(headers, 'items'))
+    order_student = np.array([student_pos.get(uid, -1) for uid in order_users], dtype=np.int64)
+    days, order_day = np.unique(np.array(order_days, dtype=str), return_inverse=True)
+
+    item_order, item_qty, item_calories, item_healthy = [], [], [], []
+    for order_idx, items_str in enumerate(order_items):
+        for part in items_str.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            name, _, qty = part.rpartition(' x ')
+            if not name:
+                name, qty = part, '1'
+            calories, healthy = menu_lookup.get(name.strip().lower(), (0, False))
+            item_order.append(order_idx)
+            item_qty.append(int(qty) if qty.strip().isdigit() else 1)
+            item_calories.append(calories)
+            item_healthy.append(healthy)
+
+    return {
+        'classes': classes,
+        'student_class': student_class.astype(np.int64),
+        'student_points': student_points,
+        'student_bmi': student_bmi,
+        'order_student': order_student,
+        'order_day': order_day.astype(np.int64),
+        'n_days': len(days),
+        'item_order': np.array(item_order, dtype=np.int64),
+        'item_qty': np.array(item_qty, dtype=np.float64),
+        'item_calories': np.array(item_calories, dtype=np.float64),
+        'item_healthy': np.array(item_healthy, dtype=bool),
+    }
+
+def _group_nutrition_stats(cols, student_group, n_groups):
+    """Computes nutrition distributions for every group of students in one vectorized pass."""
+    students = np.bincount(student_group, minlength=n_groups)
+    points = cols['student_points']
+
+    # Points distribution: sort once by (group, points) and slice per group
+    ordered = points[np.lexsort((points, student_group))]
+    point_groups = np.split(ordered, np.cumsum(students)[:-1])
+    points_sum = np.bincount(student_group, weights=points, minlength=n_groups)
+
+    # BMI bands as a (group x band) count matrix
+    bmi = cols['student_bmi']
+    has_bmi = ~np.isnan(bmi)
+    bands = np.digitize(bmi[has_bmi], BMI_BAND_EDGES)
+    band_counts = np.bincount(student_group[has_bmi] * len(BMI_BAND_LABELS) + bands,
+                              minlength=n_groups * len(BMI_BAND_LABELS)).reshape(n_groups, len(BMI_BAND_LABELS))
+
+    # Ordered items attributed to the ordering student's group
+    item_student = cols['order_student'][cols['item_order']]
+    by_student = item_student >= 0
+    item_group = student_group[item_student[by_student]]
+    qty = cols['item_qty'][by_student]
+    items_total = np.bincount(item_group, weights=qty, minlength=n_groups)
+    items_healthy = np.bincount(item_group, weights=qty * cols['item_healthy'][by_student], minlength=n_groups)
+    calories = np.bincount(item_group, weights=qty * cols['item_calories'][by_student], minlength=n_groups)
+
+    # Distinct (student, day) pairs with at least one order
+    placed = cols['order_student'] >= 0
+    pairs = np.unique(cols['order_student'][placed] * max(cols['n_days'], 1) + cols['order_day'][placed])
+    student_days = np.bincount(student_group[pairs // max(cols['n_days'], 1)], minlength=n_groups)
+
+    results = []
+    for group_idx in range(n_groups):
+        group_points = point_groups[group_idx]
+        p25, median, p75 = np.percentile(group_points, [25, 50, 75]) if len(group_points) else (0.0, 0.0, 0.0)
+        results.append({
+            'students': int(students[group_idx]),
+            'points': {
+                'total': int(points_sum[group_idx]),
+                'mean': round(float(points_sum[group_idx] / students[group_idx]), 1) if students[group_idx] else 0.0,
+                'p25': round(float(p25), 1),
+                'median': round(float(median), 1),
+                'p75': round(float(p75), 1),
+                'max': int(group_points[-1]) if len(group_points) else 0,
+            },
+            'bmiBands': {label: int(band_counts[group_idx][i]) for i, label in enumerate(BMI_BAND_LABELS)},
+            'bmiRecorded': int(band_counts[group_idx].sum()),
+            'itemsOrdered': int(items_total[group_idx]),
+            'healthyChoiceRatio': round(float(items_healthy[group_idx] / items_total[group_idx]), 3) if items_total[group_idx] else 0.0,
+            'caloriesPerDay': round(float(calories[group_idx] / student_days[group_idx]), 1) if student_days[group_idx] else 0.0,
+        })
+    return results
+
+def build_class_nutrition_report(cols):
+    """Builds the per-class and whole-school nutrition report from loaded columns."""
+    classes = cols['classes']
+    per_class = _group_nutrition_stats(cols, cols['student_class'], len(classes))
+    school = _group_nutrition_stats(cols, np.zeros(len(cols['student_class']), dtype=np.int64), 1)[0]
+    return {
+        'classes': [dict(className=str(name), **stats) for name, stats in zip(classes, per_class)],
+        'school': school,
+        'bmiBandLabels': BMI_BAND_LABELS,
+    }
+
+def get_class_nutrition_report():
+    """Returns the class nutrition report, rebuilding it only when the underlying data version changes."""
+    key = tuple(get_data_version(k) for k in ('students', 'userhealth', 'orders', 'menu', 'all_users'))
+    with _analytics_lock:
+        if (_analytics_cache['report'] is not None and _analytics_cache['key'] == key
+                and time.time() - _analytics_cache['built_at'] < ANALYTICS_CACHE_TTL):
+            return _analytics_cache['report']
+
+        started = time.time()
+        report = build_class_nutrition_report(load_nutrition_columns())
+        report['generatedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _analytics_cache.update(key=key, built_at=time.time(), report=report)
+        print(f"✓ Built class nutrition report for {len(report['classes'])} classes in {(time.time() - started) * 1000:.0f} ms")
+        return report
+
+# --- ORDER AGGREGATES ---
+# Running totals over the Orders snapshot for the kitchen and the dashboards. Our
+# own writes cache a shallow copy of the snapshot with only the written rows
+# replaced (cache_written_row), so a refresh folds in just the rows whose list
+# object changed: a placed order adds its items, a status change out of Pending
+# subtracts them. A fresh read of the sheet (another worker's write, the TTL) comes
+# with a new header row and is folded from scratch.
+# Sales figures count every order except the undeliverable ones. Every order also
+# gets an integer epoch (from the epoch column, or its timestamp parsed once) and a
+# place in a sorted (epoch, row) index, so date ranges are found by bisection.
+ORDER_QUEUE_PAGE_SIZE = 50
+SALES_WINDOW_DAYS = int(os.environ.get("SALES_WINDOW_DAYS", "30"))
+ORDER_TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M:%S', '%Y-%m-%d', '%m/%d/%Y']
+_order_aggregates_lock = threading.Lock()
+_order_aggregates = {'rows': None, 'columns': {}, 'pendingOrders': 0, 'pendingItems': Counter(),
+                     'statusCounts': Counter(), 'byStatus': {}, 'sortedQueues': {}, 'sales': None,
+                     'records': {}, 'dateIndex': []}
+
+def parse_order_items(items_str):
+    """Splits an Orders items cell ("Chai x 2, Samosa x 1") into (name, quantity) pairs."""
+    items = []
+    for part in str(items_str).split(','):
+        part = part.strip()
+        if not part or part == 'nan':
+            continue
+        name, _, qty = part.rpartition(' x ')
+        if not name:
+            name, qty = part, '1'
+        items.append((name.strip(), int(qty) if qty.strip().isdigit() else 1))
+    return items
+
+def order_columns(headers):
+    """Maps order fields to their column index in the Orders header row."""
+    return {
+        'orderId': _header_index(headers, 'orderId', 'Order ID'),
+        'timestamp': _header_index(headers, 'timestamp', 'Date'),
+        'userId': _header_index(headers, 'userId', 'User ID'),
+        'userName': _header_index(headers, 'userName', 'name'),
+        'userClass': _header_index(headers, 'userClass', 'class', 'className'),
+        'items': _header_index(headers, 'items', 'itemsJson'),
+        'totalPrice': _header_index(headers, 'totalPrice', 'total'),
+        'status': _header_index(headers, 'status'),
+        'pickupSlot': _header_index(headers, 'pickupSlot'),
+        'epoch': _header_index(headers, 'epoch'),
+    }
+
+def order_field(row, columns, field):
+    """Reads one field of a raw Orders row as a stripped string ('' if the column is missing)."""
+    idx = columns.get(field)
+    return str(row[idx]).strip() if idx is not None and idx < len(row) else ''
+
+# Older rows say "Unable" for what the dashboard now marks "undeliverable"
+ORDER_STATUS_ALIASES = {'unable': 'undeliverable'}
+
+def order_status(row, columns):
+    """Returns an order's lowercase status; blank counts as pending, as on the dashboard."""
+    status = order_field(row, columns, 'status').lower() or 'pending'
+    return ORDER_STATUS_ALIASES.get(status, status)
+
+def parse_order_timestamp(value):
+    """Converts an Orders timestamp in any of the formats we have written to epoch seconds (None if unreadable)."""
+    value = str(value).strip()
+    for fmt in ORDER_TIMESTAMP_FORMATS:
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+def day_epoch(day):
+    """Epoch seconds of local midnight at the start of a YYYY-MM-DD day."""
+    return int(datetime.strptime(day, '%Y-%m-%d').timestamp())
+
+def order_record(row, columns):
+    """Turns a raw Orders row into the order dict the dashboards use."""
+    try:
+        total_price = float(order_field(row, columns, 'totalPrice').replace('₹', '').replace(',', '') or 0)
+    except ValueError:
+        total_price = 0.0
+    return {
+        'orderId': order_field(row, columns, 'orderId'),
+        'timestamp': order_field(row, columns, 'timestamp'),
+        'userId': order_field(row, columns, 'userId'),
+        'userName': order_field(row, columns, 'userName'),
+        'userClass': order_field(row, columns, 'userClass'),
+        'items': [{'name': name, 'quantity': qty} for name, qty in parse_order_items(order_field(row, columns, 'items'))],
+        'totalPrice': total_price,
+        'status': order_status(row, columns),
+        'pickupSlot': order_field(row, columns, 'pickupSlot'),
+        'epoch': _order_epoch(row, columns),
+    }
+
+def _order_epoch(row, columns):
+    epoch = order_field(row, columns, 'epoch')
+    if epoch.isdigit():
+        return int(epoch)
+    return parse_order_timestamp(order_field(row, columns, 'timestamp'))
+
+def _new_sales_aggregates():
+    return {'orders': 0, 'revenue': 0.0, 'byDay': {}, 'byHour': {}, 'byClass': {}, 'itemQuantities': Counter(), 'itemOrders': Counter()}
+
+def _add_to_bucket(buckets, key, sign, revenue):
+    """Adds or removes one order in a {key: [orders, revenue]} bucket, dropping emptied buckets."""
+    bucket = buckets.setdefault(key, [0, 0.0])
+    bucket[0] += sign
+    bucket[1] += sign * revenue
+    if bucket[0] <= 0:
+        del buckets[key]
+
+def _fold_sales(sales, record, sign):
+    """Adds or removes one order's contribution to the sales aggregates."""
+    revenue = record['totalPrice']
+    sales['orders'] += sign
+    sales['revenue'] += sign * revenue
+    if record['epoch'] is not None:
+        hour = time.strftime('%Y-%m-%d %H', time.localtime(record['epoch']))
+        _add_to_bucket(sales['byDay'], hour[:10], sign, revenue)
+        _add_to_bucket(sales['byHour'], hour, sign, revenue)
+    _add_to_bucket(sales['byClass'], record['userClass'] or 'Unassigned', sign, revenue)
+    for item in record['items']:
+        for counter, amount in ((sales['itemQuantities'], item['quantity']), (sales['itemOrders'], 1)):
+            counter[item['name']] += sign * amount
+            if counter[item['name']] <= 0:
+                del counter[item['name']]
+
+def _fold_order_row(state, row_num, row, sign):
+    """Adds (sign=1) or removes (sign=-1) one order row's contribution to the aggregates."""
+    if not any(str(value).strip() for value in row):
+        return
+    columns = state['columns']
+    status = order_status(row, columns)
+    state['statusCounts'][status] += sign
+    if sign > 0:
+        record = order_record(row, columns)
+        state['byStatus'].setdefault(status, {})[row_num] = record
+        state['records'][row_num] = record
+        if record['epoch'] is not None:
+            bisect.insort(state['dateIndex'], (record['epoch'], row_num))
+    else:
+        record = state['byStatus'].get(status, {}).pop(row_num, None) or order_record(row, columns)
+        state['records'].pop(row_num, None)
+        if record['epoch'] is not None:
+            index = state['dateIndex']
+            pos = bisect.bisect_left(index, (record['epoch'], row_num))
+            if pos < len(index) and index[pos] == (record['epoch'], row_num):
+                del index[pos]
+    if status != 'undeliverable':
+        _fold_sales(state['sales'], record, sign)
+    if status == 'pending':
+        state['pendingOrders'] += sign
+        pending_items = state['pendingItems']
+        for name, qty in parse_order_items(order_field(row, columns, 'items')):
+            pending_items[name] += sign * qty
+            if pending_items[name] <= 0:
+                del pending_items[name]
+
+def _refresh_order_aggregates():
+    """Brings the aggregates up to date with the current Orders snapshot (call with the lock held)."""
+    rows = get_sheet_rows('orders')
+    state = _order_aggregates
+    previous = state['rows']
+    if rows is previous:
+        return state
+
+    if not previous or not rows or rows[0] is not previous[0]:
+        state.update(columns=order_columns(rows[0]) if rows else {}, pendingOrders=0, pendingItems=Counter(),
+                     statusCounts=Counter(), byStatus={}, sales=_new_sales_aggregates(), records={}, dateIndex=[])
+        for row_num, row in enumerate(rows[1:], start=2):
+            _fold_order_row(state, row_num, row, 1)
+    else:
+        for i in range(1, max(len(previous), len(rows))):
+            before = previous[i] if i < len(previous) else None
+            after = rows[i] if i < len(rows) else None
+            if before is after:
+                continue
+            if before is not None:
+                _fold_order_row(state, i + 1, before, -1)
+            if after is not None:
+                _fold_order_row(state, i + 1, after, 1)
+    state['rows'] = rows
+    state['sortedQueues'] = {}
+    return state
+
+def orders_between(start_epoch, end_epoch):
+    """Returns [(row_num, record)] for orders placed in [start_epoch, end_epoch), oldest first."""
+    with _order_aggregates_lock:
+        state = _refresh_order_aggregates()
+        index = state['dateIndex']
+        first = bisect.bisect_left(index, (start_epoch,))
+        last = bisect.bisect_left(index, (end_epoch,))
+        return [(row_num, state['records'][row_num]) for _, row_num in index[first:last]]
+
+def orders_on_days(start_day, end_day):
+    """Returns [(row_num, record)] for orders from start_day through end_day (YYYY-MM-DD, inclusive)."""
+    return orders_between(day_epoch(start_day), day_epoch(end_day) + 86400)
+
+def _order_sort_key(item):
+    row_num, record = item
+    order_id = record['orderId']
+    return (int(order_id) if order_id.isdigit() else 0, row_num)
+
+def get_order_status_summary(status='pending', page=1, page_size=ORDER_QUEUE_PAGE_SIZE):
+    """Returns the order counts per status plus one page of the orders in a status.
+
+    Pending orders come oldest first (the kitchen's queue); other statuses newest first.
+    """
+    with _order_aggregates_lock:
+        state = _refresh_order_aggregates()
+        queue = state['sortedQueues'].get(status)
+        if queue is None:
+            queue = [record for _, record in sorted(state['byStatus'].get(status, {}).items(),
+                                                    key=_order_sort_key, reverse=status != 'pending')]
+            state['sortedQueues'][status] = queue
+        counts = state['statusCounts']
+        start = (page - 1) * page_size
+        return {
+            'counts': {
+                'total': sum(counts.values()),
+                'pending': counts['pending'],
+                'delivered': counts['delivered'],
+                'undeliverable': counts['undeliverable'],
+            },
+            'status': status,
+            'orders': queue[start:start + page_size],
+            'page': page,
+            'pageSize': page_size,
+            'totalInStatus': len(queue),
+        }
+
+def _sales_entry(orders, revenue):
+    return {
+        'orders': orders,
+        'revenue': round(revenue, 2),
+        'averageOrderValue': round(revenue / orders, 2) if orders else 0.0,
+    }
+
+def get_sales_analytics(days=SALES_WINDOW_DAYS, top_items=10):
+    """Returns the maintained sales figures: all-time totals, the last `days` days by day and
+    hour, hourly throughput over that window, the most popular items and spend per class."""
+    since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    with _order_aggregates_lock:
+        sales = _refresh_order_aggregates()['sales'] or _new_sales_aggregates()
+        daily = [dict(date=day, **_sales_entry(*bucket)) for day, bucket in sorted(sales['byDay'].items()) if day >= since]
+        hourly = [dict(hour=f"{hour}:00", **_sales_entry(*bucket)) for hour, bucket in sorted(sales['byHour'].items()) if hour >= since]
+        by_class = sorted(sales['byClass'].items(), key=lambda item: -item[1][1])
+        popular = sales['itemQuantities'].most_common(top_items)
+        item_orders = dict(sales['itemOrders'])
+        totals = _sales_entry(sales['orders'], sales['revenue'])
+
+    throughput, active_days = Counter(), Counter()
+    for entry in hourly:
+        throughput[entry['hour'][11:13]] += entry['orders']
+        active_days[entry['hour'][11:13]] += 1
+    return {
+        'totals': totals,
+        'windowDays': days,
+        'daily': daily,
+        'hourly': hourly,
+        'ordersPerHourOfDay': [
+            {'hour': f"{hour}:00", 'orders': throughput[hour], 'averagePerDay': round(throughput[hour] / active_days[hour], 1)}
+            for hour in sorted(throughput)
+        ],
+        'topItems': [{'name': name, 'quantity': qty, 'orders': item_orders.get(name, 0)} for name, qty in popular],
+        'classSpend': [dict(className=name, **_sales_entry(*bucket)) for name, bucket in by_class],
+        'generatedAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def get_kitchen_prep_list():
+    """Returns how many of each menu item are still waiting in pending orders."""
+    with _order_aggregates_lock:
+        state = _refresh_order_aggregates()
+        items = sorted(state['pendingItems'].items(), key=lambda item: (-item[1], item[0].lower()))
+        return {
+            'pendingOrders': state['pendingOrders'],
+            'items': [{'name': name, 'quantity': qty} for name, qty in items],
+        }
+
+# --- PICKUP SLOTS ---
+# Optional pickup times for pre-ordering earlier in the day. Each slot takes at
+# most PICKUP_SLOT_CAPACITY orders; the day's counts live in a small file updated
+# under an exclusive lock (so every worker admits against the same numbers) and
+# each worker keeps them in memory until that day's version stamp changes.
+PICKUP_SLOTS = [slot.strip() for slot in os.environ.get("PICKUP_SLOTS", "10:30,11:00,11:30,12:00,12:30,13:00,13:30").split(',') if slot.strip()]
+PICKUP_SLOT_CAPACITY = int(os.environ.get("PICKUP_SLOT_CAPACITY", "40"))
+PICKUP_SLOT_CUTOFF_MINUTES = int(os.environ.get("PICKUP_SLOT_CUTOFF_MINUTES", "10"))
+PICKUP_SLOT_DIR = os.environ.get("PICKUP_SLOT_DIR", os.path.join(tempfile.gettempdir(), "canteen_pickup_slots"))
+
+_pickup_slot_lock = threading.Lock()
+_pickup_slot_counts = {'day': None, 'version': None, 'counts': {}}
+
+def _pickup_slot_path(day):
+    return os.path.join(PICKUP_SLOT_DIR, f"{day}.json")
+
+def _pickup_slot_key(day):
+    return f"pickup_slots_{day}"
+
+def _count_slot_orders(day):
+    """Counts the day's orders per pickup slot from the Orders snapshot."""
+    rows = get_sheet_rows('orders')
+    if not rows:
+        return {}
+    columns = order_columns(rows[0])
+    if columns['pickupSlot'] is None:
+        return {}
+    counts = Counter()
+    for row in rows[1:]:
+        slot = order_field(row, columns, 'pickupSlot')
+        if slot and order_field(row, columns, 'timestamp').startswith(day):
+            counts[slot] += 1
+    return dict(counts)
+
+def _read_slot_file(f, day):
+    """Reads a day's slot counts; a new (empty) or corrupt file is rebuilt from the Orders sheet.
+
+    An empty dict is a real answer - nobody has booked yet - so it is not rescanned.
+    """
+    f.seek(0)
+    data = f.read()
+    if not data:
+        return _count_slot_orders(day)
+    try:
+        counts = json.loads(data)
+    except json.JSONDecodeError:
+        return _count_slot_orders(day)
+    return counts if isinstance(counts, dict) else _count_slot_orders(day)
+
+def _write_slot_file(f, counts):
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps(counts))
+    f.flush()
+    os.fsync(f.fileno())
+
+def _adjust_pickup_slot(day, slot, delta, capacity=None):
+    """Changes a slot's count under the file lock; refuses (returns None) if that would pass capacity."""
+    os.makedirs(PICKUP_SLOT_DIR, exist_ok=True)
+    with open(_pickup_slot_path(day), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            counts = _read_slot_file(f, day)
+            booked = counts.get(slot, 0)
+            if capacity is not None and booked + delta > capacity:
+                return None
+            counts[slot] = max(booked + delta, 0)
+            _write_slot_file(f, counts)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    version = bump_data_version(_pickup_slot_key(day))
+    with _pickup_slot_lock:
+        _pickup_slot_counts.update(day=day, version=version, counts=counts)
+    return counts
+
+def reserve_pickup_slot(day, slot):
+    """Takes one place in a pickup slot; returns False if the slot is full."""
+    return _adjust_pickup_slot(day, slot, 1, PICKUP_SLOT_CAPACITY) is not None
+
+def release_pickup_slot(day, slot):
+    """Gives back a place taken by an order that could not be saved."""
+    try:
+        _adjust_pickup_slot(day, slot, -1)
+    except OSError as e:
+        print(f"Warning: Could not release pickup slot {slot} on {day}: {e}")
+
+def get_pickup_slot_counts(day):
+    """Returns {slot: orders} for a day from memory, re-reading the file only after a change."""
+    version = get_data_version(_pickup_slot_key(day))
+    with _pickup_slot_lock:
+        if _pickup_slot_counts['day'] == day and _pickup_slot_counts['version'] == version:
+            return _pickup_slot_counts['counts']
+    try:
+        with open(_pickup_slot_path(day)) as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                counts = _read_slot_file(f, day)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except FileNotFoundError:
+        counts = _count_slot_orders(day)
+    with _pickup_slot_lock:
+        _pickup_slot_counts.update(day=day, version=version, counts=counts)
+    return counts
+
+def pickup_slot_is_open(slot, now=None):
+    """A slot takes orders until PICKUP_SLOT_CUTOFF_MINUTES before its pickup time."""
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in slot.split(':'))
+    pickup_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return now <= pickup_at - timedelta(minutes=PICKUP_SLOT_CUTOFF_MINUTES)
+
+def get_pickup_slot_availability():
+    """Returns today's pickup slots with their capacity, bookings and whether they still take orders."""
+    now = datetime.now()
+    day = now.strftime('%Y-%m-%d')
+    counts = get_pickup_slot_counts(day)
+    slots = []
+    for slot in PICKUP_SLOTS:
+        booked = counts.get(slot, 0)
+        slots.append({
+            'slot': slot,
+            'capacity': PICKUP_SLOT_CAPACITY,
+            'booked': booked,
+            'available': max(PICKUP_SLOT_CAPACITY - booked, 0),
+            'open': pickup_slot_is_open(slot, now) and booked < PICKUP_SLOT_CAPACITY,
+        })
+    return {'date': day, 'slots': slots}
+
+def reset_pickup_slots():
+    """Forgets all slot bookings (after the orders were cleared)."""
+    for day_file in os.listdir(PICKUP_SLOT_DIR) if os.path.isdir(PICKUP_SLOT_DIR) else []:
+        os.remove(os.path.join(PICKUP_SLOT_DIR, day_file))
+        bump_data_version(_pickup_slot_key(day_file[:-len('.json')]))
+
+def ensure_orders_column(header):
+    """Returns the 0-based index of an Orders column, adding the header cell if it is missing."""
+    rows = get_sheet_rows('orders')
+    headers = list(rows[0]) if rows else []
+    col = _header_index(headers, header)
+    if col is not None:
+        return col
+    headers.append(header)
+    if orders_sheet.col_count < len(headers):  # type: ignore
+        orders_sheet.add_cols(len(headers) - orders_sheet.col_count)  # type: ignore
+    orders_sheet.update_cell(1, len(headers), header)  # type: ignore
+    version = bump_data_version('orders')
+    cache_written_row('orders', rows, 1, headers, version)
+    print(f"✓ Added '{header}' column to the Orders sheet")
+    return len(headers) - 1
+
+# --- DAILY SUMMARY ROLLUP ---
+# Once a night the finished days are rolled up into one DailySummary row each
+# (orders, revenue, status counts and item quantities as JSON), so week, month and
+# year reports read a row per day instead of every order. The job rebuilds all past
+# days from the Orders snapshot and only writes the rows that changed, which also
+# picks up late status changes. Days not rolled up yet (today) are summarised live.
+DAILY_ROLLUP_HOUR = int(os.environ.get("DAILY_ROLLUP_HOUR", "0"))
+DAILY_ROLLUP_CHECK_SECONDS = 600
+DAILY_ROLLUP_MARKER_PATH = os.path.join(DATA_VERSION_DIR, "daily_rollup_done")
+
+_daily_rollup_pid = None
+_daily_rollup_lock = threading.Lock()
+
+def _new_daily_summary(day):
+    return {'date': day, 'orders': 0, 'revenue': 0.0, 'pending': 0, 'delivered': 0, 'undeliverable': 0, 'items': Counter()}
+
+def summarize_order_days(orders, days=None):
+    """Folds [(row_num, record)] orders into {day: summary}, optionally only for the given days."""
+    summaries = {}
+    for _, record in orders:
+        day = time.strftime('%Y-%m-%d', time.localtime(record['epoch']))
+        if days is not None and day not in days:
+            continue
+        summary = summaries.get(day) or summaries.setdefault(day, _new_daily_summary(day))
+        summary['orders'] += 1
+        summary['revenue'] += record['totalPrice']
+        if record['status'] in ('pending', 'delivered', 'undeliverable'):
+            summary[record['status']] += 1
+        for item in record['items']:
+            summary['items'][item['name']] += item['quantity']
+    return summaries
+
+def _summary_row(summary, rolled_up_at):
+    return [summary['date'], summary['orders'], round(summary['revenue'], 2), summary['pending'], summary['delivered'],
+            summary['undeliverable'], json.dumps(dict(sorted(summary['items'].items())), ensure_ascii=False), rolled_up_at]
+
+def _summary_from_row(row):
+    """Reads one DailySummary row back into a summary dict (None if it is unreadable)."""
+    values = list(row) + [''] * (len(DAILY_SUMMARY_HEADERS) - len(row))
+    try:
+        return {
+            'date': str(values[0]).strip(),
+            'orders': int(float(values[1] or 0)),
+            'revenue': float(values[2] or 0),
+            'pending': int(float(values[3] or 0)),
+            'delivered': int(float(values[4] or 0)),
+            'undeliverable': int(float(values[5] or 0)),
+            'items': Counter(json.loads(values[6] or '{}')),
+        }
+    except (ValueError, TypeError):
+        return None
+
+def _summary_changed(summary, row):
+    """Compares parsed values, since the sheet formats numbers its own way (120.0 comes back as 120)."""
+    stored = _summary_from_row(row)
+    if stored is None:
+        return True
+    return (any(stored[key] != summary[key] for key in ('orders', 'pending', 'delivered', 'undeliverable'))
+            or round(stored['revenue'], 2) != round(summary['revenue'], 2)
+            or +stored['items'] != +summary['items'])
+
+def run_daily_rollup(today=None):
+    """Writes a DailySummary row for every finished day whose figures are new or changed.
+
+    Returns the number of rows written.
+    """
+    if daily_summary_sheet is None:
+        return 0
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    batch_get_sheet_rows('orders', 'dailysummary')
+    summaries = summarize_order_days(orders_between(0, day_epoch(today)))
+    summary_rows = get_sheet_rows('dailysummary')
+    existing = {str(row[0]).strip(): (row_num, row) for row_num, row in enumerate(summary_rows[1:], start=2) if row}
+    rolled_up_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    updates, appends = [], []
+    for day in sorted(summaries):
+        if day >= today:
+            continue
+        values = _summary_row(summaries[day], rolled_up_at)
+        if day not in existing:
+            appends.append(values)
+        elif _summary_changed(summaries[day], existing[day][1]):
+            updates.append((existing[day][0], values))
+
+    if not updates and not appends:
+        return 0
+    if updates:
+        daily_summary_sheet.batch_update([
+            {'range': f"A{row_num}:{rowcol_to_a1(row_num, len(values))}", 'values': [values]}
+            for row_num, values in updates
+        ], value_input_option='RAW')
+    response = None
+    if appends:
+        response = daily_summary_sheet.append_rows(appends, value_input_option='RAW')
+    version = bump_data_version('dailysummary')
+    cached = [list(row) for row in summary_rows] if summary_rows else [list(DAILY_SUMMARY_HEADERS)]
+    for row_num, values in updates:
+        cached[row_num - 1] = [str(v) for v in values]
+    cached_first = appended_row_number(response) if response else None
+    if appends and cached_first:
+        cache_written_rows('dailysummary', cached, cached_first, appends, version)
+    else:
+        store_sheet_rows('dailysummary', cached, version)
+    print(f"✓ Daily rollup: {len(appends)} new and {len(updates)} updated DailySummary rows")
+    return len(appends) + len(updates)
+
+def get_daily_summaries(start_day, end_day):
+    """Returns one summary per day with orders between start_day and end_day (YYYY-MM-DD, inclusive).
+
+    Rolled-up days come from DailySummary; the rest (usually just today) are summarised from Orders.
+    """
+    summaries = {}
+    for row in get_sheet_rows('dailysummary')[1:]:
+        day = str(row[0]).strip() if row else ''
+        if start_day <= day <= end_day:
+            summary = _summary_from_row(row)
+            if summary:
+                summaries[day] = summary
+
+    last_rolled_up = max(summaries, default=None)
+    today = datetime.now().strftime('%Y-%m-%d')
+    live_days = set()
+    day = datetime.strptime(start_day, '%Y-%m-%d')
+    while day.strftime('%Y-%m-%d') <= end_day:
+        key = day.strftime('%Y-%m-%d')
+        if key not in summaries and (key >= today or last_rolled_up is None or key > last_rolled_up):
+            live_days.add(key)
+        day += timedelta(days=1)
+    if live_days:
+        summaries.update(summarize_order_days(orders_on_days(min(live_days), max(live_days)), live_days))
+    return [summaries[day] for day in sorted(summaries)]
+
+def _daily_rollup_due(now):
+    """True once a day after DAILY_ROLLUP_HOUR, until the rollup for that day has run."""
+    if now.hour < DAILY_ROLLUP_HOUR:
+        return False
+    try:
+        with open(DAILY_ROLLUP_MARKER_PATH) as f:
+            return f.read().strip() != now.strftime('%Y-%m-%d')
+    except OSError:
+        return True
+
+def run_daily_rollup_if_due():
+    """Runs the nightly rollup in at most one worker per day."""
+    now = datetime.now()
+    if not _daily_rollup_due(now):
+        return
+    os.makedirs(DATA_VERSION_DIR, exist_ok=True)
+    with open(f"{DAILY_ROLLUP_MARKER_PATH}.lock", 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        try:
+            if not _daily_rollup_due(now):
+                return
+            run_daily_rollup(now.strftime('%Y-%m-%d'))
+            with open(DAILY_ROLLUP_MARKER_PATH, 'w') as f:
+                f.write(now.strftime('%Y-%m-%d'))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _daily_rollup_loop():
+    while True:
+        try:
+            run_daily_rollup_if_due()
+        except Exception as e:
+            print(f"Warning: Daily rollup failed: {e}")
+        time.sleep(DAILY_ROLLUP_CHECK_SECONDS)
+
+def ensure_daily_rollup_scheduler():
+    """Starts this process's nightly rollup thread."""
+    global _daily_rollup_pid
+    with _daily_rollup_lock:
+        if _daily_rollup_pid == os.getpid():
+            return
+        _daily_rollup_pid = os.getpid()
+    threading.Thread(target=_daily_rollup_loop, name='daily-rollup', daemon=True).start()
+
+@app.before_request
+def start_daily_rollup_scheduler():
+    ensure_daily_rollup_scheduler()
+
+def report_date_range(period, start_date='', end_date=''):
+    """Returns the (first, last) YYYY-MM-DD days covered by a report period, or None if invalid."""
+    today = datetime.now()
+    if period == 'day':
+        start = today
+    elif period == 'week':
+        start = today - timedelta(days=7)
+    elif period == 'month':
+        start = today.replace(day=1)
+    elif period == 'year':
+        start = today.replace(month=1, day=1)
+    elif period == 'custom':
+        try:
+            start = datetime.strptime(start_date.strip(), '%Y-%m-%d')
+            today = datetime.strptime(end_date.strip(), '%Y-%m-%d')
+        except ValueError:
+            return None
+    else:
+        return None
+    return start.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
 # --- ROUTING/VIEWS ---
 
 @app.route('/')
@@ -536,23 +2666,22 @@ def register():
                 return "Registration failed: Missing required fields.", 400
 
             # Hash the password for security
-            hashed_password = generate_password_hash(password)
+            hashed_password = hash_password(password)
 
             # Get the next unique user ID
-            new_user_id = get_next_user_id(student_sheet)
+            new_user_id = allocate_user_id()
 
-            # --- Append Data to Google Sheet ---
+            # --- Write Data to Google Sheet ---
             new_row = [
                 admission_id, new_user_id, name, hashed_password, email, class_name
             ]
-
-            # This is the critical write operation that was failing
-            student_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
+            student_row = upsert_student(new_user_id, new_row)
 
             # Success: Automatically log the user in
             session['logged_in'] = True
             session['user_id'] = new_user_id
             session['user_type'] = 'student'
+            session['profile'] = build_session_profile(new_user_id, name, class_name, admission_id, email, student_row)
             from flask import flash
             flash('Registration Successful!', 'success')
             return redirect(url_for('student_info'))
@@ -578,18 +2707,18 @@ def google_student_register():
         if not admission_id:
             return {'success': False, 'error': 'Invalid email format. Expected: s.XX.YY@slps.one'}, 400
         
-        user_id = get_next_user_id(student_sheet)
+        user_id = allocate_user_id()
         
         # Store Google auth user in database immediately with a temporary password marker
         try:
             # Use a special marker for Google auth users (they don't have a traditional password yet)
-            temp_password = generate_password_hash("GOOGLE_AUTH_PENDING")
+            temp_password = hash_password("GOOGLE_AUTH_PENDING")
             
             # Append user to database: [AdmissionID, userId, name, password, email, className]
             new_row = [
                 admission_id, user_id, name, temp_password, email, "PENDING"
             ]
-            student_sheet.append_row(new_row, value_input_option='USER_ENTERED')
+            upsert_student(user_id, new_row)
             print(f"✓ Google auth user stored in database: {user_id}")
         except Exception as e:
             print(f"Warning: Could not immediately store Google user to database: {e}")
@@ -636,45 +2765,20 @@ def student_register():
             return {'success': False, 'message': 'Database not initialized'}, 500
 
         # Hash the password for security
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         print(f"Password hashed successfully")
 
-        # Check if user already exists (from Google auth) and update or create
-        existing_student = get_student_by_id(user_id)
-        
-        if existing_student:
-            # Update existing Google auth user record
-            print(f"Updating existing Google auth user: {user_id}")
-            try:
-                # Find the row with this userId
-                headers = student_sheet.row_values(1)
-                user_id_col = 2  # userId is in column 2
-                cell = student_sheet.find(str(user_id), in_column=user_id_col)
-                
-                if cell:
-                    # Update the entire row with new data
-                    updated_row = [admission_id, user_id, name, hashed_password, email, class_name]
-                    student_sheet.update(f'A{cell.row}:F{cell.row}', [updated_row], value_input_option='USER_ENTERED')
-                    print(f"✓ Google auth user updated successfully: {user_id}")
-            except Exception as e:
-                print(f"Error updating Google auth user: {e}")
-                # Fallback: append as new record
-                new_row = [admission_id, user_id, name, hashed_password, email, class_name]
-                student_sheet.append_row(new_row, value_input_option='USER_ENTERED')
-        else:
-            # New registration - append as new record
-            print(f"Creating new student record: {user_id}")
-            new_row = [
-                admission_id, user_id, name, hashed_password, email, class_name
-            ]
-            print(f"Attempting to write row: {[admission_id, user_id, name, '***', email, class_name]}")
-            student_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
-            print(f"✓ Student registered successfully in Google Sheets")
+        # Update the existing row (from Google auth) or append a new one in a single write
+        new_row = [admission_id, user_id, name, hashed_password, email, class_name]
+        print(f"Writing student row: {[admission_id, user_id, name, '***', email, class_name]}")
+        student_row = upsert_student(user_id, new_row)
+        print(f"✓ Student registered successfully in Google Sheets (row {student_row})")
 
         # Success: Automatically log the user in
         session['logged_in'] = True
         session['user_id'] = user_id
         session['user_type'] = 'student'
+        session['profile'] = build_session_profile(user_id, name, class_name, admission_id, email, student_row)
         print(f"✓ Session created for student: {user_id}")
         
         # Return complete user data for client-side storage
@@ -722,7 +2826,12 @@ def student_login():
                 return {'success': False, 'message': 'Missing fields'}, 400
             return "Login failed: Missing fields.", 400
 
-        record = get_student_by_id(user_id)
+        retry_after = login_retry_after('student', user_id)
+        if retry_after:
+            return throttled_login_response(retry_after, is_json_request)
+
+        known_missing = is_unknown_login_id('student', user_id)
+        record = None if known_missing else lookup_login_record('student', user_id, get_student_by_id)
         
         print(f"Student login - Record found: {record is not None}")  # Debug
         if record:
@@ -732,21 +2841,12 @@ def student_login():
             # Get normalized dict for case-insensitive lookup
             normalized = record.get('_normalized', {})
             
-            # Try multiple possible password field names
-            stored_password = (
-                record.get('password') or 
-                record.get('Password') or 
-                normalized.get('password') or
-                ''
-            )
-            
-            print(f"Stored password (first 20 chars): {stored_password[:20] if stored_password else 'EMPTY'}")
-            print(f"Password check result: {check_password_hash(stored_password, password) if stored_password else 'No password stored'}")
-            
-            if stored_password and check_password_hash(stored_password, password):
+            if verify_credentials('student', user_id, password):
+                record_login_result('student', user_id, True)
                 session['logged_in'] = True
                 session['user_id'] = user_id
                 session['user_type'] = 'student'
+                session['profile'] = load_session_profile(user_id, 'student')
                 from flask import flash
                 flash('Login Successful!', 'success')
                 
@@ -775,13 +2875,19 @@ def student_login():
                     return {'success': True, 'user': user_data}, 200
                 return redirect(url_for('student_info'))
             else:
-                print(f"Password verification failed - stored: '{stored_password[:20] if stored_password else 'EMPTY'}'")  # Debug
+                print(f"Password verification failed for userId: {user_id}")  # Debug
         else:
             print(f"Student record not found for userId: {user_id}")  # Debug
 
+        record_login_result('student', user_id, False, found=record is not None)
         if is_json_request:
             return {'success': False, 'message': 'Invalid User ID or Password'}, 401
         return "Login failed: Invalid User ID or Password.", 401
+    except CredentialServiceBusy as e:
+        print(f"Student login deferred: {e}")
+        if is_json_request:
+            return {'success': False, 'message': 'Server busy - please try again'}, 503
+        return "Login failed: Server busy, please try again.", 503
     except Exception as e:
         print(f"❌ Student Login Error: {e}")
         import traceback
@@ -837,7 +2943,7 @@ def teacher_register():
             # Continue if check fails - better to allow registration than block it
 
         # Hash the password
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         print("Password hashed successfully")
 
         # Get current headers to ensure we match the structure
@@ -848,13 +2954,16 @@ def teacher_register():
         new_row = [name, staff_id, hashed_password, email]
         print(f"Attempting to write row: {[name, staff_id, '***', email]}")
         
-        teacher_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
+        response = teacher_sheet.append_row(new_row, value_input_option='USER_ENTERED')  # type: ignore
+        bump_data_version('teachers', profile_data_key(staff_id))
         print("✓ Teacher registered successfully in Google Sheets")
 
         # Auto-login
         session['logged_in'] = True
         session['user_id'] = staff_id
         session['user_type'] = 'teacher'
+        session['profile'] = build_session_profile(staff_id, name, 'Teacher', email=email,
+                                                   row=appended_row_number(response))
         from flask import flash
         flash('Registration Successful!', 'success')
         print(f"✓ Session created for teacher: {staff_id}")
@@ -911,18 +3020,23 @@ def teacher_login():
                 return {'success': False, 'message': 'Database not initialized'}, 500
             return "Login failed: Database error.", 500
 
-        record = get_teacher_by_staff_id(staff_id)
+        retry_after = login_retry_after('teacher', staff_id)
+        if retry_after:
+            return throttled_login_response(retry_after, request.is_json)
+
+        known_missing = is_unknown_login_id('teacher', staff_id)
+        record = None if known_missing else lookup_login_record('teacher', staff_id, get_teacher_by_staff_id)
         print(f"Teacher record found: {record is not None}")
         
         if record:
             print(f"Teacher record keys: {record.keys()}")
-            stored_password = str(record.get('Password', ''))
-            print(f"Has stored password: {bool(stored_password)}")
             
-            if stored_password and check_password_hash(stored_password, password):
+            if verify_credentials('teacher', staff_id, password):
+                record_login_result('teacher', staff_id, True)
                 session['logged_in'] = True
                 session['user_id'] = staff_id
                 session['user_type'] = 'teacher'
+                session['profile'] = load_session_profile(staff_id, 'teacher')
                 from flask import flash
                 flash('Login Successful!', 'success')
                 print(f"✓ Teacher login successful: {staff_id}")
@@ -940,10 +3054,16 @@ def teacher_login():
         else:
             print(f"ERROR: No teacher found with Staff ID: {staff_id}")
 
+        record_login_result('teacher', staff_id, False, found=record is not None)
         if request.is_json:
             return {'success': False, 'message': 'Invalid Staff ID or Password'}, 401
         return "Login failed: Invalid Staff ID or Password.", 401
 
+    except CredentialServiceBusy as e:
+        print(f"Teacher login deferred: {e}")
+        if request.is_json:
+            return {'success': False, 'message': 'Server busy - please try again'}, 503
+        return "Login failed: Server busy, please try again.", 503
     except Exception as e:
         print(f"❌ Teacher Login Error: {e}")
         import traceback
@@ -976,33 +3096,36 @@ def staff_login():
         staff_id = f"{staff_id}@slps.one"
         print(f"Auto-formatted Staff ID to: {staff_id}")
 
-    record = get_staff_by_id(staff_id) # Fetches record by admissionId (Col 1)
+    retry_after = login_retry_after('staff', staff_id)
+    if retry_after:
+        return throttled_login_response(retry_after, request.is_json)
+
+    known_missing = is_unknown_login_id('staff', staff_id)
+    try:
+        record = None if known_missing else lookup_login_record('staff', staff_id, get_staff_by_id) # Fetches record by admissionId (Col 1)
+    except CredentialServiceBusy as e:
+        print(f"Staff login deferred: {e}")
+        if request.is_json:
+            return {'success': False, 'message': 'Server busy - please try again'}, 503
+        return "Login failed: Server busy, please try again.", 503
     print(f"Staff record found: {record is not None}")  # Debug
     
     if record:
         print(f"Staff record keys: {record.keys()}")  # Debug
         
-        # Hardcoded fix for admin account password sync
-        if staff_id == "s.18.20@slps.one":
-            stored_password = generate_password_hash("Pass@0001", method="scrypt")
-            print("Applying sync for admin account s.18.20@slps.one")
-        else:
-            stored_password = str(record.get('password', ''))
-            
-        print(f"Stored password: {stored_password[:20]}..., Input password: {password}")  # Debug
-        
-        # Check if password is hashed (starts with pbkdf2, bcrypt, etc.) or plain text
-        is_hashed = stored_password.startswith(('pbkdf2:', 'scrypt:', 'bcrypt'))
-        
-        if is_hashed:
-            password_match = check_password_hash(stored_password, password)
-        else:
-            # Plain text comparison (for legacy/development)
-            password_match = (stored_password == password)
+        # Admin override, legacy plaintext rows and hash upgrades are handled by the credential service
+        try:
+            password_match = verify_credentials('staff', staff_id, password)
+        except CredentialServiceBusy as e:
+            print(f"Staff login deferred: {e}")
+            if request.is_json:
+                return {'success': False, 'message': 'Server busy - please try again'}, 503
+            return "Login failed: Server busy, please try again.", 503
         
         print(f"Password match: {password_match}")  # Debug
 
         if password_match:
+            record_login_result('staff', staff_id, True)
             session['logged_in'] = True
             session['user_id'] = staff_id
             session['user_type'] = 'staff'
@@ -1013,6 +3136,7 @@ def staff_login():
                 return {'success': True, 'user': {'staffId': staff_id, 'type': 'staff'}}, 200
             return redirect(url_for('staff_view'))
 
+    record_login_result('staff', staff_id, False, found=record is not None)
     if request.is_json:
         return {'success': False, 'message': 'Invalid Staff ID or Password'}, 401
     return "Login failed: Invalid Staff ID or Password.", 401
@@ -1036,11 +3160,10 @@ def student_info():
     if not session.get('logged_in') or session.get('user_type') != 'student':
         return redirect(url_for('home'))
 
-    # Fetch student data if needed
-    user_id = session.get('user_id')
-    student_record = get_student_by_id(user_id)
+    # Profile fields were captured in the session at login
+    student_profile = get_session_profile() or {}
 
-    return render_template('student_info.html', student=student_record)
+    return render_template('student_info.html', student=student_profile)
 
 @app.route('/food_selection', methods=['GET', 'POST'])
 def food_selection():
@@ -1050,8 +3173,8 @@ def food_selection():
 
     if request.method == 'POST':
         try:
-            # Get data from menu sheet
-            menu_data = menu_sheet.get_all_records()
+            # Get data from the menu cache
+            menu_data = get_menu_items()
 
             # Process order items
             items_ordered = []
@@ -1070,14 +3193,14 @@ def food_selection():
 
             # Get user info
             user_id = session.get('user_id')
-            student_record = get_student_by_id(user_id)
+            profile = get_session_profile() or {}
 
             # Prepare new order row
             order_row = [
                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'), # Timestamp
                 user_id,
-                student_record.get('name', 'N/A'),
-                student_record.get('className', 'N/A'),
+                profile.get('name') or 'N/A',
+                profile.get('className') or 'N/A',
                 ', '.join(items_ordered),
                 total_price,
                 'Pending' # Status
@@ -1085,16 +3208,21 @@ def food_selection():
 
             # Write order to Orders sheet
             orders_sheet.append_row(order_row, value_input_option='USER_ENTERED')  # type: ignore
+            bump_data_version(user_data_key(user_id), 'orders')
             
             # Calculate health points for nutritious foods
-            health_points = calculate_health_points(items_ordered, menu_data)
+            health_points = calculate_health_points(items_ordered)
             if health_points > 0:
-                # Get current points
-                current_points = get_user_nutrition_points(user_id)
-                new_total = current_points + health_points
-                # Save updated points to database
-                save_user_nutrition_points(user_id, new_total)
-                print(f"✓ User earned {health_points} health points! Total: {new_total}")
+                try:
+                    # Get current points
+                    current_points = get_user_nutrition_points(user_id)
+                    new_total = current_points + health_points
+                    # Save updated points to database
+                    save_user_nutrition_points(user_id, new_total)
+                    print(f"✓ User earned {health_points} health points! Total: {new_total}")
+                except Exception as e:
+                    # The order is already placed; skip the points rather than overwrite them with a guess
+                    print(f"Warning: Could not update health points for user {user_id}: {e}")
             
             return redirect(url_for('thank_you'))
 
@@ -1103,7 +3231,7 @@ def food_selection():
             return "Order failed: Database error.", 500
 
     # GET request: Display menu
-    menu_data = menu_sheet.get_all_records()
+    menu_data = get_menu_items()
     return render_template('food_selection.html', menu=menu_data)
 
 @app.route('/google_completion')
@@ -1130,71 +3258,53 @@ def get_nutrition_stats():
         user_id = session.get('user_id')
         today = datetime.now().strftime('%Y-%m-%d')
         
-        # Get all orders from database
-        all_orders = orders_sheet.get_all_records()
-        menu_data = menu_sheet.get_all_records()
-        
-        # Filter today's orders for this user
-        today_orders = [o for o in all_orders if str(o.get('userId', '')).strip() == str(user_id).strip() 
-                       and o.get('timestamp', '').startswith(today)]
-        
-        total_calories = 0
-        items_count = 0
-        healthy_count = 0
-        
-        # Calculate calories from ordered items
-        for order in today_orders:
-            items_str = str(order.get('items', ''))
-            items_list = [x.strip() for x in items_str.split(',')]
-            items_count += len(items_list)
+        def build_stats():
+            # Orders and Menu don't depend on each other, so load whichever are stale together
+            prefetch_sheet_rows('orders', 'menu')
             
-            for item_str in items_list:
-                # Parse quantity
-                parts = item_str.split(' x ')
-                item_name = parts[0].strip() if parts else item_str.strip()
+            # Today's orders come straight out of the date index; keep this user's
+            nutrition_by_name = get_menu_nutrition_lookup()
+            today_orders = [record for _, record in orders_on_days(today, today)
+                            if record['userId'] == str(user_id).strip()]
+            
+            total_calories = 0
+            items_count = 0
+            healthy_count = 0
+            
+            # Calculate calories from ordered items
+            for order in today_orders:
+                items_count += len(order['items'])
                 
-                # Find in menu data to get calories
-                matching_item = next((m for m in menu_data if m.get('ItemName', '').lower() == item_name.lower()), None)
-                if matching_item:
-                    # Try to extract calories from benefits or price
-                    calories = 0
-                    benefits = str(matching_item.get('Benefits', '')).lower()
-                    # Estimate calories based on benefits/type
-                    if 'fruit' in benefits or 'salad' in benefits:
-                        calories = 150
-                    elif 'pizza' in item_name.lower():
-                        calories = 300
-                    elif 'burger' in item_name.lower():
-                        calories = 250
-                    elif 'roll' in item_name.lower():
-                        calories = 200
-                    elif 'juice' in benefits or 'drink' in benefits:
-                        calories = 120
-                    elif 'chai' in item_name.lower() or 'coffee' in item_name.lower():
-                        calories = 80
-                    else:
-                        calories = 150  # Default estimate
-                    
-                    total_calories += calories
+                for item in order['items']:
+                    item_name = item['name']
                     
-                    # Check if healthy
-                    if any(x in benefits for x in ['healthy', 'nutrition', 'vitamin', 'fiber', 'protein', 'salad', 'fruit']):
-                        healthy_count += 1
-        
-        # Get nutrition points from database
-        nutrition_points = get_user_nutrition_points(user_id)
+                    # Look up the item's precomputed nutrition in the menu cache
+                    nutrition = nutrition_by_name.get(item_name.lower())
+                    if nutrition:
+                        total_calories += nutrition['calories']
+                        
+                        # Healthy choices are the items that earn full health points
+                        if nutrition['healthTier'] == 'high':
+                            healthy_count += 1
+            
+            # Get nutrition points from database
+            nutrition_points = get_user_nutrition_points(user_id)
+            
+            return {
+                'success': True,
+                'userId': user_id,
+                'date': today,
+                'totalCalories': total_calories,
+                'itemsOrdered': items_count,
+                'healthyChoices': healthy_count,
+                'nutritionPercent': min(round((total_calories / 2000) * 100), 100),
+                'orderCount': len(today_orders),
+                'nutritionPoints': nutrition_points
+            }, 200
         
-        return {
-            'success': True,
-            'userId': user_id,
-            'date': today,
-            'totalCalories': total_calories,
-            'itemsOrdered': items_count,
-            'healthyChoices': healthy_count,
-            'nutritionPercent': min(round((total_calories / 2000) * 100), 100),
-            'orderCount': len(today_orders),
-            'nutritionPoints': nutrition_points
-        }, 200
+        # Stats only change when this user orders, the menu changes or the day rolls over
+        etag = user_data_etag('nutrition_stats', user_id, today, get_data_version('menu'))
+        return conditional_response(etag, build_stats)
     
     except Exception as e:
         print(f"Nutrition Stats Error: {e}")
@@ -1208,13 +3318,16 @@ def get_health_points():
             return {'success': False, 'error': 'Not logged in'}, 401
         
         user_id = session.get('user_id')
-        points = get_user_nutrition_points(user_id)
         
-        return {
-            'success': True,
-            'userId': user_id,
-            'nutritionPoints': points
-        }, 200
+        def build_points():
+            points = get_user_nutrition_points(user_id)
+            return {
+                'success': True,
+                'userId': user_id,
+                'nutritionPoints': points
+            }, 200
+        
+        return conditional_response(user_data_etag('health_points', user_id), build_points)
     except Exception as e:
         print(f"Health Points Error: {e}")
         return {'success': False, 'error': str(e)}, 500
@@ -1227,13 +3340,16 @@ def get_health_data():
             return {'success': False, 'error': 'Not logged in'}, 401
         
         user_id = session.get('user_id')
-        health_data = get_user_health_data(user_id)
         
-        return {
-            'success': True,
-            'userId': user_id,
-            'data': health_data or {'bmi': '', 'height': '', 'weight': ''}
-        }, 200
+        def build_health_data():
+            health_data = get_user_health_data(user_id)
+            return {
+                'success': True,
+                'userId': user_id,
+                'data': health_data or {'bmi': '', 'height': '', 'weight': ''}
+            }, 200
+        
+        return conditional_response(user_data_etag('health_data', user_id), build_health_data)
     except Exception as e:
         print(f"Health Data Fetch Error: {e}")
         return {'success': False, 'error': str(e)}, 500
@@ -1290,26 +3406,17 @@ def staff_view():
     if not session.get('logged_in') or session.get('user_type') != 'staff':
         return redirect(url_for('home'))
     
-    try:
-        students_data = student_sheet.get_all_records()
-        total_students = len(students_data)
-    except Exception as e:
-        print(f"Error fetching students count: {e}")
-        total_students = 0
-    
-    try:
-        staff_data = staff_sheet.get_all_records()
-        total_staff = len(staff_data)
-    except Exception as e:
-        print(f"Error fetching staff count: {e}")
-        total_staff = 0
-    
-    try:
-        teachers_data = teacher_sheet.get_all_records()
-        total_teachers = len(teachers_data)
-    except Exception as e:
-        print(f"Error fetching teachers count: {e}")
-        total_teachers = 0
+    # Students, Staff and Teachers are independent reads, so fetch them side by side
+    counts = {}
+    for name, result in prefetch_sheet_rows('students', 'staff', 'teachers').items():
+        if isinstance(result, Exception):
+            print(f"Error fetching {name} count: {result}")
+            counts[name] = 0
+        else:
+            counts[name] = max(len(result) - 1, 0)
+    total_students = counts['students']
+    total_staff = counts['staff']
+    total_teachers = counts['teachers']
     
     return render_template('staff_view.html', 
                          total_students=total_students,
@@ -1323,7 +3430,9 @@ def staff_students():
         return redirect(url_for('home'))
     
     try:
-        students_data = student_sheet.get_all_records()
+        # Students and UserHealth come back from a single batched read
+        batch_get_sheet_rows('students', 'userhealth')
+        students_data = get_sheet_records('students')
         
         # Optimized: Fetch all nutrition points in ONE call instead of N calls
         all_points = get_all_nutrition_points()
@@ -1336,7 +3445,28 @@ def staff_students():
         return render_template('staff_students.html', students=students_data)
     except Exception as e:
         print(f"Staff Students Error: {e}")
-        return render_template('staff_students.html', students=[])
+        return "Could not retrieve students right now. Please try again shortly.", 503
+
+@app.route('/class_nutrition')
+def class_nutrition():
+    """Class-by-class nutrition overview for teachers and staff."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return redirect(url_for('home'))
+    
+    try:
+        report = get_class_nutrition_report()
+        return render_template('class_nutrition.html', report=report)
+    except Exception as e:
+        print(f"Class Nutrition Error: {e}")
+        return render_template('class_nutrition.html', report=None)
+
+@app.route('/kitchen_prep')
+def kitchen_prep():
+    """Kitchen screen: pending quantity per menu item, refreshed from /api/kitchen/prep_list."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return redirect(url_for('home'))
+
+    return render_template('kitchen_prep.html')
 
 @app.route('/staff_list')
 def staff_list():
@@ -1371,15 +3501,15 @@ def staff_orders():
         return redirect(url_for('home'))
 
     try:
-        # Fetch all records from the Orders sheet
-        orders = orders_sheet.get_all_records()
+        # Fetch all records from the Orders sheet (snapshot cache, stale copy if Sheets is down)
+        orders = get_sheet_records('orders')
         # You may want to filter or sort orders here (e.g., only 'Pending')
 
         # This route fixes the /staff_orders Not Found error
         return render_template('staff_orders_dashboard.html', orders=orders)
     except Exception as e:
         print(f"Staff Orders Error: {e}")
-        return "Could not retrieve orders.", 500
+        return "Could not retrieve orders right now. Please try again shortly.", 503
 
 @app.route('/staff_menu_management')
 def staff_menu_management():
@@ -1388,12 +3518,12 @@ def staff_menu_management():
         return redirect(url_for('home'))
 
     try:
-        menu_data = menu_sheet.get_all_records()
+        menu_data = get_menu_items()
         # This route fixes the /staff_menu_management Not Found error
         return render_template('staff_menu_management.html', menu=menu_data)
     except Exception as e:
         print(f"Menu Management Error: {e}")
-        return "Could not retrieve menu data.", 500
+        return "Could not retrieve menu data right now. Please try again shortly.", 503
 
 @app.route('/staff_menu')
 def staff_menu():
@@ -2519,10 +4649,10 @@ def get_menu():
             cleaned = ' '.join(cleaned.split())
             return cleaned.strip()
         
-        # Get all records from Menu sheet
-        menu_data = menu_sheet.get_all_records()
+        # Get all records from the menu cache
+        menu_data = get_menu_items()
         print(f"Raw menu data count: {len(menu_data)}")
-        print(f"Sheet headers: {menu_sheet.row_values(1) if menu_data else 'No data'}")
+        print(f"Sheet headers: {list(menu_data[0].keys()) if menu_data else 'No data'}")
         
         if not menu_data:
             print("WARNING: No menu data found in Google Sheets")
@@ -2654,13 +4784,19 @@ def get_menu():
             if not image_url:
                 print(f"WARNING: No image URL found for {item_name}, using placeholder")
             
+            nutrition = _nutrition_from_record(item)
+            
             formatted_item = {
                 'id': item_id or f'item{idx + 1}',
                 'name': item_name or 'Unknown Item',
                 'price': price,
                 'benefits': benefits or 'Delicious!',
                 'image': image_url if image_url else '/static/images/veggie_burger_vegeta.jpg',
-                'soldOut': sold_out
+                'soldOut': sold_out,
+                'calories': nutrition['calories'],
+                'protein': nutrition['protein'],
+                'fiber': nutrition['fiber'],
+                'healthTier': nutrition['healthTier']
             }
             
             print(f"  Item: {item_name}, Image: {image_url}")
@@ -2727,6 +4863,7 @@ def get_all_orders():
             items_str = str(order_dict_lower.get('items') or order_dict_lower.get('itemsjson') or '').strip()
             total_price = str(order_dict_lower.get('totalprice') or order_dict_lower.get('total') or '0').strip()
             status = str(order_dict_lower.get('status') or 'pending').strip().lower()
+            pickup_slot = str(order_dict_lower.get('pickupslot') or '').strip()
             
             # Convert total price to float
             try:
@@ -2757,7 +4894,8 @@ def get_all_orders():
                 'userClass': user_class,
                 'items': items_array,
                 'totalPrice': total_price,
-                'status': status
+                'status': status,
+                'pickupSlot': pickup_slot
             })
         
         print(f"✓ Returning {len(formatted_orders)} formatted orders")
@@ -2782,59 +4920,47 @@ def place_order():
         data = request.get_json()
         items = data.get('items', [])
         total_price = data.get('totalPrice', 0)
+        pickup_slot = str(data.get('pickupSlot') or '').strip()
         
         print(f"Items: {items}")
         print(f"Total Price: {total_price}")
         
         if not items:
             return {'error': 'No items in order'}, 400
+        if pickup_slot and pickup_slot not in PICKUP_SLOTS:
+            return {'error': f'Unknown pickup slot: {pickup_slot}'}, 400
+        if pickup_slot and not pickup_slot_is_open(pickup_slot):
+            return {'error': f'Pickup slot {pickup_slot} is no longer taking orders'}, 400
 
         # Check if orders_sheet is initialized
         if orders_sheet is None:
             print("ERROR: orders_sheet is None - Google Sheets not initialized")
             return {'error': 'Database not initialized'}, 500
 
+        journaled = ORDER_INTAKE_MODE == 'journal'
+        if not journaled:
+            # Orders (order IDs and the row cache), Menu (health points) and UserHealth (points
+            # total) are all needed below - refresh whichever are stale in one batched read
+            batch_get_sheet_rows('orders', 'menu', 'userhealth')
+
         # Get user info
         user_id = session.get('user_id')
         user_type = session.get('user_type')
         print(f"User ID: {user_id}, Type: {user_type}")
         
+        # Name and class come from the profile stored in the session at login
+        profile = get_session_profile()
+        if not profile:
+            record_type = 'Teacher' if user_type == 'teacher' else 'Student'
+            print(f"ERROR: {record_type} record not found for user_id: {user_id}")
+            return {'error': f'{record_type} record not found'}, 404
+
         if user_type == 'teacher':
-            # Get teacher info
-            teacher_record = get_teacher_by_staff_id(user_id)
-            if not teacher_record:
-                print(f"ERROR: Teacher record not found for staff_id: {user_id}")
-                return {'error': 'Teacher record not found'}, 404
-            
-            student_name = teacher_record.get('Name', 'Teacher')
+            student_name = profile['name'] or 'Teacher'
             student_class = 'Teacher'  # Mark as Teacher instead of Staff
         else:
-            # Get student info
-            student_record = get_student_by_id(user_id)
-            
-            if not student_record:
-                print(f"ERROR: Student record not found for user_id: {user_id}")
-                return {'error': 'Student record not found'}, 404
-
-            # Get normalized dict for field access
-            normalized = student_record.get('_normalized', {})
-            
-            # Get student details with flexible field mapping
-            student_name = (
-                student_record.get('name') or 
-                student_record.get('Name') or 
-                normalized.get('name') or
-                'N/A'
-            )
-            
-            student_class = (
-                student_record.get('className') or 
-                student_record.get('Class') or 
-                student_record.get('class') or
-                normalized.get('classname') or
-                normalized.get('class') or
-                'N/A'
-            )
+            student_name = profile['name'] or 'N/A'
+            student_class = profile['className'] or 'N/A'
         
         print(f"Name: {student_name}, Class: {student_class}")
 
@@ -2842,15 +4968,15 @@ def place_order():
         items_str = ', '.join([f"{item['name']} x {item.get('quantity', 1)}" for item in items])
         print(f"Items string: {items_str}")
 
-        # Generate order ID (unlimited, cycles back to 1 after 500)
-        existing_orders = orders_sheet.get_all_records()
-        next_order_num = (len(existing_orders) ) + 1
-        order_id = str(next_order_num)
+        # Order IDs come from one sequence in both intake modes, so a journaled order
+        # can never share an ID with a direct one (the flusher dedupes by orderId)
+        order_id = allocate_order_id()
         print(f"Generated Order ID: {order_id}")
 
         # Prepare new order row
         # Expected Google Sheets Headers: orderId | timestamp | userId | userName | userClass | items | totalPrice | status
-        current_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        placed_at = datetime.now()
+        current_timestamp = placed_at.strftime('%Y-%m-%d %H:%M:%S')
         order_row = [
             order_id,           # orderId
             current_timestamp,  # timestamp
@@ -2862,33 +4988,61 @@ def place_order():
             'Pending'           # status
         ]
 
+        # Convert items format from list of dicts to list of strings for calculate_health_points
+        items_ordered = [f"{item['name']} x {item.get('quantity', 1)}" for item in items]
+
+        # Epoch seconds next to the display timestamp, so date lookups never parse strings
+        epoch_col = ensure_orders_column('epoch')
+        order_row += [''] * (epoch_col + 1 - len(order_row))
+        order_row[epoch_col] = int(placed_at.timestamp())
+
+        # Pre-orders take a place in their pickup slot before anything is written
+        pickup_day = current_timestamp[:10]
+        if pickup_slot:
+            slot_col = ensure_orders_column('pickupSlot')
+            order_row += [''] * (slot_col + 1 - len(order_row))
+            order_row[slot_col] = pickup_slot
+            if not reserve_pickup_slot(pickup_day, pickup_slot):
+                return {'error': f'Pickup slot {pickup_slot} is full', 'slots': get_pickup_slot_availability()['slots']}, 409
+
+        if journaled:
+            # Durable locally; the flusher writes the row and awards the points shortly
+            health_points = calculate_health_points(items_ordered)
+            try:
+                journal_order(order_id, user_id, order_row, health_points)
+            except Exception:
+                if pickup_slot:
+                    release_pickup_slot(pickup_day, pickup_slot)
+                raise
+            print(f"✓ Order {order_id} journaled for the Orders sheet")
+            return {'success': True, 'orderId': order_id, 'healthPoints': health_points, 'pickupSlot': pickup_slot, 'queued': True}, 200
+
         # Write order to Orders sheet
-        print(f"Writing order to sheet: {[order_id, current_timestamp, user_id, student_name, student_class, items_str, total_price, 'Pending']}")
-        orders_sheet.append_row(order_row, value_input_option='USER_ENTERED')  # type: ignore
+        print(f"Writing order to sheet: {order_row}")
+        try:
+            response = orders_sheet.append_row(order_row, value_input_option='USER_ENTERED')  # type: ignore
+        except Exception:
+            if pickup_slot:
+                release_pickup_slot(pickup_day, pickup_slot)
+            raise
+        # Re-read: ensure_orders_column() may have added the epoch/pickupSlot header since
+        orders_rows = get_sheet_rows('orders')
+        version = bump_data_version(user_data_key(user_id), 'orders')
+        cache_written_row('orders', orders_rows, appended_row_number(response), order_row, version)
         print(f"✓ Order placed successfully")
         
         # Calculate and save health points for nutritious foods
         try:
-            menu_data = menu_sheet.get_all_records()
-            # Convert items format from list of dicts to list of strings for calculate_health_points
-            items_ordered = [f"{item['name']} x {item.get('quantity', 1)}" for item in items]
-            health_points = calculate_health_points(items_ordered, menu_data)
+            health_points = calculate_health_points(items_ordered)
             print(f"Calculated health points: {health_points} for items: {items_ordered}")
-            
-            if health_points > 0 or user_health_sheet is not None:
-                current_points = get_user_nutrition_points(user_id)
-                print(f"Current nutrition points for user {user_id}: {current_points}")
-                
-                new_total = current_points + health_points
-                saved = save_user_nutrition_points(user_id, new_total)
-                print(f"✓ Saved nutrition points: {health_points} points. Current total: {new_total}. Save result: {saved}")
+            award_health_points(user_id, health_points)
         except Exception as e:
             print(f"Warning: Error saving nutrition points: {e}")
             import traceback
             traceback.print_exc()
             health_points = 0
         
-        return {'success': True, 'orderId': order_id, 'healthPoints': health_points}, 200
+        return {'success': True, 'orderId': order_id, 'healthPoints': health_points, 'pickupSlot': pickup_slot}, 200
 
     except gspread.exceptions.APIError as e:
         print(f"Google Sheets API Error during order placement: {e}")
@@ -2901,6 +5055,99 @@ def place_order():
         return {'error': str(e)}, 500
 
 
+@app.route('/api/analytics/class_nutrition', methods=['GET'])
+def get_class_nutrition():
+    """API endpoint for per-class and school-wide nutrition distributions (staff/teacher only)."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    try:
+        report = get_class_nutrition_report()
+        class_filter = request.args.get('className', '').strip().lower()
+        classes = report['classes']
+        if class_filter:
+            classes = [c for c in classes if c['className'].lower() == class_filter]
+            if not classes:
+                return {'error': f'Class {class_filter} not found'}, 404
+
+        return {
+            'success': True,
+            'generatedAt': report['generatedAt'],
+            'bmiBandLabels': report['bmiBandLabels'],
+            'school': report['school'],
+            'classes': classes
+        }, 200
+    except Exception as e:
+        print(f"❌ Error building class nutrition analytics: {e}")
+        import traceback
+        traceback.print_exc()
+        return {'error': str(e)}, 500
+
+@app.route('/api/pickup_slots', methods=['GET'])
+def get_pickup_slots():
+    """API endpoint for today's pickup slots and how many places each has left."""
+    if not session.get('logged_in'):
+        return {'error': 'Unauthorized'}, 401
+
+    try:
+        return get_pickup_slot_availability(), 200
+    except Exception as e:
+        print(f"Error loading pickup slots: {e}")
+        return {'error': 'Could not load pickup slots'}, 503
+
+@app.route('/api/orders/summary', methods=['GET'])
+def get_orders_summary():
+    """API endpoint for the orders dashboard: status counts plus one page of one status (default pending)."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    status = request.args.get('status', 'pending').strip().lower()
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('pageSize', ORDER_QUEUE_PAGE_SIZE)), 1), 500)
+    except ValueError:
+        return {'error': 'page and pageSize must be numbers'}, 400
+
+    try:
+        summary = get_order_status_summary(status, page, page_size)
+        etag = hashlib.sha1(json.dumps(summary, sort_keys=True).encode()).hexdigest()[:24]
+        return conditional_response(etag, lambda: (summary, 200))
+    except Exception as e:
+        print(f"Error building orders summary: {e}")
+        return {'error': 'Could not load orders'}, 503
+
+@app.route('/api/kitchen/prep_list', methods=['GET'])
+def get_prep_list():
+    """API endpoint for the kitchen prep list (staff/teacher only); 304 while nothing changed."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    try:
+        prep_list = get_kitchen_prep_list()
+        etag = hashlib.sha1(json.dumps(prep_list, sort_keys=True).encode()).hexdigest()[:24]
+        return conditional_response(etag, lambda: (prep_list, 200))
+    except Exception as e:
+        print(f"Error building prep list: {e}")
+        return {'error': 'Could not load pending orders'}, 503
+
+@app.route('/api/analytics/sales', methods=['GET'])
+def get_sales():
+    """API endpoint for sales analytics (staff/teacher only): revenue by day and hour, AOV, top items, class spend."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    try:
+        days = min(max(int(request.args.get('days', SALES_WINDOW_DAYS)), 1), 366)
+        top_items = min(max(int(request.args.get('top', 10)), 1), 100)
+    except ValueError:
+        return {'error': 'days and top must be numbers'}, 400
+
+    try:
+        return get_sales_analytics(days, top_items), 200
+    except Exception as e:
+        print(f"Error building sales analytics: {e}")
+        return {'error': 'Could not load sales analytics'}, 503
+
 @app.route('/api/clear_data', methods=['POST'])
 def clear_data():
     """API endpoint to clear all orders and student data (staff/teacher only)."""
@@ -2920,6 +5167,12 @@ def clear_data():
             # Delete all rows after the header
             student_sheet.delete_rows(2, len(students_values))
         
+        bump_data_version('all_users', 'orders', 'students')
+        try:
+            os.remove(ORDER_ID_SEQUENCE_PATH)  # order IDs restart from the (now empty) sheet
+        except FileNotFoundError:
+            pass
+        reset_pickup_slots()
         print(f"✓ Cleared {len(orders_values) - 1} orders and {len(students_values) - 1} students")
         return {'success': True, 'message': 'All data cleared successfully'}, 200
     except Exception as e:
@@ -2928,12 +5181,9 @@ def clear_data():
         traceback.print_exc()
         return {'error': str(e)}, 500
 
-
-        return {'error': str(e)}, 500
-
 @app.route('/api/menu/update', methods=['POST'])
 def update_menu_item():
-    """API endpoint to update menu item sold out status."""
+    """API endpoint to update a menu item's sold out status and/or nutrition values."""
     if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
         return {'error': 'Unauthorized'}, 401
 
@@ -2941,17 +5191,37 @@ def update_menu_item():
         data = request.get_json()
         item_id = data.get('itemId')
         sold_out = data.get('soldOut')
+        nutrition_updates = {field: data[field] for field in MENU_NUTRITION_COLUMNS if data.get(field) not in (None, '')}
 
         print(f"=== MENU UPDATE REQUEST ===")
         print(f"Item ID: {item_id}")
         print(f"New soldOut status: {sold_out}")
+        print(f"Nutrition updates: {nutrition_updates}")
 
-        if item_id is None or sold_out is None:
+        if item_id is None or (sold_out is None and not nutrition_updates):
             return {'error': 'Missing itemId or soldOut'}, 400
 
-        # Get all menu data
-        headers = menu_sheet.row_values(1)
-        all_data = menu_sheet.get_all_values()
+        # Validate nutrition values before touching the sheet
+        for field, value in nutrition_updates.items():
+            if field == 'healthTier':
+                value = str(value).strip().lower()
+                if value not in HEALTH_TIER_POINTS:
+                    return {'error': f"healthTier must be one of: {', '.join(HEALTH_TIER_POINTS)}"}, 400
+            else:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    value = -1
+                if not math.isfinite(value) or value < 0:
+                    return {'error': f'{field} must be a non-negative number'}, 400
+                if value.is_integer():
+                    value = int(value)
+            nutrition_updates[field] = value
+
+        # Get all menu data (building the menu cache also makes sure the nutrition columns exist)
+        get_menu_items()
+        all_data = get_sheet_rows('menu')
+        headers = all_data[0] if all_data else []
         
         print(f"Menu headers: {headers}")
         print(f"Total rows: {len(all_data)}")
@@ -2971,17 +5241,29 @@ def update_menu_item():
             print(f"ERROR: ID column not found. Headers: {headers}")
             return {'error': 'ID column not found in menu sheet'}, 500
         
-        # Find soldOut column
-        soldout_col = None
-        for idx, norm_header in enumerate(normalized_headers):
-            if norm_header in ['soldout', 'sold out', 'sold-out']:
-                soldout_col = idx + 1
-                print(f"Found soldOut column at index {soldout_col}: '{headers[idx]}'")
-                break
+        cell_updates = []
         
-        if not soldout_col:
-            print(f"ERROR: SoldOut column not found. Headers: {headers}")
-            return {'error': 'SoldOut column not found in menu sheet'}, 500
+        if sold_out is not None:
+            # Find soldOut column
+            soldout_col = None
+            for idx, norm_header in enumerate(normalized_headers):
+                if norm_header in ['soldout', 'sold out', 'sold-out']:
+                    soldout_col = idx + 1
+                    print(f"Found soldOut column at index {soldout_col}: '{headers[idx]}'")
+                    break
+            
+            if not soldout_col:
+                print(f"ERROR: SoldOut column not found. Headers: {headers}")
+                return {'error': 'SoldOut column not found in menu sheet'}, 500
+            
+            # SoldOut status is stored as a TRUE/FALSE string
+            cell_updates.append((soldout_col, 'TRUE' if sold_out else 'FALSE'))
+        
+        for field, value in nutrition_updates.items():
+            header = MENU_NUTRITION_COLUMNS[field].lower()
+            if header not in normalized_headers:
+                return {'error': f'{MENU_NUTRITION_COLUMNS[field]} column not found in menu sheet'}, 500
+            cell_updates.append((normalized_headers.index(header) + 1, value))
         
         # Find the item row by searching the ID column
         item_row = None
@@ -2999,10 +5281,12 @@ def update_menu_item():
             print(f"Available IDs: {[str(row[id_col - 1]).strip() for row in all_data[1:] if len(row) >= id_col]}")
             return {'error': f'Menu item {item_id} not found'}, 404
         
-        # Update the soldOut status (TRUE/FALSE string)
-        new_value = 'TRUE' if sold_out else 'FALSE'
-        menu_sheet.update_cell(item_row, soldout_col, new_value)
-        print(f"✓ Updated row {item_row}, column {soldout_col} to '{new_value}'")
+        menu_sheet.batch_update([
+            {'range': rowcol_to_a1(item_row, col), 'values': [[value]]}
+            for col, value in cell_updates
+        ], value_input_option='USER_ENTERED')
+        bump_data_version('menu')
+        print(f"✓ Updated row {item_row}: {cell_updates}")
         
         return {'status': 'success'}, 200
         
@@ -3026,13 +5310,22 @@ def update_order_status():
         if not order_id or not new_status:
             return {'error': 'Missing orderId or status'}, 400
 
-        # Find the order in the sheet
-        cell = orders_sheet.find(order_id, in_column=1)  # Assuming OrderID is in column 1
-        if cell:
-            # Update the status column (assuming it's the last column)
-            headers = orders_sheet.row_values(1)
-            status_col = headers.index('Status') + 1 if 'Status' in headers else len(headers)
-            orders_sheet.update_cell(cell.row, status_col, new_status.capitalize())
+        # Find the order in the snapshot
+        orders_rows = get_sheet_rows('orders')
+        row_num = next((i for i, row in enumerate(orders_rows[1:], start=2)
+                        if row and str(row[0]).strip() == str(order_id).strip()), None)  # Assuming OrderID is in column 1
+        if row_num:
+            # Find the status column by name - epoch and pickupSlot now come after it
+            status_idx = order_columns(orders_rows[0])['status']
+            if status_idx is None:
+                raise ValueError("Orders sheet has no 'status' column")
+            status_col = status_idx + 1
+            orders_sheet.update_cell(row_num, status_col, new_status.capitalize())
+            version = bump_data_version('orders')
+            # Write through so the kitchen and dashboard aggregates move the order out of Pending
+            updated_row = list(orders_rows[row_num - 1]) + [''] * (status_col - len(orders_rows[row_num - 1]))
+            updated_row[status_col - 1] = new_status.capitalize()
+            cache_written_row('orders', orders_rows, row_num, updated_row, version)
             return {'success': True}, 200
         else:
             return {'error': 'Order not found'}, 404
@@ -3051,40 +5344,30 @@ def health_check():
             'sheets': {}
         }
         
-        # Check each sheet
-        if student_sheet:
-            student_count = len(student_sheet.get_all_records())
-            status['sheets']['students'] = f'{student_count} records'
-        else:
-            status['sheets']['students'] = 'not initialized'
-            status['status'] = 'unhealthy'
-        
-        if staff_sheet:
-            staff_count = len(staff_sheet.get_all_records())
-            status['sheets']['staff'] = f'{staff_count} records'
-        else:
-            status['sheets']['staff'] = 'not initialized'
-            status['status'] = 'unhealthy'
-        
-        if menu_sheet:
-            menu_count = len(menu_sheet.get_all_records())
-            status['sheets']['menu'] = f'{menu_count} items'
-        else:
-            status['sheets']['menu'] = 'not initialized'
-            status['status'] = 'unhealthy'
+        # Check each sheet - live reads (not the snapshot cache), fetched concurrently
+        sheet_checks = [
+            ('students', student_sheet, 'records', True),
+            ('staff', staff_sheet, 'records', True),
+            ('menu', menu_sheet, 'items', True),
+            ('orders', orders_sheet, 'orders', True),
+            ('teachers', teacher_sheet, 'records', False),
+        ]
+        results = run_concurrently({name: sheet.get_all_values for name, sheet, _, _ in sheet_checks if sheet})
         
-        if orders_sheet:
-            orders_count = len(orders_sheet.get_all_records())
-            status['sheets']['orders'] = f'{orders_count} orders'
-        else:
-            status['sheets']['orders'] = 'not initialized'
-            status['status'] = 'unhealthy'
+        for name, sheet, unit, required in sheet_checks:
+            if not sheet:
+                status['sheets'][name] = 'not initialized'
+                if required:
+                    status['status'] = 'unhealthy'
+                continue
+            result = results[name]
+            if isinstance(result, Exception):
+                raise result
+            status['sheets'][name] = f'{max(len(result) - 1, 0)} {unit}'
         
-        if teacher_sheet:
-            teacher_count = len(teacher_sheet.get_all_records())
-            status['sheets']['teachers'] = f'{teacher_count} records'
-        else:
-            status['sheets']['teachers'] = 'not initialized'
+        status['loginThrottle'] = get_login_throttle_stats()
+        status['circuitBreaker'] = get_circuit_breaker_state()
+        status['orderJournal'] = get_order_journal_state()
         
         return status, 200 if status['status'] == 'healthy' else 503
         
@@ -3092,7 +5375,8 @@ def health_check():
         print(f"Health check error: {e}")
         return {
             'status': 'unhealthy',
-            'error': str(e)
+            'error': str(e),
+            'circuitBreaker': get_circuit_breaker_state()
         }, 503
 
 # --- FEEDBACK FORM ---
@@ -3210,586 +5494,303 @@ def staff_feedback():
         traceback.print_exc()
         return render_template('staff_feedback.html', feedback_list=[], total=0)
 
-@app.route('/download_orders_pdf')
-def download_orders_pdf():
-    """Download orders as PDF with various time period options - with beautiful professional styling."""
-    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
-        return redirect(url_for('home'))
+# --- ORDER REPORTS ---
+# Reports are rendered as jobs: the worker that takes the request loads the report
+# data from its snapshots (fast), and ReportLab runs in a small process pool so a
+# big report never holds up order placement. The job ID is the cache key - period,
+# date range and the data versions behind them - so one rendered PDF on disk serves
+# every worker and every repeat download until the data changes. Job state lives
+# next to the PDFs, so any worker can answer a poll. Once order activity has been
+# quiet for REPORT_SETTLE_SECONDS, the common periods are pre-rendered once per change.
+REPORT_CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "canteen_report_cache"))
+REPORT_CACHE_MAX_FILES = int(os.environ.get("REPORT_CACHE_MAX_FILES", "50"))
+REPORT_JOB_WORKERS = int(os.environ.get("REPORT_JOB_WORKERS", "1"))
+REPORT_JOB_TIMEOUT = int(os.environ.get("REPORT_JOB_TIMEOUT", "300"))
+REPORT_SETTLE_SECONDS = int(os.environ.get("REPORT_SETTLE_SECONDS", "60"))
+REPORT_PRERENDER_PERIODS = ['day', 'week', 'month']
+REPORT_PRERENDER_CHECK_SECONDS = 30
+
+_report_pool = None
+_report_pool_lock = threading.Lock()
+_report_prerender_pid = None
+_report_prerender_lock = threading.Lock()
+
+def _get_report_pool():
+    """Returns this worker's report render processes, started on first use.
+
+    Spawned rather than forked, so the children never inherit this worker's threads,
+    locks or Sheets connections. Under gunicorn they import only the reports module;
+    under `python app.py` they also re-import this file as __mp_main__, which skips
+    the Sheets setup.
+    """
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is None:
+            _report_pool = ProcessPoolExecutor(max_workers=REPORT_JOB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _report_pool
+
+def report_cache_key(period, start_date='', end_date='', detail=False):
+    """Identifies a rendered report: what was asked for plus the versions of the data it reads."""
+    parts = [period, report_date_range(period, start_date, end_date), bool(detail),
+             *(get_data_version(key) for key in ('orders', 'dailysummary'))]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+def report_pdf_path(job_id):
+    return os.path.join(REPORT_CACHE_DIR, f"{job_id}.pdf")
+
+def _report_job_path(job_id):
+    return os.path.join(REPORT_CACHE_DIR, f"{job_id}.json")
+
+def _write_report_job(job):
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    path = _report_job_path(job['jobId'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+def _evict_report_cache():
+    """Keeps only the REPORT_CACHE_MAX_FILES most recent reports and job records."""
+    try:
+        for suffix in ('.pdf', '.json'):
+            paths = [os.path.join(REPORT_CACHE_DIR, name) for name in os.listdir(REPORT_CACHE_DIR) if name.endswith(suffix)]
+            paths.sort(key=os.path.getmtime, reverse=True)
+            for path in paths[REPORT_CACHE_MAX_FILES:]:
+                os.remove(path)
+    except OSError as e:
+        print(f"Warning: Could not evict old reports: {e}")
+
+def read_report_job(job_id):
+    """Returns a report job's record, or None for an unknown job ID.
+
+    A rendered PDF is only served while it is younger than SHEET_CACHE_MAX_STALENESS,
+    so edits made directly in the sheet (no version bump) still show up eventually.
+    """
+    if len(job_id) != 40 or any(c not in '0123456789abcdef' for c in job_id):
+        return None
+    try:
+        with open(_report_job_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job['status'] == 'ready':
+        try:
+            if time.time() - os.path.getmtime(report_pdf_path(job_id)) >= SHEET_CACHE_MAX_STALENESS:
+                return None
+        except OSError:
+            return None
+    elif job['status'] == 'pending' and time.time() - job['startedAt'] > REPORT_JOB_TIMEOUT:
+        job.update(status='failed', error='Report took too long to render')
+    return job
 
+def _finish_report_job(job, future):
+    """Stores a finished render (runs on the pool's result thread)."""
     try:
-        period = request.args.get('period', 'month')
-        
-        # Get all orders - with comprehensive debugging and position-based extraction
+        pdf_bytes = future.result()
+        path = report_pdf_path(job['jobId'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+        _write_report_job(dict(job, status='ready', finishedAt=time.time()))
+        _evict_report_cache()
+        print(f"✓ Rendered '{job['period']}' report in {(time.time() - job['startedAt']) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"❌ Report job {job['jobId']} failed: {e}")
+        _write_report_job(dict(job, status='failed', error=str(e)))
+
+def start_report_job(period, start_date='', end_date='', detail=False):
+    """Returns the job for a report, starting a render unless it is already cached or under way."""
+    job_id = report_cache_key(period, start_date, end_date, detail)
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(REPORT_CACHE_DIR, 'jobs.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            # Get raw values first to see exact structure
-            all_raw_values = orders_sheet.get_all_values()
-            print(f"\n=== PDF DOWNLOAD DEBUG ===")
-            print(f"Total rows in sheet (including header): {len(all_raw_values)}")
-            if all_raw_values:
-                print(f"Headers (row 1): {all_raw_values[0]}")
-                print(f"Number of header columns: {len(all_raw_values[0])}")
-                if len(all_raw_values) > 1:
-                    print(f"Sample data row (row 2): {all_raw_values[1][:8]}")
-                    print(f"Total sample row length: {len(all_raw_values[1])}")
-            
-            # Get records using the dict format
-            all_orders = orders_sheet.get_all_records()
-            print(f"Total records returned: {len(all_orders)}")
-            if all_orders:
-                print(f"First record keys: {list(all_orders[0].keys())}")
-                print(f"First record values: {all_orders[0]}")
-                
-                # Convert dict records to position-based format for consistency
-                # Expected order: orderId, timestamp, userId, userName, userClass, items, totalPrice, status
-                headers = list(all_orders[0].keys())
-                print(f"Column headers from sheet: {headers}")
-                
-                # Create a standardized version of orders - STRIP SPACES FROM ALL KEYS
-                standardized_orders = []
-                for order in all_orders:
-                    # Strip spaces from all keys first
-                    cleaned_order = {k.strip(): v for k, v in order.items()}
-                    
-                    # Try to extract using multiple column name variations
-                    standardized = {
-                        'orderId': cleaned_order.get('orderId', cleaned_order.get('Order ID', cleaned_order.get('OrderID', ''))),
-                        'timestamp': cleaned_order.get('timestamp', cleaned_order.get('Timestamp', cleaned_order.get('Time', ''))),
-                        'userId': cleaned_order.get('userId', cleaned_order.get('User ID', '')),
-                        'userName': cleaned_order.get('userName', cleaned_order.get('Name', cleaned_order.get('Student', ''))),
-                        'userClass': cleaned_order.get('userClass', cleaned_order.get('Class', cleaned_order.get('className', ''))),
-                        'items': cleaned_order.get('items', cleaned_order.get('Items', '')),
-                        'totalPrice': cleaned_order.get('totalPrice', cleaned_order.get('Total Price', cleaned_order.get('Price', 0))),
-                        'status': cleaned_order.get('status', cleaned_order.get('Status', 'Pending'))
-                    }
-                    standardized_orders.append(standardized)
-                
-                all_orders = standardized_orders
-            else:
-                print("⚠️ WARNING: No order records found - sheet might be empty or header-only")
-                all_orders = []
-        except Exception as e:
-            print(f"❌ Error fetching orders: {e}")
-            import traceback
-            traceback.print_exc()
-            all_orders = []
-        
-        # First, build a student lookup cache from Students sheet
-        student_lookup = {}
+            job = read_report_job(job_id)
+            if job and job['status'] in ('ready', 'pending'):
+                return job
+            period_name = REPORT_PERIOD_NAMES.get(period, 'Custom Range')
+            job = {
+                'jobId': job_id,
+                'status': 'pending',
+                'period': period,
+                'filename': f"Orders_{period_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                'startedAt': time.time(),
+            }
+            _write_report_job(job)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    try:
+        report = load_orders_report_data(period, start_date, end_date, detail)
+        future = _get_report_pool().submit(render_orders_report, report)
+    except Exception as e:
+        print(f"❌ Could not start report job {job_id}: {e}")
+        job = dict(job, status='failed', error=str(e))
+        _write_report_job(job)
+        return job
+    future.add_done_callback(lambda done: _finish_report_job(job, done))
+    return job
+
+def prerender_reports_if_settled():
+    """Starts jobs for the common reports once orders have changed and then stopped changing for a while.
+
+    The data versions last pre-rendered are kept with the report cache, so each
+    change is pre-rendered once across all workers, and an idle canteen renders nothing.
+    """
+    try:
+        last_change = os.path.getmtime(_data_version_path('orders'))
+    except OSError:
+        return  # no orders written yet
+    if time.time() - last_change < REPORT_SETTLE_SECONDS:
+        return
+    versions = [get_data_version('orders'), get_data_version('dailysummary')]
+    marker_path = os.path.join(REPORT_CACHE_DIR, 'prerendered_versions')  # not .json: eviction skips it
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(REPORT_CACHE_DIR, 'prerender.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            student_records = student_sheet.get_all_records()
-            for student in student_records:
-                user_id = student.get('userId', student.get('User ID', ''))
-                name = student.get('name', student.get('Name', ''))
-                className = student.get('className', student.get('Class', ''))
-                if user_id:
-                    student_lookup[user_id] = {'name': name, 'class': className}
-            print(f"Built student lookup with {len(student_lookup)} students")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not build student lookup: {e}")
-        
-        # Enhance orders with student details
-        for order in all_orders:
-            user_id = order.get('userId', '')
-            if user_id and user_id in student_lookup:
-                order['userName'] = student_lookup[user_id].get('name', 'N/A')
-                order['userClass'] = student_lookup[user_id].get('class', 'N/A')
-        
-        # Filter orders based on time period
-        filtered_orders = []
-        today = datetime.now()
-        
-        for order in all_orders:
-            order_date = None
-            timestamp_str = order.get('timestamp', '').strip()
-            
-            # Try multiple timestamp formats
-            formats_to_try = [
-                '%Y-%m-%d %H:%M:%S',  # Primary format (2025-12-20 14:30:45)
-                '%m/%d/%Y %H:%M:%S',  # Alternative format (12/20/2025 14:30:45)
-                '%Y-%m-%d',           # Date only
-                '%m/%d/%Y'            # Date only alternative
-            ]
-            
-            for fmt in formats_to_try:
-                try:
-                    order_date = datetime.strptime(timestamp_str, fmt)
-                    break
-                except ValueError:
-                    continue
-            
-            # Skip this order if we couldn't parse the timestamp
-            if order_date is None:
-                continue
-            
-            include_order = False
-            
-            if period == 'day':
-                include_order = order_date.date() == today.date()
-            elif period == 'week':
-                week_ago = today - timedelta(days=7)
-                include_order = order_date.date() >= week_ago.date()
-            elif period == 'month':
-                include_order = order_date.month == today.month and order_date.year == today.year
-            elif period == 'year':
-                include_order = order_date.year == today.year
-            elif period == 'custom':
-                start_date_str = request.args.get('start_date', '').strip()
-                end_date_str = request.args.get('end_date', '').strip()
-                try:
-                    start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    include_order = start_date <= order_date.date() <= end_date
-                except:
-                    include_order = False
-            
-            if include_order:
-                filtered_orders.append(order)
-        
-        # DEBUG: Print filtering results
-        print(f"DEBUG: Filtered {len(filtered_orders)} orders for period '{period}' from {len(all_orders)} total orders")
-        
-        # If no orders found for the period, include all orders with a note (fallback for date issues)
-        if not filtered_orders and all_orders:
-            print(f"DEBUG: No orders matched period filter. Including all {len(all_orders)} orders as fallback.")
-            filtered_orders = all_orders
-        
-        # Create PDF with professional margins
-        pdf_buffer = BytesIO()
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.6*inch, bottomMargin=0.6*inch, leftMargin=0.6*inch, rightMargin=0.6*inch)
-        
-        # Container for PDF elements
-        elements = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        
-        # Brand colors
-        PRIMARY_BLUE = '#00A9E0'
-        PRIMARY_MAGENTA = '#F000B8'
-        SECONDARY_BLUE = '#0088BB'
-        DARK_TEXT = '#1F2937'
-        LIGHT_BG = '#F0F9FC'
-        BORDER_COLOR = '#B3E5FC'
-        
-        period_names = {
-            'day': 'Today',
-            'week': 'Last 7 Days',
-            'month': 'This Month',
-            'year': 'This Year'
-        }
-        period_name = period_names.get(period, 'Custom Range')
-        
-        # ============ PROFESSIONAL COVER/HEADER SECTION ============
-        # Company brand header
-        header_style = ParagraphStyle(
-            'BrandHeader',
-            parent=styles['Heading1'],
-            fontSize=32,
-            textColor=colors.HexColor(PRIMARY_BLUE),
-            alignment=1,
-            spaceAfter=0,
-            fontName='Helvetica-Bold',
-            textTransform='uppercase',
-            letterSpacing=2
-        )
-        title = Paragraph("🍽️ CANTEEN ORDERS REPORT", header_style)
-        elements.append(title)
-        
-        # Decorative line
-        elements.append(Spacer(1, 0.05*inch))
-        line_data = [['═' * 80]]
-        line_table = Table(line_data, colWidths=[6.5*inch])
-        line_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor(PRIMARY_MAGENTA)),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        elements.append(line_table)
-        elements.append(Spacer(1, 0.15*inch))
-        
-        # Subtitle with period and styling
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Normal'],
-            fontSize=14,
-            textColor=colors.HexColor(PRIMARY_MAGENTA),
-            alignment=1,
-            spaceAfter=0,
-            fontName='Helvetica-Bold'
-        )
-        period_emoji = {
-            'day': '☀️',
-            'week': '📆',
-            'month': '📅',
-            'year': '🗓️'
-        }.get(period, '📋')
-        subtitle = Paragraph(f"{period_emoji} Period: <font color='{PRIMARY_BLUE}'>{period_name.upper()}</font>", subtitle_style)
-        elements.append(subtitle)
-        
-        # Date and time generated
-        generated_date = datetime.now().strftime('%B %d, %Y at %I:%M %p')
-        date_style = ParagraphStyle(
-            'DateStyle',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.HexColor('#6B7280'),
-            alignment=1,
-            spaceAfter=1
-        )
-        date_para = Paragraph(f"<i>Generated: {generated_date}</i>", date_style)
-        elements.append(date_para)
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Calculate comprehensive statistics
-        total = len(filtered_orders)
-        pending = len([o for o in filtered_orders if not o.get('status', o.get('Status')) or o.get('status', o.get('Status', '')).lower() == 'pending'])
-        delivered = len([o for o in filtered_orders if o.get('status', o.get('Status', '')).lower() == 'delivered'])
-        unable = len([o for o in filtered_orders if o.get('status', o.get('Status', '')).lower() == 'unable'])
-        cancelled = len([o for o in filtered_orders if o.get('status', o.get('Status', '')).lower() == 'cancelled'])
-        
-        # Calculate total revenue with better error handling
-        total_revenue = 0
-        for order in filtered_orders:
             try:
-                price = order.get('totalPrice', 0)
-                if isinstance(price, str) and price.strip():
-                    total_revenue += float(price)
-                elif isinstance(price, (int, float)):
-                    total_revenue += float(price)
-            except (ValueError, TypeError):
+                with open(marker_path) as f:
+                    if json.load(f).get('versions') == versions:
+                        return
+            except (OSError, ValueError):
                 pass
-        
-        # Calculate average order value
-        avg_order_value = total_revenue / total if total > 0 else 0
-        
-        # ============ ENHANCED STATISTICS SECTION ============
-        # Create comprehensive stats boxes with 2 rows
-        stats_data = [
-            ['📦 TOTAL ORDERS', '⏳ PENDING', '✓ DELIVERED', '✗ UNABLE', '💰 TOTAL REVENUE'],
-            [f'{total}', f'{pending}', f'{delivered}', f'{unable}', f'₹{total_revenue:.2f}']
-        ]
-        
-        stats_table = Table(stats_data, colWidths=[1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.3*inch])
-        stats_table.setStyle(TableStyle([
-            # Header with gradient colors
-            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor(PRIMARY_BLUE)),
-            ('BACKGROUND', (1, 0), (1, 0), colors.HexColor(SECONDARY_BLUE)),
-            ('BACKGROUND', (2, 0), (2, 0), colors.HexColor('#22C55E')),
-            ('BACKGROUND', (3, 0), (3, 0), colors.HexColor(PRIMARY_MAGENTA)),
-            ('BACKGROUND', (4, 0), (4, 0), colors.HexColor('#FF9800')),
-            
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            
-            # Data row - white with subtle border
-            ('BACKGROUND', (0, 1), (-1, 1), colors.white),
-            ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 1), (-1, 1), 14),
-            ('TEXTCOLOR', (0, 1), (-1, 1), colors.HexColor(DARK_TEXT)),
-            ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
-            ('VALIGN', (0, 1), (-1, 1), 'MIDDLE'),
-            ('TOPPADDING', (0, 1), (-1, 1), 12),
-            ('BOTTOMPADDING', (0, 1), (-1, 1), 12),
-            
-            # Professional borders
-            ('GRID', (0, 0), (-1, -1), 1.5, colors.HexColor(PRIMARY_BLUE)),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        elements.append(stats_table)
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Additional metrics row
-        metrics_data = [
-            ['📊 AVG ORDER VALUE', '⏱️ TIME PERIOD', '📈 SUCCESS RATE'],
-            [f'₹{avg_order_value:.2f}', f'{period_name}', f'{((delivered/(total if total > 0 else 1)) * 100):.1f}%']
+            tmp_path = f"{marker_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'versions': versions, 'prerenderedAt': time.time()}, f)
+            os.replace(tmp_path, marker_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    for period in REPORT_PRERENDER_PERIODS:
+        start_report_job(period)
+
+def _report_prerender_loop():
+    while True:
+        time.sleep(REPORT_PRERENDER_CHECK_SECONDS)
+        try:
+            prerender_reports_if_settled()
+        except Exception as e:
+            print(f"Warning: Report pre-render failed: {e}")
+
+def ensure_report_prerenderer():
+    """Starts this process's report pre-render thread."""
+    global _report_prerender_pid
+    with _report_prerender_lock:
+        if _report_prerender_pid == os.getpid():
+            return
+        _report_prerender_pid = os.getpid()
+    threading.Thread(target=_report_prerender_loop, name='report-prerender', daemon=True).start()
+
+@app.before_request
+def start_report_prerenderer():
+    ensure_report_prerenderer()
+
+def report_job_payload(job):
+    """The JSON the report job API returns for a job."""
+    payload = {
+        'jobId': job['jobId'],
+        'status': job['status'],
+        'statusUrl': url_for('get_report_job', job_id=job['jobId']),
+        'downloadUrl': url_for('download_report', job_id=job['jobId']),
+    }
+    if job.get('error'):
+        payload['error'] = job['error']
+    return payload
+
+def load_orders_report_data(period, start_date='', end_date='', detail=False):
+    """Collects what the orders report for a period shows, for reports.render_orders_report()."""
+    # Week, month, year and custom reports summarise DailySummary rollups (one row
+    # per day); today's report, or any report with detail=1, lists every order
+    date_range = report_date_range(period, start_date, end_date)
+    use_rollups = period != 'day' and not detail and date_range is not None
+    daily_summaries = []
+    filtered_orders = []
+    if use_rollups:
+        daily_summaries = get_daily_summaries(*date_range)
+        print(f"Summarising {len(daily_summaries)} days for period '{period}' ({date_range[0]} to {date_range[1]})")
+    elif date_range:
+        # One pass: the order aggregates already decoded every Orders row positionally
+        # into typed records (float prices, item lists, epoch timestamps), so the
+        # date index hands over just this period's orders. Copies, since the records
+        # are shared with the dashboards.
+        filtered_orders = [
+            dict(record, parsed_date=datetime.fromtimestamp(record['epoch']))
+            for _, record in orders_on_days(*date_range)
         ]
-        
-        metrics_table = Table(metrics_data, colWidths=[2.1*inch, 2.2*inch, 2.2*inch])
-        metrics_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(SECONDARY_BLUE)),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            
-            ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor(LIGHT_BG)),
-            ('FONTNAME', (0, 1), (-1, 1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, 1), 10),
-            ('TEXTCOLOR', (0, 1), (-1, 1), colors.HexColor(DARK_TEXT)),
-            ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
-            ('VALIGN', (0, 1), (-1, 1), 'MIDDLE'),
-            ('TOPPADDING', (0, 1), (-1, 1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, 1), 8),
-            
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor(BORDER_COLOR)),
-        ]))
-        
-        elements.append(metrics_table)
-        elements.append(Spacer(1, 0.35*inch))
-        
-        # Create table with orders segregated by date
-        if filtered_orders:
-            # Sort orders by date (newest first)
-            sorted_orders = []
-            for order in filtered_orders:
-                order_date = None
-                timestamp_str = order.get('timestamp', '').strip()
-                
-                # Try multiple timestamp formats
-                formats_to_try = [
-                    '%Y-%m-%d %H:%M:%S',  # Primary format
-                    '%m/%d/%Y %H:%M:%S',  # Alternative format
-                    '%Y-%m-%d',           # Date only
-                    '%m/%d/%Y'            # Date only alternative
-                ]
-                
-                for fmt in formats_to_try:
-                    try:
-                        order_date = datetime.strptime(timestamp_str, fmt)
-                        break
-                    except ValueError:
-                        continue
-                
-                # Fallback to current date if parsing fails
-                if order_date is None:
-                    order_date = datetime.now()
-                
-                order['parsed_date'] = order_date
-            
-            # Sort by date descending
-            sorted_orders = sorted(filtered_orders, key=lambda x: x.get('parsed_date', datetime.now()), reverse=True)
-            
-            # Group orders by date
-            orders_by_date = {}
-            for order in sorted_orders:
-                order_date = order.get('parsed_date', datetime.now())
-                date_key = order_date.strftime('%B %d, %Y')  # e.g., "December 20, 2025"
-                if date_key not in orders_by_date:
-                    orders_by_date[date_key] = []
-                orders_by_date[date_key].append(order)
-            
-            # Display date ranges info with styling
-            if sorted_orders:
-                earliest_date = sorted_orders[-1].get('parsed_date', datetime.now()).strftime('%B %d, %Y')
-                latest_date = sorted_orders[0].get('parsed_date', datetime.now()).strftime('%B %d, %Y')
-                date_range_text = f"<font size=9 color='{PRIMARY_BLUE}'><b>📆 Date Range:</b> <i>{earliest_date} to {latest_date}</i></font>"
-                date_range = Paragraph(date_range_text, styles['Normal'])
-                elements.append(date_range)
-                elements.append(Spacer(1, 0.2*inch))
-            
-            # Section header for detailed orders
-            section_header = Paragraph(
-                "<font size=12 color='{}' face='Helvetica-Bold'>📋 DETAILED ORDERS BY DATE</font>".format(PRIMARY_BLUE),
-                styles['Normal']
-            )
-            elements.append(section_header)
-            elements.append(Spacer(1, 0.15*inch))
-            
-            # Create tables for each date group
-            for date_key in orders_by_date:
-                # Date section header with modern styling
-                daily_count = len(orders_by_date[date_key])
-                date_header_style = ParagraphStyle(
-                    'DateHeader',
-                    parent=styles['Normal'],
-                    fontSize=10,
-                    textColor=colors.HexColor(PRIMARY_BLUE),
-                    fontName='Helvetica-Bold',
-                    spaceAfter=2,
-                    leftIndent=6
-                )
-                date_header = Paragraph(f"📅 {date_key.upper()} · {daily_count} order{'s' if daily_count != 1 else ''}", date_header_style)
-                elements.append(date_header)
-                elements.append(Spacer(1, 0.08*inch))
-                
-                # Create table for this date with professional headers
-                table_data = [['Order ID', 'Customer Name', 'Class', 'Items', 'Amount', 'Status']]
-                
-                daily_total = 0
-                for order in orders_by_date[date_key]:
-                    try:
-                        order_date = order.get('parsed_date', datetime.now())
-                        date_str = order_date.strftime('%m/%d/%Y')
-                        
-                        # Get customer name
-                        customer_name = str(order.get('userName', 'N/A'))[:20]
-                        
-                        # Get items - handle various formats
-                        items = order.get('items', '')
-                        items_display = items
-                        if isinstance(items, list):
-                            items_str = ', '.join([f"{i.get('name', 'Item')} ({i.get('quantity', 1)})" for i in items if i])
-                        else:
-                            items_str = str(items) if items else 'No items recorded'
-                        
-                        # Truncate items to fit but keep it readable
-                        if len(items_str) > 30:
-                            items_str = items_str[:27] + '...'
-                        
-                        # Show items count
-                        items_count = 0
-                        if isinstance(items, list):
-                            items_count = len(items)
-                        elif items_str and items_str != 'No items recorded':
-                            items_count = len([x for x in str(items).split(',') if x.strip()])
-                        
-                        items_display = f"📦 {items_count} items" if items_count > 0 else items_str
-                        
-                        # Get price - handle string conversion
-                        try:
-                            price_val = order.get('totalPrice', 0)
-                            if isinstance(price_val, str):
-                                price = float(price_val) if price_val.strip() else 0
-                            else:
-                                price = float(price_val) if price_val else 0
-                        except (ValueError, AttributeError, TypeError):
-                            price = 0
-                        daily_total += price
-                        
-                        # Get payment status (assuming from 'status' field) - use simple paid/unpaid logic
-                        order_status = order.get('status', 'Pending')
-                        if not order_status:
-                            order_status = 'Pending'
-                        
-                        # Determine payment status (for demo: if order status is 'Delivered', mark as Paid, else Unpaid)
-                        # You may need to adjust this based on your actual data structure
-                        payment_status = 'Paid' if order_status.lower() == 'delivered' else 'Unpaid'
-                        
-                        # Build row with status badges and emojis
-                        status_emoji = {'pending': '⏳', 'delivered': '✓', 'unable': '❌', 'cancelled': '🚫'}.get(order_status.lower(), '❓')
-                        payment_emoji = '✓' if payment_status == 'Paid' else '⏳'
-                        
-                        table_data.append([
-                            date_str,
-                            customer_name,
-                            f"₹{price:.2f}",
-                            f"{payment_emoji} {payment_status}",
-                            items_str,
-                            f"{status_emoji} {order_status.capitalize()[:10]}"
-                        ])
-                    except Exception as e:
-                        print(f"Error processing order: {e}")
-                        continue
-                
-                # Add daily total row
-                table_data.append(['', '', f"<b>₹{daily_total:.2f}</b>", '', 'Daily Total', ''])
-                
-                # Create table with proper column widths
-                col_widths = [0.85*inch, 1.3*inch, 0.85*inch, 1.1*inch, 1.5*inch, 1.0*inch]
-                table = Table(table_data, colWidths=col_widths)
-                
-                # Beautiful modern styling with brand colors and status badges
-                style_list = [
-                    # Header row - blue background with white text
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(PRIMARY_BLUE)),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                    ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                    ('TOPPADDING', (0, 0), (-1, 0), 10),
-                    
-                    # Data rows - light background for readability
-                    ('FONTSIZE', (0, 1), (-1, -2), 8),
-                    ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor(LIGHT_BG)]),
-                    
-                    # Column alignments
-                    ('ALIGN', (0, 1), (0, -2), 'CENTER'),  # Date - center
-                    ('ALIGN', (1, 1), (1, -2), 'LEFT'),    # Customer - left
-                    ('ALIGN', (2, 1), (2, -2), 'RIGHT'),   # Total - right
-                    ('ALIGN', (3, 1), (3, -2), 'CENTER'),  # Payment Status - center
-                    ('ALIGN', (4, 1), (4, -2), 'LEFT'),    # Items - left
-                    ('ALIGN', (5, 1), (5, -2), 'CENTER'),  # Order Status - center
-                    
-                    # Padding for data rows
-                    ('LEFTPADDING', (0, 1), (-1, -1), 6),
-                    ('RIGHTPADDING', (0, 1), (-1, -1), 6),
-                    ('TOPPADDING', (0, 1), (-1, -1), 7),
-                    ('BOTTOMPADDING', (0, 1), (-1, -1), 7),
-                    
-                    # Total row - magenta background with white text
-                    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor(PRIMARY_MAGENTA)),
-                    ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
-                    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, -1), (-1, -1), 8),
-                    ('ALIGN', (0, -1), (-1, -1), 'CENTER'),
-                    ('TOPPADDING', (0, -1), (-1, -1), 8),
-                    ('BOTTOMPADDING', (0, -1), (-1, -1), 8),
-                    
-                    # Grid lines - subtle light blue
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0F2FE')),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]
-                
-                table.setStyle(TableStyle(style_list))
-                elements.append(table)
-                elements.append(Spacer(1, 0.25*inch))
-            
-            # Beautiful footer with separator
-            elements.append(Spacer(1, 0.2*inch))
-            total_amount = sum([float(o.get('totalPrice', 0)) if o.get('totalPrice') else 0 for o in sorted_orders])
-            
-            # Footer stats row
-            footer_data = [
-                [f'📊 Total Orders: {total}', f'💵 Total Revenue: ₹{total_amount:.2f}']
-            ]
-            footer_table = Table(footer_data, colWidths=[3.25*inch, 3.25*inch])
-            footer_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(PRIMARY_BLUE)),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
-                ('TOPPADDING', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor(PRIMARY_BLUE)),
-            ]))
-            elements.append(footer_table)
-            
-            # Brand footer
-            elements.append(Spacer(1, 0.15*inch))
-            brand_footer = Paragraph(
-                f"<font size=8 color='{PRIMARY_BLUE}'><b>🍽️ Canteen Management System</b> | Report generated {datetime.now().strftime('%I:%M %p')}</font>",
-                ParagraphStyle('BrandFooter', parent=styles['Normal'], alignment=1)
-            )
-            elements.append(brand_footer)
-        else:
-            # Beautiful "no orders" message
-            elements.append(Spacer(1, 0.5*inch))
-            no_orders_text = Paragraph(
-                f"<font size=18 color='{PRIMARY_MAGENTA}'><b>📭 No Orders Found</b></font><br/><br/>"
-                f"<font size=12 color='{DARK_TEXT}'>No orders are available for the selected period.</font><br/>"
-                f"<font size=10 color='#6B7280'><i>Please select a different time range or check back later.</i></font>",
-                ParagraphStyle('NoOrders', parent=styles['Normal'], alignment=1)
-            )
-            elements.append(no_orders_text)
-            elements.append(Spacer(1, 0.5*inch))
-        
-        # Build PDF
-        doc.build(elements)
-        pdf_buffer.seek(0)
-        
-        filename = f"Orders_{period_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
-        return send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
+        print(f"Listing {len(filtered_orders)} orders for period '{period}' ({date_range[0]} to {date_range[1]})")
+    
+    return {
+        'period': period,
+        'periodName': REPORT_PERIOD_NAMES.get(period, 'Custom Range'),
+        'useRollups': use_rollups,
+        'dailySummaries': daily_summaries,
+        'orders': filtered_orders,
+    }
+
+
+@app.route('/api/reports', methods=['POST'])
+def create_report_job():
+    """API endpoint to start (or find) an orders report job (staff/teacher only)."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    data = request.get_json(silent=True) or {}
+    period = str(data.get('period', 'month'))
+    start_date = str(data.get('startDate', ''))
+    end_date = str(data.get('endDate', ''))
+    if report_date_range(period, start_date, end_date) is None:
+        return {'error': 'Choose day, week, month, year, or custom with valid start and end dates'}, 400
+
+    job = start_report_job(period, start_date, end_date, bool(data.get('detail')))
+    return report_job_payload(job), 200 if job['status'] == 'ready' else 202
+
+@app.route('/api/reports/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """API endpoint to poll a report job."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    job = read_report_job(job_id)
+    if job is None:
+        return {'error': 'Report not found - please request it again'}, 404
+    return report_job_payload(job), 200
+
+@app.route('/reports/<job_id>')
+def download_report(job_id):
+    """Sends a finished report, or a page that refreshes itself until the report is ready."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return redirect(url_for('home'))
+
+    job = read_report_job(job_id)
+    if job is None:
+        return "Report not found - please download it again from the orders dashboard.", 404
+    if job['status'] == 'failed':
+        return "Error generating PDF", 500
+    if job['status'] == 'pending':
+        return render_template('report_pending.html', job=job), 202
+
+    return send_file(
+        report_pdf_path(job_id),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=job['filename']
+    )
+
+@app.route('/download_orders_pdf')
+def download_orders_pdf():
+    """Download orders as PDF with various time period options - rendered as a report job."""
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return redirect(url_for('home'))
+
+    try:
+        job = start_report_job(
+            request.args.get('period', 'month'),
+            request.args.get('start_date', ''),
+            request.args.get('end_date', ''),
+            request.args.get('detail') == '1',
         )
+        return redirect(url_for('download_report', job_id=job['jobId']))
     
     except Exception as e:
         print(f"PDF Download Error: {e}")
@@ -3797,6 +5798,40 @@ def download_orders_pdf():
         traceback.print_exc()
         return "Error generating PDF", 500
 
+ORDER_EXPORT_FORMATS = {
+    'csv': (iter_orders_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (iter_orders_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+@app.route('/api/orders/export', methods=['GET'])
+def export_orders():
+    """Streams every order in a period as CSV or XLSX (staff/teacher only).
+
+    Same period/start_date/end_date parameters as the PDF. Rows come from the
+    pre-parsed order records via the date index and are written out in chunks,
+    so a year's export never sits in memory as one file.
+    """
+    if not session.get('logged_in') or session.get('user_type') not in ['staff', 'teacher']:
+        return {'error': 'Unauthorized'}, 401
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ORDER_EXPORT_FORMATS:
+        return {'error': 'format must be csv or xlsx'}, 400
+    period = request.args.get('period', 'month')
+    date_range = report_date_range(period, request.args.get('start_date', ''), request.args.get('end_date', ''))
+    if date_range is None:
+        return {'error': 'Choose day, week, month, year, or custom with valid start and end dates'}, 400
+
+    orders = [record for _, record in orders_on_days(*date_range)]
+    print(f"Exporting {len(orders)} orders as {export_format} ({date_range[0]} to {date_range[1]})")
+    write_export, mimetype = ORDER_EXPORT_FORMATS[export_format]
+    filename = f"Orders_{date_range[0]}_to_{date_range[1]}.{export_format}"
+    return Response(
+        write_export(orders),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 # --- ERROR HANDLERS ---
 @app.errorhandler(404)
 def not_found(e):
@@ -3825,6 +5860,45 @@ def handle_exception(e):
         return {'error': 'Server error', 'message': str(e)}, 500
     return f"An error occurred: {str(e)}", 500
 
+# --- PRELOAD / FORK SUPPORT ---
+# With gunicorn's preload_app (see gunicorn.conf.py) the master imports the app,
+# warms the shared caches once and then forks, so every worker starts with the
+# same menu, directories and orders in copy-on-write memory. Each worker then
+# needs its own HTTP connections and threads, which post_fork sets up.
+
+def warm_shared_caches():
+    """Loads the sheets and derived caches every worker needs, in one batched read."""
+    if spreadsheet is None:
+        print("Skipping cache warm-up: Google Sheets not initialized")
+        return
+    started = time.monotonic()
+    try:
+        batch_get_sheet_rows('menu', 'students', 'teachers', 'staff', 'userhealth', 'orders')
+        get_menu_items()
+        get_student_row_index()
+        for role in CREDENTIAL_SOURCES:
+            get_credential_table(role)
+        print(f"✓ Warmed shared caches in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        # Workers simply fill their caches on demand instead
+        print(f"Warning: Cache warm-up failed: {e}")
+
+def reinitialize_after_fork():
+    """Gives a freshly forked worker its own Sheets connections and background threads."""
+    global _sheet_fetch_pool, _report_pool
+    # The master's pool threads and pooled sockets don't exist (or mustn't be shared) here
+    _sheet_fetch_pool = None
+    _report_pool = None
+    with _sheet_cache_lock:
+        _sheet_refreshing.clear()
+    if sheets_client is not None and sheets_credentials is not None:
+        sheets_client.http_client.session = build_sheets_session(sheets_credentials)
+        start_token_refresher()
+    ensure_order_flusher()
+    ensure_daily_rollup_scheduler()
+    ensure_report_prerenderer()
+    print(f"✓ Worker {os.getpid()} reconnected to Google Sheets")
+
 # --- RUN APP ---
 # --- ERROR HANDLERS ---
 @app.errorhandler(404)
@@ -0,0 +1,26 @@
+# Gunicorn settings, picked up automatically from the working directory.
+# Command-line flags (e.g. --workers 2 --timeout 120) still take precedence.
+import gc
+import os
+
+# Load the app once in the master so the warmed caches are shared copy-on-write
+# by all workers. Set GUNICORN_PRELOAD=0 to load the app in each worker instead.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    """Runs in the master before any worker is forked."""
+    if not preload_app:
+        return
+    import app
+    app.warm_shared_caches()
+    # Keep the cyclic GC from touching (and so copying) the preloaded objects in workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Runs in each new worker right after it is forked from the master."""
+    if not preload_app:
+        return
+    import app
+    app.reinitialize_after_fork()
@@ -0,0 +1,622 @@
+"""Orders report PDF rendering and CSV/XLSX order exports.
+
+Kept free of Flask and Google Sheets so report jobs can render in a separate
+process: the app loads the report data and hands it over as plain dicts.
+"""
+import csv
+import math
+import re
+import zipfile
+from collections import Counter
+from datetime import datetime
+from io import BytesIO, StringIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+REPORT_PERIOD_NAMES = {'day': 'Today', 'week': 'Last 7 Days', 'month': 'This Month', 'year': 'This Year'}
+
+
+def report_totals(report):
+    """Order count, status counts and revenue for a report, from its rollups or its orders."""
+    if report['useRollups']:
+        summaries = report['dailySummaries']
+        return {key: sum(d[key] for d in summaries) for key in ('orders', 'pending', 'delivered', 'undeliverable', 'revenue')}
+    orders = report['orders']
+    status_counts = Counter(o['status'] for o in orders)
+    return {
+        'orders': len(orders),
+        'pending': status_counts['pending'],
+        'delivered': status_counts['delivered'],
+        'undeliverable': status_counts['undeliverable'],
+        'revenue': sum(o['totalPrice'] for o in orders),
+    }
+
+
+def render_orders_report(report):
+    """Renders the orders report PDF - with beautiful professional styling - and returns its bytes.
+
+    `report` comes from the app's load_orders_report_data(): the period, whether it
+    summarises daily rollups, the daily summaries and the period's orders. Orders are
+    the app's typed order records (lowercase status, float totalPrice, items as
+    [{name, quantity}]) plus a parsed_date datetime.
+    """
+    period = report['period']
+    use_rollups = report['useRollups']
+    daily_summaries = report['dailySummaries']
+    filtered_orders = report['orders']
+
+    # Create PDF with professional margins
+    pdf_buffer = BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.6*inch, bottomMargin=0.6*inch, leftMargin=0.6*inch, rightMargin=0.6*inch)
+    
+    # Container for PDF elements
+    elements = []
+    
+    # Styles
+    styles = getSampleStyleSheet()
+    
+    # Brand colors
+    PRIMARY_BLUE = '#00A9E0'
+    PRIMARY_MAGENTA = '#F000B8'
+    SECONDARY_BLUE = '#0088BB'
+    DARK_TEXT = '#1F2937'
+    LIGHT_BG = '#F0F9FC'
+    BORDER_COLOR = '#B3E5FC'
+    
+    period_name = REPORT_PERIOD_NAMES.get(period, 'Custom Range')
+    
+    # ============ PROFESSIONAL COVER/HEADER SECTION ============
+    # Company brand header
+    header_style = ParagraphStyle(
+        'BrandHeader',
+        parent=styles['Heading1'],
+        fontSize=32,
+        textColor=colors.HexColor(PRIMARY_BLUE),
+        alignment=1,
+        spaceAfter=0,
+        fontName='Helvetica-Bold',
+        textTransform='uppercase',
+        letterSpacing=2
+    )
+    title = Paragraph("🍽️ CANTEEN ORDERS REPORT", header_style)
+    elements.append(title)
+    
+    # Decorative line
+    elements.append(Spacer(1, 0.05*inch))
+    line_data = [['═' * 80]]
+    line_table = Table(line_data, colWidths=[6.5*inch])
+    line_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor(PRIMARY_MAGENTA)),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    elements.append(line_table)
+    elements.append(Spacer(1, 0.15*inch))
+    
+    # Subtitle with period and styling
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Normal'],
+        fontSize=14,
+        textColor=colors.HexColor(PRIMARY_MAGENTA),
+        alignment=1,
+        spaceAfter=0,
+        fontName='Helvetica-Bold'
+    )
+    period_emoji = {
+        'day': '☀️',
+        'week': '📆',
+        'month': '📅',
+        'year': '🗓️'
+    }.get(period, '📋')
+    subtitle = Paragraph(f"{period_emoji} Period: <font color='{PRIMARY_BLUE}'>{period_name.upper()}</font>", subtitle_style)
+    elements.append(subtitle)
+    
+    # Date and time generated
+    generated_date = datetime.now().strftime('%B %d, %Y at %I:%M %p')
+    date_style = ParagraphStyle(
+        'DateStyle',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.HexColor('#6B7280'),
+        alignment=1,
+        spaceAfter=1
+    )
+    date_para = Paragraph(f"<i>Generated: {generated_date}</i>", date_style)
+    elements.append(date_para)
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Calculate comprehensive statistics
+    totals = report_totals(report)
+    total = totals['orders']
+    pending = totals['pending']
+    delivered = totals['delivered']
+    unable = totals['undeliverable']
+    total_revenue = totals['revenue']
+    
+    # Calculate average order value
+    avg_order_value = total_revenue / total if total > 0 else 0
+    
+    # ============ ENHANCED STATISTICS SECTION ============
+    # Create comprehensive stats boxes with 2 rows
+    stats_data = [
+        ['📦 TOTAL ORDERS', '⏳ PENDING', '✓ DELIVERED', '✗ UNABLE', '💰 TOTAL REVENUE'],
+        [f'{total}', f'{pending}', f'{delivered}', f'{unable}', f'₹{total_revenue:.2f}']
+    ]
+    
+    stats_table = Table(stats_data, colWidths=[1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.3*inch])
+    stats_table.setStyle(TableStyle([
+        # Header with gradient colors
+        ('BACKGROUND', (0, 0), (0, 0), colors.HexColor(PRIMARY_BLUE)),
+        ('BACKGROUND', (1, 0), (1, 0), colors.HexColor(SECONDARY_BLUE)),
+        ('BACKGROUND', (2, 0), (2, 0), colors.HexColor('#22C55E')),
+        ('BACKGROUND', (3, 0), (3, 0), colors.HexColor(PRIMARY_MAGENTA)),
+        ('BACKGROUND', (4, 0), (4, 0), colors.HexColor('#FF9800')),
+        
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        
+        # Data row - white with subtle border
+        ('BACKGROUND', (0, 1), (-1, 1), colors.white),
+        ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 1), (-1, 1), 14),
+        ('TEXTCOLOR', (0, 1), (-1, 1), colors.HexColor(DARK_TEXT)),
+        ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
+        ('VALIGN', (0, 1), (-1, 1), 'MIDDLE'),
+        ('TOPPADDING', (0, 1), (-1, 1), 12),
+        ('BOTTOMPADDING', (0, 1), (-1, 1), 12),
+        
+        # Professional borders
+        ('GRID', (0, 0), (-1, -1), 1.5, colors.HexColor(PRIMARY_BLUE)),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ]))
+    
+    elements.append(stats_table)
+    elements.append(Spacer(1, 0.2*inch))
+    
+    # Additional metrics row
+    metrics_data = [
+        ['📊 AVG ORDER VALUE', '⏱️ TIME PERIOD', '📈 SUCCESS RATE'],
+        [f'₹{avg_order_value:.2f}', f'{period_name}', f'{((delivered/(total if total > 0 else 1)) * 100):.1f}%']
+    ]
+    
+    metrics_table = Table(metrics_data, colWidths=[2.1*inch, 2.2*inch, 2.2*inch])
+    metrics_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(SECONDARY_BLUE)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        
+        ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor(LIGHT_BG)),
+        ('FONTNAME', (0, 1), (-1, 1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, 1), 10),
+        ('TEXTCOLOR', (0, 1), (-1, 1), colors.HexColor(DARK_TEXT)),
+        ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
+        ('VALIGN', (0, 1), (-1, 1), 'MIDDLE'),
+        ('TOPPADDING', (0, 1), (-1, 1), 8),
+        ('BOTTOMPADDING', (0, 1), (-1, 1), 8),
+        
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor(BORDER_COLOR)),
+    ]))
+    
+    elements.append(metrics_table)
+    elements.append(Spacer(1, 0.35*inch))
+    
+    # Rollup reports: one row per day plus the most popular items of the period
+    if use_rollups and daily_summaries:
+        first_day = datetime.strptime(daily_summaries[0]['date'], '%Y-%m-%d').strftime('%B %d, %Y')
+        last_day = datetime.strptime(daily_summaries[-1]['date'], '%Y-%m-%d').strftime('%B %d, %Y')
+        elements.append(Paragraph(f"<font size=9 color='{PRIMARY_BLUE}'><b>📆 Date Range:</b> <i>{first_day} to {last_day}</i></font>", styles['Normal']))
+        elements.append(Spacer(1, 0.2*inch))
+        elements.append(Paragraph(
+            "<font size=12 color='{}' face='Helvetica-Bold'>📋 DAILY SUMMARY</font>".format(PRIMARY_BLUE),
+            styles['Normal']
+        ))
+        elements.append(Spacer(1, 0.15*inch))
+
+        period_items = Counter()
+        table_data = [['Date', 'Orders', 'Delivered', 'Pending', 'Unable', 'Revenue', 'Top Item']]
+        for summary in reversed(daily_summaries):
+            period_items.update(summary['items'])
+            top_item = summary['items'].most_common(1)
+            table_data.append([
+                datetime.strptime(summary['date'], '%Y-%m-%d').strftime('%m/%d/%Y'),
+                str(summary['orders']),
+                str(summary['delivered']),
+                str(summary['pending']),
+                str(summary['undeliverable']),
+                f"₹{summary['revenue']:.2f}",
+                f"{top_item[0][0][:18]} ({top_item[0][1]})" if top_item else '-',
+            ])
+        table_data.append(['Total', str(total), str(delivered), str(pending), str(unable), f"₹{total_revenue:.2f}", ''])
+
+        summary_table = Table(table_data, colWidths=[0.95*inch, 0.7*inch, 0.8*inch, 0.75*inch, 0.7*inch, 1.0*inch, 1.7*inch], repeatRows=1)
+        summary_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(PRIMARY_BLUE)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor(LIGHT_BG)]),
+            ('ALIGN', (0, 0), (-2, -1), 'CENTER'),
+            ('ALIGN', (-1, 1), (-1, -1), 'LEFT'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor(PRIMARY_MAGENTA)),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0F2FE')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+        elements.append(summary_table)
+        elements.append(Spacer(1, 0.3*inch))
+
+        elements.append(Paragraph(
+            "<font size=12 color='{}' face='Helvetica-Bold'>⭐ POPULAR ITEMS</font>".format(PRIMARY_BLUE),
+            styles['Normal']
+        ))
+        elements.append(Spacer(1, 0.15*inch))
+        items_data = [['Item', 'Quantity']] + [[name[:40], str(qty)] for name, qty in period_items.most_common(10)]
+        items_table = Table(items_data, colWidths=[4.5*inch, 2.0*inch])
+        items_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(SECONDARY_BLUE)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor(LIGHT_BG)]),
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor(BORDER_COLOR)),
+        ]))
+        elements.append(items_table)
+
+        elements.append(Spacer(1, 0.15*inch))
+        elements.append(Paragraph(
+            f"<font size=8 color='{PRIMARY_BLUE}'><b>🍽️ Canteen Management System</b> | Report generated {datetime.now().strftime('%I:%M %p')}</font>",
+            ParagraphStyle('BrandFooter', parent=styles['Normal'], alignment=1)
+        ))
+    # Create table with orders segregated by date
+    elif filtered_orders:
+        # Sort by date descending
+        sorted_orders = sorted(filtered_orders, key=lambda x: x['parsed_date'], reverse=True)
+        
+        # Group orders by date
+        orders_by_date = {}
+        for order in sorted_orders:
+            date_key = order['parsed_date'].strftime('%B %d, %Y')  # e.g., "December 20, 2025"
+            orders_by_date.setdefault(date_key, []).append(order)
+        
+        # Display date ranges info with styling
+        if sorted_orders:
+            earliest_date = sorted_orders[-1]['parsed_date'].strftime('%B %d, %Y')
+            latest_date = sorted_orders[0]['parsed_date'].strftime('%B %d, %Y')
+            date_range_text = f"<font size=9 color='{PRIMARY_BLUE}'><b>📆 Date Range:</b> <i>{earliest_date} to {latest_date}</i></font>"
+            date_range = Paragraph(date_range_text, styles['Normal'])
+            elements.append(date_range)
+            elements.append(Spacer(1, 0.2*inch))
+        
+        # Section header for detailed orders
+        section_header = Paragraph(
+            "<font size=12 color='{}' face='Helvetica-Bold'>📋 DETAILED ORDERS BY DATE</font>".format(PRIMARY_BLUE),
+            styles['Normal']
+        )
+        elements.append(section_header)
+        elements.append(Spacer(1, 0.15*inch))
+        
+        # Create tables for each date group
+        for date_key in orders_by_date:
+            # Date section header with modern styling
+            daily_count = len(orders_by_date[date_key])
+            date_header_style = ParagraphStyle(
+                'DateHeader',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor(PRIMARY_BLUE),
+                fontName='Helvetica-Bold',
+                spaceAfter=2,
+                leftIndent=6
+            )
+            date_header = Paragraph(f"📅 {date_key.upper()} · {daily_count} order{'s' if daily_count != 1 else ''}", date_header_style)
+            elements.append(date_header)
+            elements.append(Spacer(1, 0.08*inch))
+            
+            # Create table for this date with professional headers
+            table_data = [['Order ID', 'Customer Name', 'Class', 'Items', 'Amount', 'Status']]
+            
+            daily_total = 0
+            for order in orders_by_date[date_key]:
+                try:
+                    date_str = order['parsed_date'].strftime('%m/%d/%Y')
+                    
+                    # Get customer name
+                    customer_name = (order['userName'] or 'N/A')[:20]
+                    
+                    # Items as "name (qty)"
+                    items_str = ', '.join(f"{i['name']} ({i['quantity']})" for i in order['items']) or 'No items recorded'
+                    
+                    # Truncate items to fit but keep it readable
+                    if len(items_str) > 30:
+                        items_str = items_str[:27] + '...'
+                    
+                    price = order['totalPrice']
+                    daily_total += price
+                    
+                    order_status = order['status']
+                    
+                    # Determine payment status (for demo: if order status is 'Delivered', mark as Paid, else Unpaid)
+                    # You may need to adjust this based on your actual data structure
+                    payment_status = 'Paid' if order_status.lower() == 'delivered' else 'Unpaid'
+                    
+                    # Build row with status badges and emojis
+                    status_emoji = {'pending': '⏳', 'delivered': '✓', 'undeliverable': '❌', 'cancelled': '🚫'}.get(order_status.lower(), '❓')
+                    payment_emoji = '✓' if payment_status == 'Paid' else '⏳'
+                    
+                    table_data.append([
+                        date_str,
+                        customer_name,
+                        f"₹{price:.2f}",
+                        f"{payment_emoji} {payment_status}",
+                        items_str,
+                        f"{status_emoji} {order_status.capitalize()[:10]}"
+                    ])
+                except Exception as e:
+                    print(f"Error processing order: {e}")
+                    continue
+            
+            # Add daily total row
+            table_data.append(['', '', f"<b>₹{daily_total:.2f}</b>", '', 'Daily Total', ''])
+            
+            # Create table with proper column widths
+            col_widths = [0.85*inch, 1.3*inch, 0.85*inch, 1.1*inch, 1.5*inch, 1.0*inch]
+            table = Table(table_data, colWidths=col_widths)
+            
+            # Beautiful modern styling with brand colors and status badges
+            style_list = [
+                # Header row - blue background with white text
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(PRIMARY_BLUE)),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+                ('TOPPADDING', (0, 0), (-1, 0), 10),
+                
+                # Data rows - light background for readability
+                ('FONTSIZE', (0, 1), (-1, -2), 8),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor(LIGHT_BG)]),
+                
+                # Column alignments
+                ('ALIGN', (0, 1), (0, -2), 'CENTER'),  # Date - center
+                ('ALIGN', (1, 1), (1, -2), 'LEFT'),    # Customer - left
+                ('ALIGN', (2, 1), (2, -2), 'RIGHT'),   # Total - right
+                ('ALIGN', (3, 1), (3, -2), 'CENTER'),  # Payment Status - center
+                ('ALIGN', (4, 1), (4, -2), 'LEFT'),    # Items - left
+                ('ALIGN', (5, 1), (5, -2), 'CENTER'),  # Order Status - center
+                
+                # Padding for data rows
+                ('LEFTPADDING', (0, 1), (-1, -1), 6),
+                ('RIGHTPADDING', (0, 1), (-1, -1), 6),
+                ('TOPPADDING', (0, 1), (-1, -1), 7),
+                ('BOTTOMPADDING', (0, 1), (-1, -1), 7),
+                
+                # Total row - magenta background with white text
+                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor(PRIMARY_MAGENTA)),
+                ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
+                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, -1), (-1, -1), 8),
+                ('ALIGN', (0, -1), (-1, -1), 'CENTER'),
+                ('TOPPADDING', (0, -1), (-1, -1), 8),
+                ('BOTTOMPADDING', (0, -1), (-1, -1), 8),
+                
+                # Grid lines - subtle light blue
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0F2FE')),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]
+            
+            table.setStyle(TableStyle(style_list))
+            elements.append(table)
+            elements.append(Spacer(1, 0.25*inch))
+        
+        # Beautiful footer with separator
+        elements.append(Spacer(1, 0.2*inch))
+        total_amount = sum(o['totalPrice'] for o in sorted_orders)
+        
+        # Footer stats row
+        footer_data = [
+            [f'📊 Total Orders: {total}', f'💵 Total Revenue: ₹{total_amount:.2f}']
+        ]
+        footer_table = Table(footer_data, colWidths=[3.25*inch, 3.25*inch])
+        footer_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(PRIMARY_BLUE)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+            ('TOPPADDING', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor(PRIMARY_BLUE)),
+        ]))
+        elements.append(footer_table)
+        
+        # Brand footer
+        elements.append(Spacer(1, 0.15*inch))
+        brand_footer = Paragraph(
+            f"<font size=8 color='{PRIMARY_BLUE}'><b>🍽️ Canteen Management System</b> | Report generated {datetime.now().strftime('%I:%M %p')}</font>",
+            ParagraphStyle('BrandFooter', parent=styles['Normal'], alignment=1)
+        )
+        elements.append(brand_footer)
+    else:
+        # Beautiful "no orders" message
+        elements.append(Spacer(1, 0.5*inch))
+        no_orders_text = Paragraph(
+            f"<font size=18 color='{PRIMARY_MAGENTA}'><b>📭 No Orders Found</b></font><br/><br/>"
+            f"<font size=12 color='{DARK_TEXT}'>No orders are available for the selected period.</font><br/>"
+            f"<font size=10 color='#6B7280'><i>Please select a different time range or check back later.</i></font>",
+            ParagraphStyle('NoOrders', parent=styles['Normal'], alignment=1)
+        )
+        elements.append(no_orders_text)
+        elements.append(Spacer(1, 0.5*inch))
+    
+    # Build PDF
+    doc.build(elements)
+    return pdf_buffer.getvalue()
+
+
+# --- ORDER EXPORTS ---
+# Raw order data for accounting. Both formats are generators that yield the file
+# a chunk at a time, so an export holds EXPORT_CHUNK_ROWS rows in memory however
+# long the date range is. Orders are the app's typed order records.
+EXPORT_CHUNK_ROWS = 500
+ORDER_EXPORT_COLUMNS = ['Order ID', 'Timestamp', 'User ID', 'Name', 'Class', 'Items', 'Total Price', 'Status', 'Pickup Slot']
+
+# XML 1.0 can't carry most control characters, which a pasted name may contain
+_XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Spreadsheet apps run CSV text starting with these as a formula
+_CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def order_export_row(order):
+    """One order as export values - items in full, in the Orders sheet's "Chai x 2" form."""
+    return [
+        order['orderId'],
+        order['timestamp'],
+        order['userId'],
+        order['userName'],
+        order['userClass'],
+        ', '.join(f"{i['name']} x {i['quantity']}" for i in order['items']),
+        order['totalPrice'],
+        order['status'].capitalize(),
+        order['pickupSlot'],
+    ]
+
+
+def _csv_cell(value):
+    """Quotes text that a spreadsheet would read as a formula - names and items are student-entered."""
+    if isinstance(value, str) and value.startswith(_CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_orders_csv(orders):
+    """Yields an orders CSV export in chunks of EXPORT_CHUNK_ROWS rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    for count, order in enumerate(orders, 1):
+        writer.writerow([_csv_cell(value) for value in order_export_row(order)])
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file for zipfile that hands back whatever was written since the last drain.
+
+    It has no tell()/seek(), so zipfile streams: each entry's sizes go in a data
+    descriptor after its data instead of being patched into the header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Orders" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)):
+            # Excel rejects nan/inf values, so leave those cells empty
+            cells.append(f'<c t="n"><v>{value}</v></c>' if math.isfinite(value) else '<c/>')
+        else:
+            text = escape(_XML_ILLEGAL_CHARS.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def iter_orders_xlsx(orders):
+    """Yields an orders XLSX export (one "Orders" sheet, inline strings) as it is compressed."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, xml in _XLSX_STATIC_PARTS.items():
+            workbook.writestr(name, xml)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(ORDER_EXPORT_COLUMNS).encode())
+            rows = []
+            for order in orders:
+                rows.append(_xlsx_row(order_export_row(order)))
+                if len(rows) == EXPORT_CHUNK_ROWS:
+                    sheet.write(''.join(rows).encode())
+                    rows.clear()
+                    data = sink.drain()
+                    if data:  # deflate may still be holding this chunk back
+                        yield data
+            sheet.write(''.join(rows).encode())
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
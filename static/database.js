@@ -43,6 +43,23 @@ window.CanteenDB = {
         }
     },
 
+    // Get today's pickup slots and their remaining places
+    async getPickupSlots() {
+        try {
+            const response = await fetch('/api/pickup_slots', {
+                method: 'GET',
+                credentials: 'include'
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error('Error fetching pickup slots:', error);
+            return null;
+        }
+    },
+
     // Get all orders (staff only)
     async getOrders() {
         try {
@@ -89,6 +106,19 @@ window.CanteenDB = {
         }
     },
 
+    // Get order counts plus one page of orders in a status (staff only)
+    async getOrdersSummary(status = 'pending', page = 1, pageSize = 50) {
+        const params = new URLSearchParams({ status, page, pageSize });
+        const response = await fetch(`/api/orders/summary?${params}`, {
+            method: 'GET',
+            credentials: 'include'
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return await response.json();
+    },
+
     // Update order status (staff only)
     async updateOrderStatus(orderId, status) {
         try {
@@ -137,6 +167,78 @@ window.CanteenDB = {
         }
     },
 
+    // Update menu item nutrition values (staff only)
+    async updateMenuNutrition(itemId, nutrition) {
+        try {
+            const response = await fetch('/api/menu/update', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ itemId, ...nutrition })
+            });
+
+            if (!response.ok) {
+                const errorData = await response.json();
+                console.error('Menu nutrition update failed:', errorData);
+                throw new Error(errorData.error || 'Failed to update nutrition');
+            }
+
+            const result = await response.json();
+            return result.status === 'success';
+        } catch (error) {
+            console.error('Error updating menu nutrition:', error);
+            return false;
+        }
+    },
+
+    // Get pending quantity per menu item for the kitchen (staff only)
+    async getPrepList() {
+        try {
+            const response = await fetch('/api/kitchen/prep_list', {
+                method: 'GET',
+                credentials: 'include'
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error('Error fetching prep list:', error);
+            return null;
+        }
+    },
+
+    // Start (or find) an orders report job (staff/teacher only)
+    async createReportJob(period, startDate = '', endDate = '') {
+        const response = await fetch('/api/reports', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            credentials: 'include',
+            body: JSON.stringify({ period, startDate, endDate })
+        });
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || `HTTP error! status: ${response.status}`);
+        }
+        return job;
+    },
+
+    // Poll an orders report job (staff/teacher only)
+    async getReportJob(jobId) {
+        const response = await fetch(`/api/reports/${jobId}`, {
+            method: 'GET',
+            credentials: 'include'
+        });
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || `HTTP error! status: ${response.status}`);
+        }
+        return job;
+    },
+
     // Clear session (logout)
     clearSession() {
         sessionStorage.removeItem('currentUser');
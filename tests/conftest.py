@@ -0,0 +1,82 @@
+"""Shared fixtures: the Flask app wired to in-memory worksheets instead of Google Sheets."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as canteen_app  # noqa: E402
+
+
+class FakeWorksheet:
+    """The slice of gspread.Worksheet the app uses, backed by a list of rows."""
+
+    def __init__(self, title, rows):
+        self.title = title
+        self.rows = [[str(value) for value in row] for row in rows]
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self.rows), default=0)
+
+    def get_all_values(self, *args, **kwargs):
+        return [list(row) for row in self.rows]
+
+    def col_values(self, col):
+        return [row[col - 1] if len(row) >= col else '' for row in self.rows]
+
+    def update_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = str(value)
+
+    def add_cols(self, count):
+        pass
+
+    def append_rows(self, rows, **kwargs):
+        first = len(self.rows) + 1
+        self.rows.extend([str(value) for value in row] for row in rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{first}:Z{len(self.rows)}"}}
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row])
+
+
+ORDER_HEADERS = ['orderId', 'timestamp', 'userId', 'userName', 'userClass', 'items', 'totalPrice', 'status']
+
+
+@pytest.fixture
+def sheets(tmp_path, monkeypatch):
+    """Gives the app fresh Orders/Students/DailySummary worksheets and private state directories."""
+    monkeypatch.setattr(canteen_app, 'DATA_VERSION_DIR', str(tmp_path / 'versions'))
+    monkeypatch.setattr(canteen_app, 'PICKUP_SLOT_DIR', str(tmp_path / 'slots'))
+    monkeypatch.setattr(canteen_app, 'ORDER_JOURNAL_DIR', str(tmp_path / 'journal'))
+    monkeypatch.setattr(canteen_app, 'ORDER_ID_SEQUENCE_PATH', str(tmp_path / 'journal' / 'order_id_sequence'))
+    monkeypatch.setattr(canteen_app, 'REPORT_CACHE_DIR', str(tmp_path / 'reports'))
+    os.makedirs(canteen_app.DATA_VERSION_DIR)
+    # Background threads would race the tests; tests drive these jobs directly
+    for pid_name in ('_order_flusher_pid', '_daily_rollup_pid', '_report_prerender_pid'):
+        monkeypatch.setattr(canteen_app, pid_name, os.getpid())
+    canteen_app._sheet_cache.clear()
+
+    worksheets = {
+        'orders_sheet': FakeWorksheet('Orders', [ORDER_HEADERS]),
+        'student_sheet': FakeWorksheet('Students', [['admissionId', 'userId', 'name', 'password', 'email', 'className']]),
+        'daily_summary_sheet': FakeWorksheet('DailySummary', [canteen_app.DAILY_SUMMARY_HEADERS]),
+    }
+    for name, worksheet in worksheets.items():
+        monkeypatch.setattr(canteen_app, name, worksheet)
+    return worksheets
+
+
+@pytest.fixture
+def staff_client():
+    client = canteen_app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['user_id'] = 'staff@example.com'
+        session['user_type'] = 'staff'
+    return client
@@ -0,0 +1,65 @@
+import pytest
+
+import app as canteen_app
+from conftest import FakeWorksheet
+
+
+@pytest.fixture(autouse=True)
+def fresh_login_state(monkeypatch):
+    monkeypatch.setattr(canteen_app, '_login_failures', {})
+    monkeypatch.setattr(canteen_app, '_unknown_login_ids', {})
+
+
+def test_sheets_outage_is_503_and_not_a_failed_login(sheets):
+    students = sheets['student_sheet']
+    students.rows.append(['18/20', '1', 'Asha', canteen_app.hash_password('pw1'), 'a@x', '10A'])
+
+    def sheets_down(*args, **kwargs):
+        raise ConnectionError('Sheets unavailable')
+
+    students.get_all_values = sheets_down
+    client = canteen_app.app.test_client()
+
+    response = client.post('/student_login', json={'userId': '1', 'password': 'pw1'})
+
+    assert response.status_code == 503
+    assert canteen_app._login_failures == {}
+    assert canteen_app._unknown_login_ids == {}
+
+
+def test_wrong_passwords_on_a_real_id_do_not_throttle_the_ip(sheets, monkeypatch):
+    monkeypatch.setattr(canteen_app, 'LOGIN_MAX_FAILURES_PER_IP', 2)
+    students = sheets['student_sheet']
+    for user_id in ('1', '2', '3'):
+        students.rows.append([f'18/{user_id}', user_id, 'Asha', canteen_app.hash_password('pw'), 'a@x', '10A'])
+    client = canteen_app.app.test_client()
+
+    for user_id in ('1', '2', '3'):
+        response = client.post('/student_login', json={'userId': user_id, 'password': 'typo'})
+        assert response.status_code == 401
+
+    for unknown_id in ('98', '99'):
+        client.post('/student_login', json={'userId': unknown_id, 'password': 'guess'})
+    assert client.post('/student_login', json={'userId': '3', 'password': 'pw'}).status_code == 429
+
+
+def test_plaintext_passwords_only_accepted_for_staff(sheets, monkeypatch):
+    sheets['student_sheet'].rows.append(['18/20', '1', 'Asha', 'pw1', 'a@x', '10A'])
+    monkeypatch.setattr(canteen_app, 'staff_sheet', FakeWorksheet('Staff', [['staffId', 'password', 'name'], ['cook@slps.one', 'pw2', 'Cook']]))
+
+    assert not canteen_app.verify_credentials('student', '1', 'pw1')
+    assert canteen_app.verify_credentials('staff', 'cook@slps.one', 'pw2')
+
+
+def test_credential_upgrade_writes_to_sheets_without_holding_a_slot(sheets, monkeypatch):
+    students = sheets['student_sheet']
+    students.rows.append(['18/20', '1', 'Asha', canteen_app.generate_password_hash('pw1', method='pbkdf2:sha256:1000'), 'a@x', '10A'])
+    free_slots_during_write = []
+
+    def update_cell(row, col, value):
+        free_slots_during_write.append(canteen_app._credential_slots._value)
+
+    monkeypatch.setattr(students, 'update_cell', update_cell)
+
+    assert canteen_app.verify_credentials('student', '1', 'pw1')
+    assert free_slots_during_write == [canteen_app.CREDENTIAL_VERIFY_SLOTS]
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.mark.parametrize('calories', ['nan', 'inf', '-inf', '-5'])
+def test_menu_update_rejects_non_finite_and_negative_nutrition(sheets, staff_client, calories):
+    response = staff_client.post('/api/menu/update', json={'itemId': 'item1', 'calories': calories})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'calories must be a non-negative number'
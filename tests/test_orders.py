@@ -0,0 +1,71 @@
+import app as canteen_app
+
+
+def test_status_update_leaves_pickup_slot_and_epoch_alone(sheets, staff_client):
+    orders = sheets['orders_sheet']
+    orders.rows = [
+        ['orderId', 'timestamp', 'userId', 'userName', 'userClass', 'items', 'totalPrice', 'status', 'epoch', 'pickupSlot'],
+        ['1', '2026-10-19 09:00:00', '1', 'Asha', '10A', 'Chai x 1', '30', 'Pending', '1792386000', '12:30'],
+        ['2', '2026-10-19 09:05:00', '2', 'Ravi', '10B', 'Chai x 2', '60', 'Pending', '1792386300', '12:45'],
+    ]
+
+    response = staff_client.post('/api/orders/update_status', json={'orderId': '2', 'status': 'delivered'})
+
+    assert response.status_code == 200
+    assert orders.rows[2] == ['2', '2026-10-19 09:05:00', '2', 'Ravi', '10B', 'Chai x 2', '60', 'Delivered', '1792386300', '12:45']
+    assert orders.rows[1][7:] == ['Pending', '1792386000', '12:30']
+    summary = canteen_app.get_order_status_summary('delivered')
+    assert summary['counts']['pending'] == 1
+    assert summary['counts']['delivered'] == 1
+
+
+def test_status_update_without_status_column_fails(sheets, staff_client):
+    orders = sheets['orders_sheet']
+    orders.rows = [['orderId', 'timestamp', 'pickupSlot'], ['1', '2026-10-19 09:00:00', '12:30']]
+
+    response = staff_client.post('/api/orders/update_status', json={'orderId': '1', 'status': 'delivered'})
+
+    assert response.status_code == 500
+    assert orders.rows[1] == ['1', '2026-10-19 09:00:00', '12:30']
+
+
+def test_journal_retry_after_landed_append_does_not_duplicate(sheets, monkeypatch):
+    orders = sheets['orders_sheet']
+    awarded = []
+    monkeypatch.setattr(canteen_app, 'award_health_points', lambda user_id, points: awarded.append((user_id, points)))
+    canteen_app.get_sheet_rows('orders')  # snapshot taken before the flush
+
+    real_append = orders.append_rows
+
+    def append_then_time_out(rows, **kwargs):
+        real_append(rows, **kwargs)
+        raise TimeoutError('response lost')
+
+    monkeypatch.setattr(orders, 'append_rows', append_then_time_out)
+    for order_id, user_id in (('1', '7'), ('2', '8')):
+        row = [order_id, '2026-10-19 09:00:00', user_id, 'Asha', '10A', 'Chai x 1', '30', 'Pending']
+        canteen_app.journal_order(order_id, user_id, row, 5)
+
+    try:
+        canteen_app.flush_order_journal()
+    except TimeoutError:
+        pass
+    monkeypatch.setattr(orders, 'append_rows', real_append)
+    canteen_app.flush_order_journal()
+    canteen_app.flush_order_journal()
+
+    assert [row[0] for row in orders.rows[1:]] == ['1', '2']
+    assert awarded == [('7', 5), ('8', 5)]
+
+
+def test_write_through_after_an_unseen_append_rereads_the_sheet(sheets):
+    orders = sheets['orders_sheet']
+    rows = canteen_app.get_sheet_rows('orders')
+    # Another worker appends order 1 after our read; ours lands below it
+    orders.rows.append(['1', '2026-10-19 09:00:00', '2', 'Ravi', '10B', 'Chai x 1', '30', 'Pending'])
+    ours = ['2', '2026-10-19 09:01:00', '1', 'Asha', '10A', 'Chai x 1', '30', 'Pending']
+    orders.rows.append(ours)
+
+    canteen_app.cache_written_row('orders', rows, 3, ours, canteen_app.bump_data_version('orders'))
+
+    assert [row[0] for row in canteen_app.get_sheet_rows('orders')[1:]] == ['1', '2']
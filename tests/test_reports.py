@@ -0,0 +1,59 @@
+import csv
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+import app as canteen_app
+from reports import iter_orders_csv, iter_orders_xlsx, report_totals
+
+
+def test_rollup_and_detail_reports_count_statuses_alike(sheets):
+    day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    orders = sheets['orders_sheet']
+    for order_id, status, price in [('1', 'Pending', '30'), ('2', 'Delivered', '60'), ('3', 'Unable', '45'),
+                                    ('4', 'undeliverable', '20'), ('5', '', '10')]:
+        orders.rows.append([order_id, f'{day} 12:0{order_id}:00', '1', 'Asha', '10A', 'Chai x 1', price, status])
+    canteen_app.run_daily_rollup()
+
+    rollup = canteen_app.load_orders_report_data('custom', day, day)
+    detail = canteen_app.load_orders_report_data('custom', day, day, detail=True)
+
+    assert rollup['useRollups'] and not detail['useRollups']
+    assert report_totals(rollup) == report_totals(detail) == {
+        'orders': 5, 'pending': 2, 'delivered': 1, 'undeliverable': 2, 'revenue': 165.0,
+    }
+
+
+def _export_order(**fields):
+    order = {'orderId': '1', 'timestamp': '2026-10-19 09:00:00', 'userId': '1', 'userName': 'Asha', 'userClass': '10A',
+             'items': [{'name': 'Chai', 'quantity': 1}], 'totalPrice': 30.0, 'status': 'pending', 'pickupSlot': ''}
+    return dict(order, **fields)
+
+
+def test_csv_export_neutralises_formulas():
+    order = _export_order(userName='=HYPERLINK("http://x")', userClass='@SUM(A1)', items=[{'name': '-1+2', 'quantity': 1}])
+
+    rows = list(csv.reader(io.StringIO(''.join(iter_orders_csv([order])))))
+
+    assert rows[1][3:6] == ['\'=HYPERLINK("http://x")', "'@SUM(A1)", "'-1+2 x 1"]
+    assert rows[1][6] == '30.0'
+
+
+def test_xlsx_export_leaves_non_finite_numbers_empty():
+    workbook = zipfile.ZipFile(io.BytesIO(b''.join(iter_orders_xlsx([_export_order(totalPrice=float('nan'))]))))
+    sheet = workbook.read('xl/worksheets/sheet1.xml')
+
+    assert b'nan' not in sheet and b'<c/>' in sheet
+
+
+def test_daily_rollup_leaves_unchanged_days_alone(sheets):
+    day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    sheets['orders_sheet'].rows.append(['1', f'{day} 12:00:00', '1', 'Asha', '10A', 'Chai x 4', '120', 'Delivered'])
+    assert canteen_app.run_daily_rollup() == 1
+
+    # The sheet hands whole rupees back without the decimal
+    summary_row = sheets['daily_summary_sheet'].rows[1]
+    summary_row[2] = '120'
+    canteen_app.bump_data_version('dailysummary')
+
+    assert canteen_app.run_daily_rollup() == 0